@@ -0,0 +1 @@
+'''Benchmarks for the gcode generation pipeline, run with: python -m benchmarks'''
@@ -0,0 +1,58 @@
+'''Run the generation benchmarks:
+    python -m benchmarks [-w WORKLOAD ...] [--scale S] [--repeat N] [-o results.json] [-b baseline.json]
+    python -m benchmarks --micro [-o micro.json] [-b micro_baseline.json]
+Exits with status 1 when a baseline is given and any stage regressed beyond the tolerance.
+'''
+import argparse
+import sys
+from . import micro
+from . import runner
+from .workloads import WORKLOADS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='gcode_gen generation benchmarks')
+    parser.add_argument('-w', '--workload', action='append', choices=sorted(WORKLOADS),
+                        help='workload to run, may be repeated (default: all)')
+    parser.add_argument('--scale', type=float, default=1.0, help='workload size factor (default: 1.0)')
+    parser.add_argument('--repeat', type=int, default=3, help='timing runs per workload, the best is kept (default: 3)')
+    parser.add_argument('-o', '--output', help='save results as json to this file')
+    parser.add_argument('-b', '--baseline', help='compare against results json saved by an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='allowed slowdown/growth ratio over the baseline (default: 0.1)')
+    parser.add_argument('--micro', action='store_true',
+                        help='run the object construction/equality micro benchmarks instead of the workloads')
+    args = parser.parse_args(argv)
+    if args.micro:
+        return main_micro(args)
+    names = args.workload if args.workload else list(WORKLOADS)
+    report = runner.run([(name, WORKLOADS[name]) for name in names], scale=args.scale, repeat=args.repeat,
+                        progress=lambda name: print('running {} ...'.format(name), file=sys.stderr))
+    print(runner.format_report(report))
+    if args.output:
+        runner.save(report, args.output)
+    if args.baseline:
+        rows = runner.compare(report, runner.load(args.baseline), args.tolerance)
+        print()
+        print(runner.format_comparison(rows))
+        if any(row[-1] for row in rows):
+            return 1
+    return 0
+
+
+def main_micro(args):
+    report = micro.run(repeat=args.repeat)
+    print(micro.format_report(report))
+    if args.output:
+        runner.save(report, args.output)
+    if args.baseline:
+        rows = micro.compare(report, runner.load(args.baseline), args.tolerance)
+        print()
+        print(micro.format_comparison(rows))
+        if any(row[-1] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
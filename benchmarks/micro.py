@@ -0,0 +1,143 @@
+'''Micro benchmarks for the small objects created once or more per move:
+construction and equality time, and bytes per object kept.
+'''
+import gc
+import platform
+import time
+import timeit
+import tracemalloc
+import numpy as np
+from gcode_gen import action
+from gcode_gen import gcode
+from gcode_gen import point as pt
+from gcode_gen.state import CncState
+
+MICRO = {}
+
+
+def micro(func):
+    '''register a micro benchmark, func() returns the zero argument callable to time'''
+    MICRO[func.__name__] = func
+    return func
+
+
+@micro
+def point_new():
+    return lambda: pt.Point(1.5, 2.5, -3.0)
+
+
+@micro
+def point_eq():
+    point0 = pt.Point(1.5, 2.5, -3.0)
+    point1 = pt.Point(1.5, 2.5, -3.0)
+    return lambda: point0 == point1
+
+
+@micro
+def point_changes():
+    point0 = pt.Point(1.5, 2.5, -3.0)
+    point1 = pt.Point(1.5, 4.5, -3.0)
+    return lambda: pt.changes(point0, point1)
+
+
+@micro
+def gcode_point_new():
+    return lambda: gcode.GcodePoint(1.5, None, -3.0)
+
+
+@micro
+def g1_new():
+    return lambda: gcode.G1(x=1.5, z=-3.0)
+
+
+@micro
+def g2_new():
+    return lambda: gcode.G2(x=1.5, y=2.5, r=4.0)
+
+
+@micro
+def cut_new():
+    state = CncState()
+    points = (pt.Point(1.5, 2.5, -3.0), pt.Point(1.5, 4.5, -3.0))
+    index = [0]
+
+    def new_cut():
+        index[0] ^= 1
+        return action.Cut(*points[index[0]].coords, state=state)
+    return new_cut
+
+
+def time_call(func, number, repeat):
+    '''best seconds per call'''
+    gc.collect()
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def bytes_per_result(func, count):
+    '''traced bytes kept per result when count results are kept alive'''
+    results = [None] * count
+    gc.collect()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        for index in range(count):
+            results[index] = func()
+        kept = tracemalloc.get_traced_memory()[0] - base
+    finally:
+        tracemalloc.stop()
+    return kept / count
+
+
+def run(names=None, number=20000, repeat=5):
+    '''run the named micro benchmarks (default: all), returns a json serializable report'''
+    if names is None:
+        names = list(MICRO)
+    results = {}
+    for name in names:
+        func = MICRO[name]()
+        results[name] = {'ns_per_call': time_call(func, number, repeat) * 1e9,
+                         'bytes_per_result': bytes_per_result(func, number),
+                         }
+    return {'meta': {'python': platform.python_version(),
+                     'numpy': np.__version__,
+                     'platform': platform.platform(),
+                     'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     'number': number,
+                     'repeat': repeat,
+                     },
+            'micro': results,
+            }
+
+
+def compare(report, baseline, tolerance=0.1):
+    '''like runner.compare for micro reports.
+    Returns a list of (name, metric, baseline_value, value, ratio, is_regression).'''
+    rows = []
+    for name, result in report['micro'].items():
+        base_result = baseline.get('micro', {}).get(name)
+        if base_result is None:
+            continue
+        for metric in ('ns_per_call', 'bytes_per_result'):
+            base_value = base_result[metric]
+            value = result[metric]
+            ratio = value / base_value if base_value else None
+            is_regression = ratio is not None and ratio > 1 + tolerance
+            rows.append((name, metric, base_value, value, ratio, is_regression))
+    return rows
+
+
+def format_report(report):
+    lines = ['{:<20} {:>12} {:>16}'.format('benchmark', 'ns/call', 'bytes/result')]
+    for name, result in report['micro'].items():
+        lines.append('{:<20} {:>12.0f} {:>16.1f}'.format(name, result['ns_per_call'], result['bytes_per_result']))
+    return '\n'.join(lines)
+
+
+def format_comparison(rows):
+    lines = ['{:<20} {:<16} {:>12} {:>12} {:>8}'.format('benchmark', 'metric', 'baseline', 'current', 'ratio')]
+    for name, metric, base_value, value, ratio, is_regression in rows:
+        lines.append('{:<20} {:<16} {:>12.4g} {:>12.4g} {:>8}{}'.format(
+            name, metric, base_value, value,
+            '-' if ratio is None else '{:.2f}'.format(ratio),
+            '  REGRESSION' if is_regression else ''))
+    return '\n'.join(lines)
@@ -0,0 +1,180 @@
+'''Stage timing, memory measurement and baseline comparison for the benchmark workloads.
+Stages per tool pass:
+    walk    - tree walk with update_children_* only, no actions are generated
+    actions - get_actions into an ArrayActionList (includes its own tree walk)
+    format  - rendering the actions to gcode lines
+    write   - writing the lines to a file
+'''
+import gc
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from gcode_gen import action
+from gcode_gen import assembly
+from gcode_gen import tree
+
+STAGES = ('walk', 'actions', 'format', 'write')
+
+
+def walk(tool_pass):
+    '''walk the tree structure without generating actions, so the actions stage that follows
+    still starts cold.  Returns the number of nodes visited.
+    The children added while walking do not mark nodes dirty, like in a real walk.'''
+    count = 0
+    with tool_pass.state.excursion(), assembly.untracked_updates():
+        for kind, node in tool_pass.walk():
+            if kind == tree.PREORDER:
+                node.update_children_preorder()
+                count += 1
+            elif kind == tree.POSTORDER:
+                node.update_children_postorder()
+    return count
+
+
+def count_moves(al):
+    return int(np.count_nonzero(al.opcodes != action.OP_STATE))
+
+
+def run_tool_pass(tool_pass, dirname, stage_func):
+    '''run every stage on tool_pass, stage_func(stage, func) runs and measures one stage.
+    Returns the number of moves in the pass.'''
+    stage_func('walk', lambda: walk(tool_pass))
+    al = stage_func('actions', lambda: tool_pass.get_actions(action.ArrayActionList))
+    lines = stage_func('format', al.get_gcode_lines)
+
+    def write():
+        with open(os.path.join(dirname, os.path.basename(tool_pass.filename)), 'w') as file_handle:
+            file_handle.write('\n'.join(lines) + '\n')
+    stage_func('write', write)
+    return count_moves(al)
+
+
+def time_run(build, scale, dirname):
+    '''returns ({stage: seconds}, moves) for one run'''
+    seconds = dict.fromkeys(STAGES, 0.0)
+
+    def stage_func(stage, func):
+        start = time.perf_counter()
+        result = func()
+        seconds[stage] += time.perf_counter() - start
+        return result
+    prj = build(scale)
+    moves = sum(run_tool_pass(tool_pass, dirname, stage_func) for tool_pass in prj.children)
+    return seconds, moves
+
+
+def memory_run(build, scale, dirname):
+    '''returns {stage: peak traced bytes} for one run, run separately from timing as tracing is slow'''
+    peaks = dict.fromkeys(STAGES, 0)
+
+    def stage_func(stage, func):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        result = func()
+        peaks[stage] = max(peaks[stage], tracemalloc.get_traced_memory()[1] - base)
+        return result
+    prj = build(scale)
+    tracemalloc.start()
+    try:
+        for tool_pass in prj.children:
+            run_tool_pass(tool_pass, dirname, stage_func)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def run_workload(build, scale=1.0, repeat=3):
+    '''best of repeat timing runs plus one memory run.
+    Returns {'moves': int, 'stages': {stage: {'seconds', 'peak_bytes', 'moves_per_second'}}}'''
+    best = dict.fromkeys(STAGES, float('inf'))
+    with tempfile.TemporaryDirectory() as dirname:
+        for _ in range(repeat):
+            gc.collect()
+            seconds, moves = time_run(build, scale, dirname)
+            for stage in STAGES:
+                best[stage] = min(best[stage], seconds[stage])
+        gc.collect()
+        peaks = memory_run(build, scale, dirname)
+    stages = {}
+    for stage in STAGES:
+        stages[stage] = {'seconds': best[stage],
+                         'peak_bytes': peaks[stage],
+                         'moves_per_second': moves / best[stage] if best[stage] > 0 else None,
+                         }
+    return {'moves': moves, 'stages': stages}
+
+
+def run(workloads, scale=1.0, repeat=3, progress=None):
+    '''run each (name, build) in workloads, returns a json serializable report'''
+    results = {}
+    for name, build in workloads:
+        if progress is not None:
+            progress(name)
+        results[name] = run_workload(build, scale, repeat)
+    return {'meta': {'python': platform.python_version(),
+                     'numpy': np.__version__,
+                     'platform': platform.platform(),
+                     'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     'scale': scale,
+                     'repeat': repeat,
+                     },
+            'results': results,
+            }
+
+
+def save(report, path):
+    with open(path, 'w') as file_handle:
+        json.dump(report, file_handle, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as file_handle:
+        return json.load(file_handle)
+
+
+def compare(report, baseline, tolerance=0.1):
+    '''compare report against baseline.
+    Returns a list of (workload, stage, metric, baseline_value, value, ratio, is_regression)
+    for the workloads and stages found in both.
+    A time or peak memory ratio over 1 + tolerance is a regression.'''
+    rows = []
+    for name, result in report['results'].items():
+        base_result = baseline['results'].get(name)
+        if base_result is None:
+            continue
+        for stage in STAGES:
+            if stage not in result['stages'] or stage not in base_result['stages']:
+                continue
+            for metric in ('seconds', 'peak_bytes'):
+                base_value = base_result['stages'][stage][metric]
+                value = result['stages'][stage][metric]
+                ratio = value / base_value if base_value else None
+                is_regression = ratio is not None and ratio > 1 + tolerance
+                rows.append((name, stage, metric, base_value, value, ratio, is_regression))
+    return rows
+
+
+def format_report(report):
+    lines = ['{:<20} {:<8} {:>10} {:>12} {:>14}'.format('workload', 'stage', 'seconds', 'peak MiB', 'moves/s')]
+    for name, result in report['results'].items():
+        for stage in STAGES:
+            stage_result = result['stages'][stage]
+            moves_per_second = stage_result['moves_per_second']
+            lines.append('{:<20} {:<8} {:>10.4f} {:>12.2f} {:>14}'.format(
+                name, stage, stage_result['seconds'], stage_result['peak_bytes'] / 2**20,
+                '-' if moves_per_second is None else '{:.0f}'.format(moves_per_second)))
+    return '\n'.join(lines)
+
+
+def format_comparison(rows):
+    lines = ['{:<20} {:<8} {:<10} {:>12} {:>12} {:>8}'.format('workload', 'stage', 'metric', 'baseline', 'current', 'ratio')]
+    for name, stage, metric, base_value, value, ratio, is_regression in rows:
+        lines.append('{:<20} {:<8} {:<10} {:>12.4g} {:>12.4g} {:>8}{}'.format(
+            name, stage, metric, base_value, value,
+            '-' if ratio is None else '{:.2f}'.format(ratio),
+            '  REGRESSION' if is_regression else ''))
+    return '\n'.join(lines)
@@ -0,0 +1,120 @@
+'''Representative generation workloads.
+Each workload builds a fresh Project; scale=1.0 is the full size, smaller values give a quick run.
+'''
+import math
+from functools import partial
+import numpy as np
+from gcode_gen import project
+from gcode_gen import cut
+from gcode_gen import arena
+from gcode_gen import assembly
+from gcode_gen import repeat
+from gcode_gen.tool import Carbide3D_101, Carbide3D_102
+
+WORKLOADS = {}
+
+
+def workload(func):
+    '''register a workload function under its name'''
+    WORKLOADS[func.__name__] = func
+    return func
+
+
+def new_project(name, tools):
+    prj = project.Project(name=name)
+    prj.state['z_safe'] = 40
+    prj.state['milling_feed_rate'] = 500
+    prj.state['drilling_feed_rate'] = 100
+    for tool in tools:
+        prj += tool
+    return prj
+
+
+def grid_side(count, scale):
+    '''number of items per side for a square grid of about count * scale items'''
+    return max(1, int(round(math.sqrt(count * scale))))
+
+
+@workload
+def drill_grid(scale=1.0):
+    '''10k holes on a 2.54mm grid, 3 drilling passes each'''
+    prj = new_project('drill_grid', (Carbide3D_101(), ))
+    tool_pass = prj.last()
+    side = grid_side(10000, scale)
+    for row in range(side):
+        for col in range(side):
+            tool_pass += cut.Drill(depth=3).translate(col * 2.54, row * 2.54)
+    return prj
+
+
+@workload
+def drill_grid_arena(scale=1.0):
+    '''drill_grid stored in an ArenaAssembly'''
+    prj = new_project('drill_grid_arena', (Carbide3D_101(), ))
+    panel = arena.ArenaAssembly(name='panel')
+    prj.last().append(panel)
+    side = grid_side(10000, scale)
+    matrices = np.tile(np.identity(4), (side * side, 1, 1))
+    matrices[:, 0, 3] = np.tile(np.arange(side) * 2.54, side)
+    matrices[:, 1, 3] = np.repeat(np.arange(side) * 2.54, side)
+    panel.add_many(partial(cut.Drill, depth=3), matrices)
+    return prj
+
+
+@workload
+def polygon_pockets(scale=1.0):
+    '''large filled pockets, one convex and one concave, cut in many passes'''
+    prj = new_project('polygon_pockets', (Carbide3D_101(), ))
+    prj.state['depth_per_milling_pass'] = 0.2
+    tool_pass = prj.last()
+    size = max(10, 200 * math.sqrt(scale))
+    tool_pass += cut.Polygon(vertices=((0, 0), (size, 0), (size, size), (0, size)),
+                             depth=6, cut_style='inside-cut', is_filled=True)
+    notched = ((0, 0), (size, 0), (size, size), (size / 2, size / 2), (0, size))
+    tool_pass += cut.Polygon(vertices=notched,
+                             depth=6, cut_style='inside-cut', is_filled=True).translate(x=size + 10)
+    return prj
+
+
+@workload
+def cylinder_array(scale=1.0):
+    '''grid of 1000 filled cylinders'''
+    prj = new_project('cylinder_array', (Carbide3D_101(), ))
+    tool_pass = prj.last()
+    side = grid_side(1000, scale)
+    for row in range(side):
+        for col in range(side):
+            tool_pass += cut.Cylinder(depth=2, diameter=6).translate(col * 10, row * 10)
+    return prj
+
+
+@workload
+def multi_tool_project(scale=1.0):
+    '''two tool passes mixing drills, outlines and pockets'''
+    prj = new_project('multi_tool_project', (Carbide3D_101(), Carbide3D_102()))
+    side = grid_side(1000, scale)
+    for tool_pass in prj.children:
+        for row in range(side):
+            for col in range(side):
+                tool_pass += cut.Drill(depth=2).translate(col * 5, row * 5)
+        outline = ((0, 0), (side * 5, 0), (side * 5, side * 5), (0, side * 5))
+        tool_pass += cut.Polygon(vertices=outline, depth=3, cut_style='outside-cut', is_filled=False)
+        tool_pass += cut.Polygon(vertices=outline, depth=1, cut_style='inside-cut',
+                                 is_filled=True).translate(x=side * 5 + 10)
+    return prj
+
+
+@workload
+def panel_repeat(scale=1.0):
+    '''a board with drills, a pocket and an outline repeated 40 times on a panel'''
+    prj = new_project('panel_repeat', (Carbide3D_101(), ))
+    board = assembly.Assembly(name='board')
+    for index in range(25):
+        board += cut.Drill(depth=2).translate(2 + index * 2.54, 5)
+    board += cut.Polygon(vertices=((0, 0), (20, 0), (20, 15), (0, 15)),
+                         depth=1.5, cut_style='inside-cut', is_filled=True).translate(10, 10)
+    board += cut.Polygon(vertices=((0, 0), (70, 0), (70, 30), (0, 30)),
+                         depth=1.6, cut_style='outside-cut', is_filled=False)
+    copies = max(1, int(round(40 * scale)))
+    prj.last().append(repeat.Repeat(board, repeat.grid_placements(5, 8, 80, 40)[:copies]))
+    return prj
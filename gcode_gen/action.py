@@ -1,15 +1,31 @@
 '''Library for 'Actions' representing cnc position or state updates and lists of actions'''
 from collections import UserList
+import numpy as np
 from . import number
+from . import array_util
 from . import gcode as gc
 from . import point as pt
 
 
+# opcodes for ArrayActionList rows
+OP_STATE = 0  # anything other than a plain motion, kept as an object
+OP_JOG = 1
+OP_CUT = 2
+OP_ARC = 3  # a cut along an x/y arc, made by arc fitting, see arc_fit
+# ArrayActionList axis mask bits
+AXIS_BITS = (1, 2, 4)  # x, y, z changed
+POINT_BIT = 8  # row contributes a point to get_points()
+ARC_TOLERANCE = 0.002  # largest distance from an arc to the chords it is cut as, like GRBL's arc_tolerance
+
+
 class Action(object):
     '''Represents a single CNC position or state update
     CAUTION: Only update state during __init__
     CAUTION: Do not update state during get_gcode or get_point!
     '''
+    __slots__ = ('state', 'point', 'skip')
+    OPCODE = OP_STATE
+
     def __init__(self, state=None):
         super().__init__()
         self.state = state
@@ -23,6 +39,10 @@ class Action(object):
     def get_point(self):
         return (self.point, )
 
+    def replay(self, state):
+        '''return a new, equivalent action applied to state'''
+        raise NotImplementedError('define replay in subclass')
+
     def __iter__(self):
         yield self
 
@@ -32,6 +52,8 @@ class Action(object):
 
 class Motion(Action):
     '''x, y, and z are new ABSOLUTE points when not None'''
+    __slots__ = ('changes', )
+
     def __init__(self, x=None, y=None, z=None, state=None):
         super().__init__(state=state)
         last_point = self.point
@@ -41,19 +63,100 @@ class Motion(Action):
         if not self.changes:
             self.skip = True
 
+    def replay(self, state, point=None):
+        '''point optionally moves the replayed motion to a new point'''
+        if point is None:
+            point = self.point
+        return self.__class__(*point, state=state)
+
 
 class Jog(Motion):
+    __slots__ = ()
+    OPCODE = OP_JOG
+
     def get_gcode(self):
         return (gc.G0(**self.changes), )
 
 
 class Cut(Motion):
+    __slots__ = ()
+    OPCODE = OP_CUT
+
     def get_gcode(self):
         # print(self.changes)
         return (gc.G1(**self.changes), )
 
 
+def arc_gcode(changes, signed_radius):
+    '''G2 (negative signed_radius) or G3 gcode of an arc to changes'''
+    gcode_class = gc.G2 if signed_radius < 0 else gc.G3
+    return gcode_class(r=abs(signed_radius), **changes)
+
+
+def arc_str(point, signed_radius):
+    return "Arc {} {} {}".format(point, 'G2' if signed_radius < 0 else 'G3', number.num2str(abs(signed_radius)))
+
+
+class MotionBlock(Action):
+    '''Successive Jog or Cut motions to the rows of an (N, 3) array of ABSOLUTE points, as one action.
+    Changes are detected for the whole block at once (see point.block_changes), no per-move
+    objects are made unless get_gcode() or get_point() is called.
+    Moves that change no axis are redundant: they are left out, like skipped motions, and the
+    block is skipped when all of its moves are.
+    point is the last point of the block.'''
+    __slots__ = ('motion_class', 'xyz', 'emit', 'redundant')
+
+    def __init__(self, xyz, motion_class=None, state=None):
+        super().__init__(state=state)
+        if motion_class is None:
+            motion_class = Cut
+        self.motion_class = motion_class
+        self.xyz = np.array(xyz, dtype=np.float64).reshape(-1, 3)
+        self.xyz.setflags(write=False)
+        self.emit, self.redundant = pt.block_changes(self.point.coords, self.xyz)
+        if len(self.xyz) > 0:
+            self.point = pt.Point(*self.xyz[-1])
+            state['position'] = self.point
+        self.skip = bool(np.all(self.redundant))
+
+    def __len__(self):
+        return len(self.xyz)
+
+    @property
+    def moves(self):
+        '''boolean mask of the moves that are not redundant'''
+        return ~self.redundant
+
+    def get_gcode(self):
+        gcode_class = MOTION_GCODES[self.motion_class.OPCODE]
+        moves = self.moves
+        return tuple(gcode_class(**{key: val for key, val, is_emitted in zip(('x', 'y', 'z'), xyz, emit)
+                                    if is_emitted})
+                     for xyz, emit in zip(self.xyz[moves].tolist(), self.emit[moves].tolist()))
+
+    def get_gcode_lines(self):
+        '''same as map(str, self.get_gcode()) in one vectorized pass'''
+        moves = self.moves
+        cmds = np.full(np.count_nonzero(moves), MOTION_CMDS[self.motion_class.OPCODE], dtype=object)
+        return gc.motion_lines(cmds, self.xyz[moves], self.emit[moves])
+
+    def get_point(self):
+        return tuple(pt.Point(*xyz) for xyz in self.xyz[self.moves].tolist())
+
+    def replay(self, state, xyz=None):
+        '''xyz optionally moves the replayed block to new points'''
+        if xyz is None:
+            xyz = self.xyz
+        return MotionBlock(xyz, self.motion_class, state=state)
+
+    def __str__(self):
+        name = self.motion_class.__name__
+        return '\n'.join('{} {}'.format(name, pt.Point(*xyz)) for xyz in self.xyz[self.moves].tolist())
+
+
 class StateChange(Action):
+    __slots__ = ('gc_tuple', )
+
     def get_gcode(self):
         return self.gc_tuple
 
@@ -62,6 +165,7 @@ class StateChange(Action):
 
 
 class GcodeWithoutArg(StateChange):
+    __slots__ = ()
     GC = None  # Define in subclass
 
     def __init__(self, state=None):
@@ -70,40 +174,53 @@ class GcodeWithoutArg(StateChange):
             raise NotImplementedError('must have GC gcode command class variable defined')
         self.gc_tuple = (self.GC(), )
 
+    def replay(self, state):
+        return self.__class__(state=state)
+
 
 class Home(GcodeWithoutArg):
+    __slots__ = ()
     GC = gc.Home
 
 
 class Comment(GcodeWithoutArg):
+    __slots__ = ()
     GC = gc.Comment
 
 
 class UnitsInches(GcodeWithoutArg):
+    __slots__ = ()
     GC = gc.UnitsInches
 
 
 class UnitsMillimeters(GcodeWithoutArg):
+    __slots__ = ()
     GC = gc.UnitsMillimeters
 
 
 class MotionAbsolute(GcodeWithoutArg):
+    __slots__ = ()
     GC = gc.MotionAbsolute
 
 
 class MotionRelative(GcodeWithoutArg):
+    __slots__ = ()
     GC = gc.MotionRelative
 
 
 class ActivateSpindleCW(GcodeWithoutArg):
+    __slots__ = ()
     GC = gc.ActivateSpindleCW
 
 
 class StopSpindle(GcodeWithoutArg):
+    __slots__ = ()
     GC = gc.StopSpindle
 
 
 class SetFeedRate(StateChange):
+    __slots__ = ('feed_rate', )
+
     def __init__(self, feed_rate, state=None):
         super().__init__(state=state)
         self.feed_rate = feed_rate
@@ -117,23 +234,38 @@ class SetFeedRate(StateChange):
             self.state['feed_rate'] = self.feed_rate
             self.gc_tuple = (gc.SetFeedRate(self.feed_rate), )
 
+    def replay(self, state):
+        return SetFeedRate(self.feed_rate, state=state)
+
     def __str__(self):
         return "{} {} {}".format(self.__class__.__name__, self.point, number.num2str(self.feed_rate))
 
 
 class SetDrillFeedRate(SetFeedRate):
+    __slots__ = ()
+
     def __init__(self, state=None):
         super().__init__(feed_rate=state['drilling_feed_rate'],
                          state=state)
 
+    def replay(self, state):
+        return SetDrillFeedRate(state=state)
+
 
 class SetMillFeedRate(SetFeedRate):
+    __slots__ = ()
+
     def __init__(self, state=None):
         super().__init__(feed_rate=state['milling_feed_rate'],
                          state=state)
 
+    def replay(self, state):
+        return SetMillFeedRate(state=state)
+
 
 class SetSpindleSpeed(StateChange):
+    __slots__ = ('spindle_speed', )
+
     def __init__(self, spindle_speed, state=None):
         super().__init__(state=state)
         self.spindle_speed = spindle_speed
@@ -144,6 +276,9 @@ class SetSpindleSpeed(StateChange):
             self.skip = True
             self.gc_tuple = ()
 
+    def replay(self, state):
+        return SetSpindleSpeed(self.spindle_speed, state=state)
+
     def __str__(self):
         return "{} {} {}".format(self.__class__.__name__, self.point, self.spindle_speed)
 
@@ -178,13 +313,318 @@ class ActionList(UserList):
 
     def get_points(self):
         pl = pt.PointList()
+        xyzs = []
         for elem in self:
+            if isinstance(elem, MotionBlock):
+                pl.extend(np.array(xyzs, dtype=np.float64).reshape(-1, 3))
+                pl.extend(elem.xyz[elem.moves])
+                xyzs = []
+                continue
             new_pt_tuple = elem.get_point()
             if len(new_pt_tuple) == 1:
-                pl.append(new_pt_tuple[0])  # compress points that are identical
+                xyzs.append(new_pt_tuple[0].coords)
             elif len(new_pt_tuple) > 1:
                 raise TypeError('get_point must return either an empty tuple or a tuple containing a single point')
+        pl.extend(np.array(xyzs, dtype=np.float64).reshape(-1, 3))
         return pl
 
     def __str__(self):
         return '\n'.join(map(str, self))
+
+
+MOTION_NAMES = {OP_JOG: 'Jog', OP_CUT: 'Cut'}
+MOTION_GCODES = {OP_JOG: gc.G0, OP_CUT: gc.G1}
+MOTION_CMDS = {opcode: gcode().cmd for opcode, gcode in MOTION_GCODES.items()}
+ARC_CMDS = ('G2', 'G3')  # clockwise, counterclockwise
+
+
+class ArrayMotion(Action):
+    '''Lazy Jog/Cut view of one motion row of an ArrayActionList.
+    The row already holds the resulting state, so there is no state reference.'''
+    __slots__ = ('action_list', 'index')
+
+    def __init__(self, action_list, index):
+        # NOTE: Action.__init__ is not called, it would read state
+        self.state = None
+        self.skip = False
+        self.action_list = action_list
+        self.index = index
+
+    @property
+    def OPCODE(self):
+        return int(self.action_list.opcodes[self.index])
+
+    @property
+    def point(self):
+        return pt.Point(*self.action_list.xyz[self.index])
+
+    @property
+    def signed_radius(self):
+        '''arc radius of an OP_ARC row, negative for a clockwise arc'''
+        return self.action_list.arc_radii[self.index]
+
+    @property
+    def changes(self):
+        mask = int(self.action_list.axis_masks[self.index])
+        xyz = self.action_list.xyz[self.index]
+        return {key: val for key, val, bit in zip(('x', 'y', 'z'), xyz, AXIS_BITS) if mask & bit}
+
+    def get_gcode(self):
+        if self.OPCODE == OP_ARC:
+            return (arc_gcode(self.changes, self.signed_radius), )
+        return (MOTION_GCODES[self.OPCODE](**self.changes), )
+
+    def __str__(self):
+        if self.OPCODE == OP_ARC:
+            return arc_str(self.point, self.signed_radius)
+        return "{} {}".format(MOTION_NAMES[self.OPCODE], self.point)
+
+
+class ArrayActionList(object):
+    '''Alternative to ActionList that stores one row per action in contiguous typed columns:
+      opcodes: OP_JOG, OP_CUT, OP_ARC or OP_STATE
+      xyz: position after the action
+      axis_masks: AXIS_BITS set for each axis a motion changes, plus POINT_BIT
+      feed_rates: feed rate in effect after the action (nan when not yet set)
+      spindle_speeds: spindle speed in effect after the action (nan when not yet set)
+      arc_radii: radius of OP_ARC rows, negative for a clockwise (G2) arc, nan for the others
+    Jog, Cut and arc rows are stored only as columns; indexing one returns a lazy ArrayMotion.
+    Any other action is rare, so it is kept as is alongside its row.
+    '''
+    def __init__(self, arg=None):
+        self.drop_skip = True
+        self._opcodes = array_util.GrowableArray(dtype=np.uint8)
+        self._xyz = array_util.GrowableArray((3, ))
+        self._axis_masks = array_util.GrowableArray(dtype=np.uint8)
+        self._feed_rates = array_util.GrowableArray()
+        self._spindle_speeds = array_util.GrowableArray()
+        self._arc_radii = array_util.GrowableArray()
+        self._objects = {}  # row index -> Action for OP_STATE rows
+        self._feed_rate = np.nan
+        self._spindle_speed = np.nan
+        if arg is not None:
+            self.extend(arg)
+
+    @classmethod
+    def from_columns(cls, opcodes, xyz, axis_masks, feed_rates, spindle_speeds, objects, arc_radii=None):
+        '''ArrayActionList of the given columns, objects maps the index of every OP_STATE row
+        to its Action.  arc_radii defaults to nan, for columns without arcs.'''
+        result = cls()
+        result._opcodes.extend(opcodes)
+        result._xyz.extend(xyz)
+        result._axis_masks.extend(axis_masks)
+        result._feed_rates.extend(feed_rates)
+        result._spindle_speeds.extend(spindle_speeds)
+        if arc_radii is None:
+            arc_radii = np.full(len(result), np.nan)
+        result._arc_radii.extend(arc_radii)
+        result._objects = dict(objects)
+        if len(result) > 0:
+            result._feed_rate = result.feed_rates[-1]
+            result._spindle_speed = result.spindle_speeds[-1]
+        return result
+
+    @property
+    def opcodes(self):
+        return self._opcodes.arr
+
+    @property
+    def xyz(self):
+        return self._xyz.arr
+
+    @property
+    def axis_masks(self):
+        return self._axis_masks.arr
+
+    @property
+    def feed_rates(self):
+        return self._feed_rates.arr
+
+    @property
+    def spindle_speeds(self):
+        return self._spindle_speeds.arr
+
+    @property
+    def arc_radii(self):
+        return self._arc_radii.arr
+
+    @property
+    def objects(self):
+        '''dict of row index -> Action for the OP_STATE rows'''
+        return self._objects
+
+    def __len__(self):
+        return len(self._opcodes)
+
+    def check_type(self, other):
+        if not isinstance(other, Action):
+            raise TypeError('expected Action type, got {}'.format(type(other)))
+
+    def append(self, arg):
+        self.check_type(arg)
+        if arg.skip and self.drop_skip:
+            return
+        if isinstance(arg, MotionBlock):
+            self._append_block(arg)
+            return
+        opcode = arg.OPCODE
+        arc_radius = np.nan
+        if opcode == OP_STATE:
+            mask = 0
+            if len(arg.get_point()) == 1:
+                mask |= POINT_BIT
+            if isinstance(arg, SetFeedRate) and not arg.skip:
+                self._feed_rate = arg.feed_rate
+            elif isinstance(arg, SetSpindleSpeed) and not arg.skip:
+                self._spindle_speed = arg.spindle_speed
+            self._objects[len(self)] = arg
+        else:
+            mask = POINT_BIT
+            for key, bit in zip(('x', 'y', 'z'), AXIS_BITS):
+                if key in arg.changes:
+                    mask |= bit
+            if opcode == OP_ARC:
+                arc_radius = arg.signed_radius
+        self._opcodes.append(opcode)
+        self._xyz.append(arg.point.coords)
+        self._axis_masks.append(mask)
+        self._feed_rates.append(self._feed_rate)
+        self._spindle_speeds.append(self._spindle_speed)
+        self._arc_radii.append(arc_radius)
+
+    def _append_block(self, block):
+        '''append the moves of a MotionBlock as motion rows, without per-move work'''
+        rows = block.moves if self.drop_skip else slice(None)
+        xyz = block.xyz[rows]
+        count = xyz.shape[0]
+        self._opcodes.extend(np.full(count, block.motion_class.OPCODE))
+        self._xyz.extend(xyz)
+        self._axis_masks.extend(np.dot(block.emit[rows], AXIS_BITS) | POINT_BIT)
+        self._feed_rates.extend(np.full(count, self._feed_rate))
+        self._spindle_speeds.extend(np.full(count, self._spindle_speed))
+        self._arc_radii.extend(np.full(count, np.nan))
+
+    def extend(self, arg):
+        if isinstance(arg, ArrayActionList):
+            self._extend_rows(arg)
+        else:
+            for elem in arg:
+                self.append(elem)
+
+    def _extend_rows(self, other):
+        offset = len(self)
+        self._opcodes.extend(other.opcodes)
+        self._xyz.extend(other.xyz)
+        self._axis_masks.extend(other.axis_masks)
+        self._feed_rates.extend(other.feed_rates)
+        self._spindle_speeds.extend(other.spindle_speeds)
+        self._arc_radii.extend(other.arc_radii)
+        for index, obj in other._objects.items():
+            self._objects[offset + index] = obj
+        if len(other) > 0:
+            self._feed_rate = other.feed_rates[-1]
+            self._spindle_speed = other.spindle_speeds[-1]
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            result = self.__class__()
+            result._extend_rows(self._take(index))
+            return result
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError('ArrayActionList index out of range')
+        if index in self._objects:
+            return self._objects[index]
+        return ArrayMotion(self, index)
+
+    def _take(self, index):
+        '''return a new ArrayActionList holding rows selected by slice index'''
+        result = self.__class__()
+        result._opcodes.extend(self.opcodes[index])
+        result._xyz.extend(self.xyz[index])
+        result._axis_masks.extend(self.axis_masks[index])
+        result._feed_rates.extend(self.feed_rates[index])
+        result._spindle_speeds.extend(self.spindle_speeds[index])
+        result._arc_radii.extend(self.arc_radii[index])
+        for new_index, old_index in enumerate(range(len(self))[index]):
+            if old_index in self._objects:
+                result._objects[new_index] = self._objects[old_index]
+        return result
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def get_gcode(self):
+        result = []
+        for index, (opcode, xyz, mask) in enumerate(zip(self.opcodes.tolist(),
+                                                        self.xyz.tolist(),
+                                                        self.axis_masks.tolist())):
+            if opcode == OP_STATE:
+                result.extend(self._objects[index].get_gcode())
+                continue
+            changes = {key: val for key, val, bit in zip(('x', 'y', 'z'), xyz, AXIS_BITS) if mask & bit}
+            if opcode == OP_ARC:
+                result.append(arc_gcode(changes, self.arc_radii[index]))
+            else:
+                result.append(MOTION_GCODES[opcode](**changes))
+        return result
+
+    def get_gcode_lines(self):
+        '''Same as map(str, self.get_gcode()), but motion rows are rendered in one vectorized
+        pass over the columns instead of one gcode object per move.'''
+        opcodes = self.opcodes
+        is_motion = opcodes != OP_STATE
+        cmds = np.where(opcodes[is_motion] == OP_JOG, MOTION_CMDS[OP_JOG], MOTION_CMDS[OP_CUT]).astype(object)
+        radii = self.arc_radii[is_motion]
+        is_arc = opcodes[is_motion] == OP_ARC
+        cmds[is_arc] = np.where(radii[is_arc] < 0, ARC_CMDS[0], ARC_CMDS[1])
+        emit = (self.axis_masks[is_motion, None] & np.asarray(AXIS_BITS)) != 0
+        motion_lines = gc.motion_lines(cmds, self.xyz[is_motion], emit, np.abs(radii))
+        if not self._objects:
+            return motion_lines
+        result = []
+        motion_pos = 0
+        next_row = 0
+        for index in sorted(self._objects):
+            count = index - next_row
+            result.extend(motion_lines[motion_pos:motion_pos + count])
+            motion_pos += count
+            result.extend(map(str, self._objects[index].get_gcode()))
+            next_row = index + 1
+        result.extend(motion_lines[motion_pos:])
+        return result
+
+    def get_points(self):
+        has_point = (self.axis_masks & POINT_BIT) != 0
+        return pt.PointList(self.xyz[has_point])
+
+    def linear_rows(self, start=None, tolerance=ARC_TOLERANCE):
+        '''every row as straight moves: (rows, xyz) with the index of each row, repeated once per
+        chord for arc rows, and where each of them ends.  Arcs are cut as chords within
+        tolerance of them (see point.arc_points()), like the machine does.
+        start is the position before the first row, by default where the first row is.'''
+        rows = np.arange(len(self))
+        xyz = self.xyz
+        arc_rows = np.flatnonzero(self.opcodes == OP_ARC)
+        if len(arc_rows) == 0:
+            return rows, xyz
+        if start is None:
+            start = xyz[0]
+        starts = np.concatenate((np.asarray(start, dtype=np.float64).reshape(1, 3), xyz[:-1]))
+        points, counts = pt.arc_points(starts[arc_rows], xyz[arc_rows], self.arc_radii[arc_rows], tolerance)
+        repeats = np.ones(len(self), dtype=np.int64)
+        repeats[arc_rows] = counts
+        rows = np.repeat(rows, repeats)
+        xyz = np.repeat(xyz, repeats, axis=0)
+        xyz[np.isin(rows, arc_rows)] = points
+        return rows, xyz
+
+    def __str__(self):
+        return '\n'.join(map(str, self))
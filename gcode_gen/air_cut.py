@@ -0,0 +1,302 @@
+'''Air cut elimination: replace the cuts of a job that only go through air with rapids.
+
+The job is simulated on a stock heightmap (see simulate).  A gap is a run of consecutive
+motions that remove no stock and include at least one cut, such as a depth pass re-tracing a
+perimeter that an earlier operation already cleared.  Each gap is replaced by the fastest of:
+  - the same path as rapids;
+  - a straight rapid, when the stock is clear of it;
+  - a retract to a recomputed safe height (clearance above the highest stock along the way),
+    a rapid across and a rapid down.
+When a plunge follows the gap, the rapids go down to clearance above the stock under it, so only
+the part of the plunge in stock is cut.
+
+Motions that remove nothing leave the stock as it was, so one simulation finds every gap.  A
+second one sweeps the other motions and looks up the stock around each gap before the chunk of
+motions the gap is in, which is never lower than the stock the gap travels over.  A chunk starts
+at every gap that an earlier motion of its chunk may have cut around, so that stock is exact.
+The cells under the start of a gap are as low as the motion before it went, so they need no
+look up.  Like the simulation, clearances are only as good as the heightmap resolution.
+'''
+import time
+import numpy as np
+from . import action
+from . import estimate
+from . import point as pt
+from . import simulate
+
+DEFAULT_CLEARANCE = 0.5  # above the stock for recomputed rapids, in gcode units
+BREAK_CHECK_PAIRS = 1 << 20  # (gap, motion) pairs checked at a time for chunk breaks
+
+
+class AirCutReport(object):
+    '''air cuts replaced and the estimated cycle time before and after, in seconds'''
+    def __init__(self, air_cut_count=0, gap_count=0, seconds_before=0.0, seconds_after=0.0, seconds=0.0):
+        self.air_cut_count = air_cut_count
+        self.gap_count = gap_count
+        self.seconds_before = seconds_before
+        self.seconds_after = seconds_after
+        self.seconds = seconds
+
+    @property
+    def time_saved(self):
+        return self.seconds_before - self.seconds_after
+
+    def __str__(self):
+        ratio = self.time_saved / self.seconds_before if self.seconds_before > 0 else 0.0
+        return ('{} air cuts in {} gaps: estimated cycle time {:.1f}s -> {:.1f}s ({:.0%} saved) '
+                'in {:.2f}s').format(self.air_cut_count, self.gap_count, self.seconds_before,
+                                     self.seconds_after, ratio, self.seconds)
+
+
+def find_gaps(opcodes, rows, removed):
+    '''(firsts, stops, air_cut_counts) arrays of the gaps of an action list: runs of rows
+    [first, stop) that are motions removing no stock, with at least one cut among rows
+    (the motion rows that move the tool, see simulate.motion_rows()).
+    removed is True for the rows that removed stock.'''
+    is_idle = opcodes != action.OP_STATE
+    is_idle[rows[removed]] = False
+    is_air_cut = np.zeros(len(opcodes), dtype=np.int64)
+    is_air_cut[rows[~removed & (opcodes[rows] == action.OP_CUT)]] = 1
+    edges = np.diff(is_idle.astype(np.int8), prepend=0, append=0)
+    firsts = np.flatnonzero(edges == 1)
+    stops = np.flatnonzero(edges == -1)
+    air_cuts_before = np.concatenate(((0, ), np.cumsum(is_air_cut)))
+    air_cut_counts = air_cuts_before[stops] - air_cuts_before[firsts]
+    has_air = air_cut_counts > 0
+    return firsts[has_air], stops[has_air], air_cut_counts[has_air]
+
+
+def segment_distances(p0, p1, q0, q1):
+    '''distances between the x/y segments from the rows of p0 to p1 and of q0 to q1'''
+    def to_segment(point, start, end):
+        vecs = end - start
+        length_sq = np.einsum('ij,ij->i', vecs, vecs)
+        along = np.einsum('ij,ij->i', point - start, vecs) / np.where(length_sq > 0, length_sq, 1)
+        nearest = start + np.clip(along, 0, 1)[:, np.newaxis] * vecs
+        return np.hypot(*(point - nearest).T)
+
+    def side(start, end, point):
+        '''z of the cross product, its sign tells the side of point'''
+        vecs, offsets = end - start, point - start
+        return vecs[:, 0] * offsets[:, 1] - vecs[:, 1] * offsets[:, 0]
+
+    p0, p1, q0, q1 = p0[:, :2], p1[:, :2], q0[:, :2], q1[:, :2]
+    p_crosses = side(q0, q1, p0) * side(q0, q1, p1) < 0
+    crossing = p_crosses & (side(p0, p1, q0) * side(p0, p1, q1) < 0)
+    distances = np.minimum(np.minimum(to_segment(p0, q0, q1), to_segment(p1, q0, q1)),
+                           np.minimum(to_segment(q0, p0, p1), to_segment(q1, p0, p1)))
+    return np.where(crossing, 0, distances)
+
+
+def needs_break(starts, ends, active, gap_breaks, begins, path_ends, reach, chunk_size):
+    '''True for the gaps whose stock an earlier motion of the same chunk may have cut.
+    starts and ends are the motions swept before the gaps, gap_breaks the index of the first
+    one after each gap and active those that reach the stock.  Motions that stay over the start
+    of the gap are left out, reach is the distance at which two motions cut the same stock.'''
+    result = np.zeros(len(gap_breaks), dtype=bool)
+    # a chunk holds at most chunk_size active motions
+    window_stops = np.searchsorted(active, gap_breaks)
+    window_firsts = np.maximum(window_stops - chunk_size, 0)
+    window_lengths = window_stops - window_firsts
+    moves_xy = np.any(np.abs(path_ends[:, :2] - begins[:, :2]) > simulate.TOLERANCE, axis=1)
+    gaps = np.flatnonzero((window_lengths > 0) & moves_xy)
+    pairs_before = np.cumsum(window_lengths[gaps]) - window_lengths[gaps]
+    for block in np.split(gaps, np.flatnonzero(np.diff(pairs_before // BREAK_CHECK_PAIRS)) + 1):
+        if len(block) == 0:
+            continue
+        pair_gaps = np.repeat(block, window_lengths[block])
+        moves = active[simulate.expand_spans(window_firsts[block], window_stops[block])]
+        begin, end = begins[pair_gaps], path_ends[pair_gaps]
+        move_start, move_end = starts[moves], ends[moves]
+        move_xy = np.concatenate((move_start[:, :2], move_end[:, :2]), axis=1)
+        at_begin = np.all(np.abs(move_xy - np.tile(begin[:, :2], 2)) <= simulate.TOLERANCE, axis=1)
+        near = (~at_begin) & (segment_distances(move_start, move_end, begin, end) <= reach)
+        result[pair_gaps[near]] = True
+    return result
+
+
+def gap_stock(stock, radius, starts, ends, skip_start, gap_breaks, begins, path_ends, bounded,
+              chunk_size):
+    '''highest stock around each gap, as (travel, under_end) arrays: along the x/y path from
+    begins to path_ends, leaving out the cells under the start of the gaps marked bounded, and
+    under the end.  starts, ends and skip_start are the motions to sweep, gap_breaks the index
+    of the first one after each gap.'''
+    heightmap = stock.copy()
+    active = simulate.reaching_moves(heightmap, starts, ends)
+    reach = 2 * radius + 2 * heightmap.resolution
+    breaks = gap_breaks[needs_break(starts, ends, active, gap_breaks, begins, path_ends, reach, chunk_size)]
+    travel = np.full(len(gap_breaks), -np.inf)
+    under_end = np.full(len(gap_breaks), -np.inf)
+    answered = 0
+
+    def look_up(stop):
+        '''the stock around the gaps before motion stop'''
+        gaps = slice(answered, answered + np.searchsorted(gap_breaks[answered:], stop, side='left'))
+        if gaps.stop > gaps.start:
+            query_starts = np.concatenate((begins[gaps], path_ends[gaps]))
+            query_ends = np.concatenate((path_ends[gaps], path_ends[gaps]))
+            skip = np.concatenate((bounded[gaps], np.zeros(gaps.stop - gaps.start, dtype=bool)))
+            highs = simulate.highest_stock(heightmap, query_starts, query_ends, radius, skip)
+            travel[gaps], under_end[gaps] = np.split(highs, 2)
+        return gaps.stop
+
+    for first, stop in simulate.sweep_chunks(heightmap, starts, ends, radius, skip_start,
+                                             chunk_size=chunk_size, breaks=breaks):
+        # gaps up to the end of the chunk, the break checks make the stock before it exact enough
+        answered = look_up(stop)
+    look_up(len(starts) + 1)
+    return travel, under_end
+
+
+def plan_paths(begins, paths, path_counts, plunges, travel, under_end, bounded, clearance, limits):
+    '''choose the fastest rapids for each gap, see the module docstring.
+    paths holds the points of every gap path, path_counts of them per gap.  plunges is the z
+    the motion after each gap plunges to, nan when it does not plunge.
+    Returns (points, point_counts) like paths and path_counts.'''
+    path_ends = paths[np.cumsum(path_counts) - 1]
+    # the stock under the start of a bounded gap is as low as where the gap starts
+    floors = np.where(bounded, begins[:, 2], -np.inf)
+    is_vertical = np.all(np.abs(path_ends[:, :2] - begins[:, :2]) <= simulate.TOLERANCE, axis=1)
+    under_end = np.where(is_vertical & bounded, np.minimum(under_end, floors), under_end)
+    # only the part of a plunge in stock is cut
+    ends = path_ends.copy()
+    trim = ~np.isnan(plunges)
+    ends[trim, 2] = np.minimum(path_ends[trim, 2], np.maximum(under_end[trim] + clearance, plunges[trim]))
+    lowest = np.minimum(begins[:, 2], ends[:, 2])
+    is_direct = (travel <= lowest + simulate.TOLERANCE) & (floors <= lowest + simulate.TOLERANCE)
+    safe_z = np.maximum(np.maximum(begins[:, 2], ends[:, 2]), travel + clearance)
+    retracts = np.stack((np.column_stack((begins[:, :2], safe_z)),
+                         np.column_stack((ends[:, :2], safe_z)),
+                         ends), axis=1)
+    # candidates: the same path, a straight rapid, a retract
+    count = len(begins)
+    candidate_points = np.concatenate((paths, ends, ends, retracts.reshape(-1, 3)))
+    candidate_ids = np.concatenate((np.repeat(np.arange(count), path_counts), np.arange(count),
+                                    np.arange(count, 2 * count),
+                                    np.repeat(np.arange(2 * count, 3 * count), 3)))
+    order = np.argsort(candidate_ids, kind='stable')
+    candidate_points, candidate_ids = candidate_points[order], candidate_ids[order]
+    seconds = paths_seconds(np.tile(begins, (3, 1)), candidate_points, candidate_ids, limits)
+    seconds[count:2 * count][~is_direct] = np.inf
+    choices = np.argmin(seconds.reshape(3, count), axis=0) * count + np.arange(count)
+    chosen = np.flatnonzero(np.isin(candidate_ids, choices))
+    gaps = candidate_ids[chosen] % count
+    chosen = chosen[np.argsort(gaps, kind='stable')]
+    return candidate_points[chosen], np.bincount(gaps, minlength=count)
+
+
+def paths_seconds(begins, points, ids, limits):
+    '''estimated seconds for rapids from each row of begins through the points with its index
+    in ids (sorted), stopping at every point'''
+    prev = np.concatenate((begins[ids[:1]], points[:-1]))
+    is_first = np.diff(ids, prepend=-1) != 0
+    prev[is_first] = begins[ids[is_first]]
+    vecs = points - prev
+    lengths = np.sqrt(np.einsum('ij,ij->i', vecs, vecs))
+    moves = lengths > estimate.MIN_SEGMENT_LENGTH
+    unit_vecs = vecs[moves] / lengths[moves, np.newaxis]
+    nominal = estimate.limit_by_axes(limits.max_rates, unit_vecs) / 60
+    accel = estimate.limit_by_axes(limits.accelerations, unit_vecs)
+    rest = np.zeros(len(unit_vecs))
+    times = estimate.segment_times(lengths[moves], nominal, accel, rest, rest)
+    return np.bincount(ids[moves], weights=times, minlength=len(begins)).astype(np.float64)
+
+
+def plunge_depths(actions, rows, positions):
+    '''z of the cut at each of rows when it goes straight down from the same row of positions,
+    nan when it does not (or when there is no such row)'''
+    result = np.full(len(rows), np.nan)
+    inside = rows < len(actions)
+    xyz = actions.xyz[rows[inside]]
+    is_cut = actions.opcodes[rows[inside]] == action.OP_CUT
+    is_below = np.all(np.abs(xyz[:, :2] - positions[inside, :2]) <= simulate.TOLERANCE, axis=1)
+    is_below &= xyz[:, 2] < positions[inside, 2] - simulate.TOLERANCE
+    is_plunge = is_cut & is_below
+    result[np.flatnonzero(inside)[is_plunge]] = xyz[is_plunge, 2]
+    return result
+
+
+def splice_jogs(actions, firsts, stops, begins, points, point_counts):
+    '''new ArrayActionList with the rows [first, stop) of each gap of actions replaced by jogs to
+    its points (point_counts of them per gap), from the same row of begins'''
+    count = len(actions)
+    in_gap = np.cumsum(np.bincount(firsts, minlength=count + 1) - np.bincount(stops, minlength=count + 1))[:-1] > 0
+    kept = np.flatnonzero(~in_gap)
+    owners = np.repeat(np.arange(len(firsts)), point_counts)
+    is_first = np.zeros(len(points), dtype=bool)
+    is_first[np.cumsum(point_counts)[point_counts > 0] - point_counts[point_counts > 0]] = True
+    prev = np.concatenate((points[:1], points[:-1]))
+    prev[is_first] = begins[owners[is_first]]
+    emit, redundant = pt.step_changes(prev, points)
+    points, owners, emit = points[~redundant], owners[~redundant], emit[~redundant]
+    # jogs take the place of the first row of their gap
+    order = np.argsort(np.concatenate((kept, firsts[owners])), kind='stable')
+    new_rows = np.empty(len(order), dtype=np.int64)
+    new_rows[order] = np.arange(len(order))
+    jog_rows = firsts[owners]
+    result = action.ArrayActionList.from_columns(
+        opcodes=np.concatenate((actions.opcodes[kept], np.full(len(points), action.OP_JOG)))[order],
+        xyz=np.concatenate((actions.xyz[kept], points))[order],
+        axis_masks=np.concatenate((actions.axis_masks[kept],
+                                   np.dot(emit, action.AXIS_BITS) | action.POINT_BIT))[order],
+        feed_rates=np.concatenate((actions.feed_rates[kept], actions.feed_rates[jog_rows]))[order],
+        spindle_speeds=np.concatenate((actions.spindle_speeds[kept], actions.spindle_speeds[jog_rows]))[order],
+        objects={int(new_rows[np.searchsorted(kept, index)]): elem for index, elem in actions.objects.items()})
+    return result
+
+
+def eliminate_air_cuts(actions, tool, stock=None, resolution=simulate.DEFAULT_RESOLUTION,
+                       clearance=DEFAULT_CLEARANCE, keep_paths=False, limits=None, start=None,
+                       chunk_size=simulate.DEFAULT_CHUNK_SIZE):
+    '''replace the gaps of actions (an ActionList or ArrayActionList) with rapids, see the
+    module docstring.  stock, resolution, start and chunk_size are as for simulate.simulate().
+    keep_paths=True only turns the gaps into rapids along the same path.
+    Cycle times are estimated with limits (see estimate.MachineLimits), which also pick the
+    fastest rapids.
+    Returns (new ArrayActionList, AirCutReport).'''
+    begin_time = time.perf_counter()
+    if not isinstance(actions, action.ArrayActionList):
+        actions = action.ArrayActionList(actions)
+    if np.any(actions.opcodes == action.OP_ARC):
+        raise ValueError('air cuts are found on straight moves, eliminate them before fitting arcs')
+    if limits is None:
+        limits = estimate.MachineLimits()
+    if len(actions) == 0:
+        return actions, AirCutReport(seconds=time.perf_counter() - begin_time)
+    radius = tool.cut_diameter / 2
+    xyz = actions.xyz
+    if stock is None:
+        stock = simulate.Heightmap.around(xyz, radius + resolution, resolution)
+    if start is None:
+        start = xyz[0]
+    start = np.asarray(start, dtype=np.float64).reshape(3)
+    rows, starts, ends, skip_start = simulate.motion_rows(actions, start)
+    removed = simulate.sweep(stock.copy(), starts, ends, radius, skip_start, chunk_size)
+    opcodes = actions.opcodes
+    firsts, stops, air_cut_counts = find_gaps(opcodes, rows, removed)
+    begins = np.where((firsts > 0)[:, np.newaxis], xyz[firsts - 1], start)
+    path_counts = stops - firsts
+    paths = xyz[simulate.expand_spans(firsts, stops)]
+    if not keep_paths:
+        # the motion before a gap cut the stock under its end as low as where the gap starts
+        bounded = (firsts > 0) & (opcodes[firsts - 1] != action.OP_STATE)
+        path_ends = xyz[stops - 1]
+        gap_edges = np.bincount(firsts, minlength=len(actions) + 1)
+        gap_edges -= np.bincount(stops, minlength=len(actions) + 1)
+        in_gap = np.cumsum(gap_edges)[:-1] > 0
+        kept = ~in_gap[rows]
+        # a motion after a gap does not continue from the one before it
+        skip_start = skip_start & np.concatenate(((False, ), kept[:-1]))
+        travel, under_end = gap_stock(stock, radius, starts[kept], ends[kept], skip_start[kept],
+                                      np.searchsorted(rows[kept], firsts), begins, path_ends, bounded,
+                                      chunk_size)
+        plunges = plunge_depths(actions, stops, path_ends)
+        paths, path_counts = plan_paths(begins, paths, path_counts, plunges, travel, under_end,
+                                        bounded, clearance, limits)
+    result = splice_jogs(actions, firsts, stops, begins, paths, path_counts)
+    report = AirCutReport(air_cut_count=int(air_cut_counts.sum()),
+                          gap_count=len(firsts),
+                          seconds_before=estimate.estimate_actions(actions, limits, start),
+                          seconds_after=estimate.estimate_actions(result, limits, start))
+    report.seconds = time.perf_counter() - begin_time
+    return result, report
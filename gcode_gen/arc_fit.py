@@ -0,0 +1,225 @@
+'''Arc fitting: replace runs of cut segments along a circle with G2/G3 arcs.
+
+Circles are cut as polygons (see poly.poly_circle_verts() and cut.Cylinder): one gcode line and
+one planner block per segment, so a fine circle bloats the file and the machine's planner buffer
+runs short of motion.  fit_arcs() finds runs of level cut segments (in the x/y plane at one z)
+where the circles through every three successive points agree within tolerance and turn the same
+way.  A run is split into arcs that turn at most max_sweep, well short of the half circle the
+radius format of G2/G3 can express.  An arc replaces its segments when every point and every
+chord (by its sagitta) is within tolerance of it, and there are at least min_segments of them.
+Arcs are OP_ARC rows of the ArrayActionList (see action.OP_ARC), which estimate and simulate
+follow as the chords the machine cuts them with; air_cut only handles straight moves, so
+eliminate air cuts first.
+iter_fit_arcs() fits a stream of actions a chunk at a time.
+'''
+import time
+import numpy as np
+from . import action
+from . import number
+from . import point as pt
+from . import simulate
+
+DEFAULT_TOLERANCE = 0.025  # distance from the arc to the points and chords it replaces, in gcode units
+DEFAULT_MIN_SEGMENTS = 3
+DEFAULT_MAX_SWEEP = np.pi / 2  # radians turned by one arc
+SWEEP_TOLERANCE = 1e-9  # radians
+
+
+class ArcFitReport(object):
+    '''segments replaced with arcs, and the rows of the action list before and after'''
+    def __init__(self, segment_count=0, arc_count=0, rows_before=0, rows_after=0, seconds=0.0):
+        self.segment_count = segment_count
+        self.arc_count = arc_count
+        self.rows_before = rows_before
+        self.rows_after = rows_after
+        self.seconds = seconds
+
+    def __str__(self):
+        return '{} segments fitted with {} arcs: {} -> {} rows in {:.2f}s'.format(
+            self.segment_count, self.arc_count, self.rows_before, self.rows_after, self.seconds)
+
+
+def circumcircles(a, b, c):
+    '''(centers, radii, turns) of the circles through the x/y of the rows of a, b and c.
+    turns is the cross product of b - a and c - b, positive where the points turn
+    counterclockwise.  Radii are inf for points in line.'''
+    u = a[:, :2] - b[:, :2]
+    v = c[:, :2] - b[:, :2]
+    turns = u[:, 1] * v[:, 0] - u[:, 0] * v[:, 1]
+    u_sq = np.einsum('ij,ij->i', u, u)
+    v_sq = np.einsum('ij,ij->i', v, v)
+    offsets = np.column_stack((u_sq * v[:, 1] - v_sq * u[:, 1], v_sq * u[:, 0] - u_sq * v[:, 0]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offsets /= -2 * turns[:, np.newaxis]
+    radii = np.where(turns != 0, np.hypot(offsets[:, 0], offsets[:, 1]), np.inf)
+    return b[:, :2] + offsets, radii, turns
+
+
+def sagittas(radii, chords):
+    '''distances from the middle of the chords to arcs of radii, nan for chords longer than
+    the diameter'''
+    return radii - np.sqrt(radii ** 2 - (chords / 2) ** 2)
+
+
+def span_offsets(counts):
+    '''index of the first element of each span of counts elements, for reduceat'''
+    return np.cumsum(counts) - counts
+
+
+def find_chains(opcodes, xyz, lengths, tolerance):
+    '''(firsts, stops, radii) of the chains of level cut rows [first, stop), where the circles
+    through every three successive points agree within tolerance and turn the same way.
+    Each cut row is the segment from the position of the row before it, lengths are their
+    x/y lengths.  radii are the mean radius of each chain.'''
+    is_level = np.zeros(len(opcodes), dtype=bool)
+    is_level[1:] = opcodes[1:] == action.OP_CUT
+    is_level[1:] &= np.abs(xyz[1:, 2] - xyz[:-1, 2]) <= number.CLOSE_TOLERANCE
+    is_level &= lengths > number.CLOSE_TOLERANCE
+    # the vertices at the end of a level segment that another one continues from
+    verts = np.flatnonzero(is_level[:-1] & is_level[1:])
+    centers, radii, turns = circumcircles(xyz[verts - 1], xyz[verts], xyz[verts + 1])
+    # both segments bend about the vertex, close to its circle
+    is_arc = np.abs(turns) > number.CLOSE_TOLERANCE * lengths[verts] * lengths[verts + 1]
+    with np.errstate(invalid='ignore'):
+        is_arc &= sagittas(radii, np.maximum(lengths[verts], lengths[verts + 1])) <= tolerance
+    verts, centers, radii, turns = verts[is_arc], centers[is_arc], radii[is_arc], turns[is_arc]
+    if len(verts) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+    linked = verts[1:] == verts[:-1] + 1
+    linked &= (turns[1:] > 0) == (turns[:-1] > 0)
+    linked &= np.hypot(*(centers[1:] - centers[:-1]).T) <= tolerance
+    linked &= np.abs(radii[1:] - radii[:-1]) <= tolerance
+    chain_starts = np.flatnonzero(np.concatenate(((True, ), ~linked)))
+    vert_counts = np.diff(np.append(chain_starts, len(verts)))
+    chain_radii = np.add.reduceat(radii, chain_starts) / vert_counts
+    firsts = verts[chain_starts]
+    stops = verts[chain_starts + vert_counts - 1] + 2
+    # a chain right after another starts with the last segment of it
+    firsts[1:] = np.maximum(firsts[1:], stops[:-1])
+    return firsts, stops, chain_radii
+
+
+def split_chains(firsts, stops, radii, lengths, max_sweep):
+    '''(firsts, stops) of the pieces of each chain of segments [first, stop) of about radius,
+    each turning about max_sweep or less: as few as will do, split at the segments around even
+    angles'''
+    if len(firsts) == 0:
+        return firsts, stops
+    counts = stops - firsts
+    rows = simulate.expand_spans(firsts, stops)
+    chains = np.repeat(np.arange(len(firsts)), counts)
+    angles = 2 * np.arcsin(np.minimum(lengths[rows] / (2 * radii[chains]), 1))
+    totals = np.add.reduceat(angles, span_offsets(counts))
+    piece_counts = np.maximum(np.ceil(totals / max_sweep - SWEEP_TOLERANCE), 1).astype(np.int64)
+    middles = np.cumsum(angles) - angles / 2 - np.repeat(np.cumsum(totals) - totals, counts)
+    pieces = np.floor(middles * piece_counts[chains] / totals[chains]).astype(np.int64)
+    pieces = np.minimum(pieces, piece_counts[chains] - 1) + np.repeat(span_offsets(piece_counts), counts)
+    piece_starts = np.flatnonzero(np.diff(pieces, prepend=-1) != 0)
+    piece_stops = np.append(piece_starts[1:], len(rows))
+    return rows[piece_starts], rows[piece_stops - 1] + 1
+
+
+def find_arcs(opcodes, xyz, tolerance=DEFAULT_TOLERANCE, min_segments=DEFAULT_MIN_SEGMENTS,
+              max_sweep=DEFAULT_MAX_SWEEP):
+    '''(firsts, stops, radii, is_clockwise) of the arcs that replace the cut rows [first, stop)
+    of the opcodes and xyz columns of an ArrayActionList, see the module docstring'''
+    vecs = np.diff(xyz[:, :2], axis=0, prepend=xyz[:1, :2])
+    lengths = np.hypot(vecs[:, 0], vecs[:, 1])
+    firsts, stops, radii = find_chains(opcodes, xyz, lengths, tolerance)
+    is_long = stops - firsts >= min_segments
+    firsts, stops = split_chains(firsts[is_long], stops[is_long], radii[is_long], lengths, max_sweep)
+    is_long = stops - firsts >= min_segments
+    firsts, stops = firsts[is_long], stops[is_long]
+    counts = stops - firsts
+    centers, radii, turns = circumcircles(xyz[firsts - 1], xyz[firsts - 1 + counts // 2], xyz[stops - 1])
+    directions = np.sign(turns)
+    # every point on the arc
+    points = simulate.expand_spans(firsts - 1, stops)
+    arcs = np.repeat(np.arange(len(firsts)), counts + 1)
+    radial = np.abs(np.hypot(*(xyz[points, :2] - centers[arcs]).T) - radii[arcs])
+    is_fit = np.isfinite(radii)
+    if len(firsts) > 0:
+        is_fit &= np.maximum.reduceat(radial, span_offsets(counts + 1)) <= tolerance
+    # every chord close to the arc, turning its way
+    rows = simulate.expand_spans(firsts, stops)
+    arcs = np.repeat(np.arange(len(firsts)), counts)
+    starts, ends = xyz[rows - 1, :2] - centers[arcs], xyz[rows, :2] - centers[arcs]
+    angles = directions[arcs] * np.arctan2(starts[:, 0] * ends[:, 1] - starts[:, 1] * ends[:, 0],
+                                           np.einsum('ij,ij->i', starts, ends))
+    with np.errstate(invalid='ignore'):
+        heights = sagittas(radii[arcs], lengths[rows])
+    if len(firsts) > 0:
+        offsets = span_offsets(counts)
+        is_fit &= np.maximum.reduceat(heights, offsets) <= tolerance
+        is_fit &= np.minimum.reduceat(angles, offsets) > 0
+        is_fit &= np.add.reduceat(angles, offsets) <= max_sweep + SWEEP_TOLERANCE
+    return firsts[is_fit], stops[is_fit], radii[is_fit], turns[is_fit] < 0
+
+
+def splice_arcs(actions, firsts, stops, radii, is_clockwise):
+    '''ArrayActionList of actions with the cut rows [first, stop) replaced by one OP_ARC row
+    each, on the row of the last of them'''
+    count = len(actions)
+    edges = np.bincount(firsts, minlength=count + 1) - np.bincount(stops - 1, minlength=count + 1)
+    kept = np.cumsum(edges)[:-1] == 0
+    arc_rows = stops - 1
+    xyz = actions.xyz
+    opcodes = actions.opcodes.copy()
+    opcodes[arc_rows] = action.OP_ARC
+    axis_masks = actions.axis_masks.copy()
+    changed = pt.step_changes(xyz[firsts - 1], xyz[arc_rows])[0]
+    axis_masks[arc_rows] = np.dot(changed, action.AXIS_BITS) | action.POINT_BIT
+    arc_radii = actions.arc_radii.copy()
+    arc_radii[arc_rows] = np.where(is_clockwise, -radii, radii)
+    new_rows = np.cumsum(kept) - 1
+    return action.ArrayActionList.from_columns(
+        opcodes=opcodes[kept],
+        xyz=xyz[kept],
+        axis_masks=axis_masks[kept],
+        feed_rates=actions.feed_rates[kept],
+        spindle_speeds=actions.spindle_speeds[kept],
+        arc_radii=arc_radii[kept],
+        objects={int(new_rows[index]): elem for index, elem in actions.objects.items()})
+
+
+def fit_arcs(actions, tolerance=DEFAULT_TOLERANCE, min_segments=DEFAULT_MIN_SEGMENTS,
+             max_sweep=DEFAULT_MAX_SWEEP):
+    '''replace the runs of cut segments of actions (an ActionList or ArrayActionList) along a
+    circle with arcs, see the module docstring.
+    Returns (new ArrayActionList, ArcFitReport).'''
+    begin_time = time.perf_counter()
+    if not isinstance(actions, action.ArrayActionList):
+        actions = action.ArrayActionList(actions)
+    firsts, stops, radii, is_clockwise = find_arcs(actions.opcodes, actions.xyz, tolerance,
+                                                   min_segments, max_sweep)
+    result = splice_arcs(actions, firsts, stops, radii, is_clockwise)
+    report = ArcFitReport(segment_count=int(np.sum(stops - firsts)),
+                          arc_count=len(firsts),
+                          rows_before=len(actions),
+                          rows_after=len(result),
+                          seconds=time.perf_counter() - begin_time)
+    return result, report
+
+
+def iter_fit_arcs(actions, chunk_size, tolerance=DEFAULT_TOLERANCE, min_segments=DEFAULT_MIN_SEGMENTS,
+                  max_sweep=DEFAULT_MAX_SWEEP):
+    '''fit_arcs() on an iterable of actions a chunk at a time, yielding an ArrayActionList for
+    every chunk_size or so actions.
+    The run of cut rows at the end of a chunk could go on in the next one, so it is carried over,
+    with the row before it as the start of its first segment: an arc is only split where a single
+    run of cuts goes on for more than a chunk.'''
+    al = action.ArrayActionList()
+    start = 0  # rows of al before start were carried over and already yielded
+    flushed = 0  # rows of al when the last chunk was yielded
+    for elem in actions:
+        al.append(elem)
+        if len(al) - flushed >= chunk_size:
+            not_cut = np.flatnonzero(al.opcodes[start:] != action.OP_CUT)
+            # the last row before the run of cuts at the end, or every row when it is all one run
+            stop = start + not_cut[-1] if len(not_cut) > 0 else len(al) - 1
+            yield fit_arcs(al[:stop + 1], tolerance, min_segments, max_sweep)[0][start:]
+            al = al[stop:]
+            start = 1
+            flushed = len(al)
+    if len(al) > start:
+        yield fit_arcs(al, tolerance, min_segments, max_sweep)[0][start:]
@@ -0,0 +1,306 @@
+'''Compact storage for large Assembly trees, such as panelized jobs.
+
+An AssemblyArena keeps the tree structure in parallel arrays, one row per node:
+factory (node type) index, parent, first child, last child, next sibling, child count
+and transform index.  The Assembly objects are only built while they are visited,
+see ArenaAssembly.
+'''
+import numpy as np
+from collections.abc import MutableSequence
+from . import array_util
+from . import tree
+from .assembly import Assembly
+
+NO_INDEX = -1
+ROOT = 0  # row of the arena root, the ArenaAssembly itself
+
+
+class AssemblyArena(object):
+    '''Parallel array storage of a tree.
+    A row is either built by calling its factory (any callable returning an Assembly, shared
+    between rows) or is an Assembly object stored as is.
+    Rows unlinked by remove() are not reused.'''
+    def __init__(self, capacity=16):
+        def column():
+            return array_util.GrowableArray(dtype=np.int32, capacity=capacity)
+        self._factory_ids = column()
+        self._parents = column()
+        self._first_children = column()
+        self._last_children = column()
+        self._next_siblings = column()
+        self._child_counts = column()
+        self._transform_ids = column()
+        self._matrices = array_util.GrowableArray(row_shape=(4, 4), capacity=capacity)
+        self.factories = []
+        self._factory_index = {}
+        self._objects = {}  # row -> Assembly, for rows added as objects
+        self._append_rows(NO_INDEX, NO_INDEX, 1)
+
+    def __len__(self):
+        return len(self._parents)
+
+    @property
+    def nbytes(self):
+        '''bytes used by the arrays (not counting factories and object rows)'''
+        columns = (self._factory_ids, self._parents, self._first_children, self._last_children,
+                   self._next_siblings, self._child_counts, self._transform_ids, self._matrices)
+        return sum(column.arr.nbytes for column in columns)
+
+    def factory_id(self, factory):
+        try:
+            return self._factory_index[factory]
+        except KeyError:
+            self.factories.append(factory)
+            self._factory_index[factory] = len(self.factories) - 1
+            return len(self.factories) - 1
+
+    def _append_rows(self, factory_id, parent, count, matrices=None):
+        '''append count unlinked rows, returns the first new row'''
+        first_row = len(self)
+        self._factory_ids.extend(np.full(count, factory_id))
+        self._parents.extend(np.full(count, parent))
+        self._first_children.extend(np.full(count, NO_INDEX))
+        self._last_children.extend(np.full(count, NO_INDEX))
+        self._next_siblings.extend(np.full(count, NO_INDEX))
+        self._child_counts.extend(np.zeros(count))
+        if matrices is None:
+            self._transform_ids.extend(np.full(count, NO_INDEX))
+        else:
+            first_transform_id = len(self._matrices)
+            self._matrices.extend(matrices)
+            self._transform_ids.extend(np.arange(first_transform_id, first_transform_id + count))
+        return first_row
+
+    def _link_after(self, parent, prev_row, first_row, last_row, count):
+        '''link the sibling chain first_row..last_row into parent after prev_row
+        (NO_INDEX links it in as the first child)'''
+        if parent in self._objects:
+            raise ValueError('object rows keep their own children, can not add arena children to row {}'.format(parent))
+        if prev_row == NO_INDEX:
+            next_row = self._first_children.arr[parent]
+            self._first_children.arr[parent] = first_row
+        else:
+            next_row = self._next_siblings.arr[prev_row]
+            self._next_siblings.arr[prev_row] = first_row
+        self._next_siblings.arr[last_row] = next_row
+        if next_row == NO_INDEX:
+            self._last_children.arr[parent] = last_row
+        self._child_counts.arr[parent] += count
+
+    def add(self, factory, matrix=None, parent=ROOT):
+        '''add a child at the end of parent, returns its row.
+        factory is a callable returning a new Assembly, or an Assembly object to store as is.
+        matrix is an optional 4x4 transform, applied after the node's own transforms.'''
+        return self.insert(self.child_count(parent), factory, matrix, parent)
+
+    def add_many(self, factory, matrices, parent=ROOT):
+        '''add one child per 4x4 matrix in matrices, all built by factory.
+        Returns the rows as a range.'''
+        matrices = np.asarray(matrices, dtype=np.float64).reshape(-1, 4, 4)
+        count = matrices.shape[0]
+        if count == 0:
+            return range(len(self), len(self))
+        first_row = self._append_rows(self.factory_id(factory), parent, count, matrices)
+        rows = range(first_row, first_row + count)
+        self._next_siblings.arr[first_row:first_row + count - 1] = np.arange(first_row + 1, first_row + count)
+        self._link_after(parent, self._last_children.arr[parent], first_row, rows[-1], count)
+        return rows
+
+    def insert(self, index, factory, matrix=None, parent=ROOT):
+        '''like add, placing the child before the current child at index'''
+        if isinstance(factory, Assembly):
+            if matrix is not None:
+                raise ValueError('Assembly objects carry their own transforms, matrix must be None')
+            row = self._append_rows(NO_INDEX, parent, 1)
+        else:
+            row = self._append_rows(self.factory_id(factory), parent, 1, None if matrix is None else (matrix, ))
+        if index >= self.child_count(parent):
+            prev_row = self._last_children.arr[parent]
+        elif index <= 0:
+            prev_row = NO_INDEX
+        else:
+            prev_row = self.child_row(parent, index - 1)
+        self._link_after(parent, prev_row, row, row, 1)
+        if isinstance(factory, Assembly):
+            self._objects[row] = factory
+        return row
+
+    def remove(self, row):
+        '''unlink row (and with it its subtree) from its parent'''
+        parent = self._parents.arr[row]
+        prev_row = NO_INDEX
+        for child_row in self.child_rows(parent):
+            if child_row == row:
+                break
+            prev_row = child_row
+        next_row = self._next_siblings.arr[row]
+        if prev_row == NO_INDEX:
+            self._first_children.arr[parent] = next_row
+        else:
+            self._next_siblings.arr[prev_row] = next_row
+        if next_row == NO_INDEX:
+            self._last_children.arr[parent] = prev_row
+        self._child_counts.arr[parent] -= 1
+        self._parents.arr[row] = NO_INDEX
+        self._next_siblings.arr[row] = NO_INDEX
+        self._objects.pop(row, None)
+
+    def replace(self, row, node):
+        '''make row an object row holding node, keeping its position'''
+        if self._first_children.arr[row] != NO_INDEX:
+            raise ValueError('can not replace row {} which has arena children'.format(row))
+        self._factory_ids.arr[row] = NO_INDEX
+        self._transform_ids.arr[row] = NO_INDEX
+        self._objects[row] = node
+
+    def parent(self, row):
+        return int(self._parents.arr[row])
+
+    def child_count(self, row):
+        return int(self._child_counts.arr[row])
+
+    def child_rows(self, row):
+        '''iterate the child rows of row in order'''
+        next_siblings = self._next_siblings.arr
+        child_row = self._first_children.arr[row]
+        while child_row != NO_INDEX:
+            yield int(child_row)
+            child_row = next_siblings[child_row]
+
+    def child_row(self, row, index):
+        '''row of the child at index (negative index counts from the end), O(index)'''
+        count = self.child_count(row)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError('arena child index out of range')
+        if index == count - 1:
+            return int(self._last_children.arr[row])
+        next_siblings = self._next_siblings.arr
+        child_row = self._first_children.arr[row]
+        for _ in range(index):
+            child_row = next_siblings[child_row]
+        return int(child_row)
+
+    def matrix(self, row):
+        '''4x4 transform of row, None if it has none'''
+        transform_id = self._transform_ids.arr[row]
+        if transform_id == NO_INDEX:
+            return None
+        return self._matrices.arr[transform_id]
+
+    def walk(self, row=ROOT):
+        '''same walk as tree.Tree.walk() over rows, yielding (kind, row) tuples.
+        Does not build any Assembly objects.'''
+        # plain lists index much faster than numpy arrays one element at a time
+        first_children = self._first_children.arr.tolist()
+        next_siblings = self._next_siblings.arr.tolist()
+        yield tree.MOVE_DOWN, row
+        yield tree.PREORDER, row
+        stack = [row]
+        child_rows = [first_children[row]]
+        while stack:
+            child_row = child_rows[-1]
+            if child_row == NO_INDEX:
+                node_row = stack.pop()
+                child_rows.pop()
+                yield tree.POSTORDER, node_row
+                yield tree.MOVE_UP, node_row
+            else:
+                child_rows[-1] = next_siblings[child_row]
+                yield tree.MOVE_DOWN, child_row
+                yield tree.PREORDER, child_row
+                stack.append(child_row)
+                child_rows.append(first_children[child_row])
+
+    def build(self, row, parent_node):
+        '''return the Assembly for row as a child of parent_node.
+        Factory rows are built fresh on every call, object rows return the stored object.'''
+        node = self._objects.get(row)
+        if node is not None:
+            # only assign on change, so the node is not marked dirty by every walk
+            if node.parent is not parent_node:
+                node.parent = parent_node
+            if node.state is not parent_node.state:
+                node.state = parent_node.state
+            return node
+        node = self.factories[self._factory_ids.arr[row]]()
+        matrix = self.matrix(row)
+        if matrix is not None:
+            node.matrix_transform(matrix)
+        node.parent = parent_node
+        node.state = parent_node.state
+        if self._first_children.arr[row] != NO_INDEX:
+            node.children = ArenaChildren(self, row, node)
+        return node
+
+
+class ArenaChildren(MutableSequence):
+    '''list-like view of the children of an arena row, owned by the Assembly for that row.
+    Iteration is O(1) per child, indexing is O(index).'''
+    def __init__(self, arena, row, owner):
+        self.arena = arena
+        self.row = row
+        self.owner = owner
+
+    def __len__(self):
+        return self.arena.child_count(self.row)
+
+    def __iter__(self):
+        for child_row in self.arena.child_rows(self.row):
+            yield self.arena.build(child_row, self.owner)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self.arena.build(self.arena.child_row(self.row, index), self.owner)
+
+    def __setitem__(self, index, value):
+        if not isinstance(value, Assembly):
+            raise TypeError('expected Assembly type, got {}'.format(type(value)))
+        self.arena.replace(self.arena.child_row(self.row, index), value)
+
+    def __delitem__(self, index):
+        self.arena.remove(self.arena.child_row(self.row, index))
+
+    def insert(self, index, value):
+        if not isinstance(value, Assembly):
+            raise TypeError('expected Assembly type, got {}'.format(type(value)))
+        self.arena.insert(index, value, parent=self.row)
+
+
+class ArenaAssembly(Assembly):
+    '''Assembly whose subtree is stored in an AssemblyArena.
+    Nodes added with add()/add_many() are built from their factory each time they are
+    visited and are not kept, so keep the row returned by add() rather than a child object.
+    Assembly objects appended with += are stored as is.
+    '''
+    def __init__(self, name=None, parent=None, state=None, arena=None):
+        super().__init__(name=name, parent=parent, state=state)
+        if arena is None:
+            arena = AssemblyArena()
+        self.arena = arena
+        self.children = ArenaChildren(self.arena, ROOT, self)
+
+    def add(self, factory, matrix=None, parent=ROOT):
+        '''see AssemblyArena.add'''
+        return self.arena.add(factory, matrix, parent)
+
+    def add_many(self, factory, matrices, parent=ROOT):
+        '''see AssemblyArena.add_many'''
+        return self.arena.add_many(factory, matrices, parent)
+
+    @Assembly.state.setter
+    def state(self, new_state):
+        # children get the state when they are built, only stored objects need it now
+        self._state = new_state
+        for node in self.arena._objects.values():
+            node.state = new_state
+
+    def _invalidate_root_matrix(self):
+        # built children never outlive a walk, only stored objects can hold a cached matrix
+        if self._root_matrix is None:
+            return
+        self._root_matrix = None
+        for node in self.arena._objects.values():
+            node._invalidate_root_matrix()
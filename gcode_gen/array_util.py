@@ -0,0 +1,67 @@
+'''Helpers for numpy arrays that grow one row (or block of rows) at a time'''
+import numpy as np
+
+
+class GrowableArray(object):
+    '''numpy array with amortized O(1) append.
+    Rows are stored in a backing buffer whose capacity doubles when full.
+    arr returns a view of the filled region, so do not hold on to it across appends.
+    row_shape is the shape of each row, () for a 1-d column.
+    '''
+    def __init__(self, row_shape=(), dtype=np.float64, capacity=16):
+        self._buf = np.empty((max(capacity, 1), ) + tuple(row_shape), dtype=dtype)
+        self._len = 0
+
+    @classmethod
+    def from_array(cls, arr):
+        '''GrowableArray filled with the rows of arr, using arr itself as the backing buffer
+        (no copy) until the first append that needs more room'''
+        result = cls.__new__(cls)
+        result._buf = arr
+        result._len = arr.shape[0]
+        return result
+
+    @property
+    def arr(self):
+        return self._buf[:self._len]
+
+    @property
+    def capacity(self):
+        return self._buf.shape[0]
+
+    def __len__(self):
+        return self._len
+
+    def reserve(self, capacity):
+        '''make sure the backing buffer holds at least capacity rows'''
+        if capacity > self.capacity:
+            new_capacity = max(capacity, 2 * self.capacity)
+            new_buf = np.empty((new_capacity, ) + self._buf.shape[1:], dtype=self._buf.dtype)
+            new_buf[:self._len] = self._buf[:self._len]
+            self._buf = new_buf
+
+    def append(self, row):
+        if self._len == self.capacity:
+            self.reserve(self._len + 1)
+        self._buf[self._len] = row
+        self._len += 1
+
+    def insert(self, index, row):
+        '''insert row before index (0 <= index <= len), O(len - index)'''
+        if index == self._len:
+            self.append(row)
+            return
+        self.reserve(self._len + 1)
+        self._buf[index + 1:self._len + 1] = self._buf[index:self._len]
+        self._buf[index] = row
+        self._len += 1
+
+    def extend(self, rows):
+        rows = np.asarray(rows, dtype=self._buf.dtype)
+        count = rows.shape[0]
+        self.reserve(self._len + count)
+        self._buf[self._len:self._len + count] = rows
+        self._len += count
+
+    def clear(self):
+        self._len = 0
@@ -1,4 +1,6 @@
+from contextlib import contextmanager, ExitStack
 from functools import partial
+import numpy as np
 from collections.abc import MutableSequence
 from . import base_types
 from . import tree
@@ -8,8 +10,74 @@ from . import point as pt
 from . import action
 
 
+class ActionSpan(object):
+    '''actions a node produced last time it was generated, with the entry key and exit state
+    checkpoint needed to decide whether they can be reused, and the state they belong to.
+    For the node the walk started from they are stream[start:stop].  For the others start and
+    stop are relative to the span of parent (the node they were generated under), so a reused
+    node's descendants follow it into each new stream instead of keeping old streams alive.'''
+    def __init__(self, start, stop, entry_key, state, exit_state, nested_keys=(), parent=None, stream=None):
+        self.start = start
+        self.stop = stop
+        self.entry_key = entry_key
+        self.state = state
+        self.exit_state = exit_state
+        self.nested_keys = nested_keys  # (state, state_key) a descendant with its own state was entered with
+        self.parent = parent
+        self.stream = stream
+
+    @property
+    def actions(self):
+        offset, span = 0, self
+        while span.stream is None:
+            span = span.parent._action_span
+            offset += span.start
+        return span.stream[offset + self.start:offset + self.stop]
+
+
+@contextmanager
+def untracked_updates():
+    '''changes to the tree made inside, such as update_children_preorder() adding a SafeJog
+    child while the tree is walked, do not mark nodes dirty'''
+    Assembly._untracked += 1
+    try:
+        yield
+    finally:
+        Assembly._untracked -= 1
+
+
+class StateExcursions(ExitStack):
+    '''opens one excursion() on each distinct state passed to add(), all restored on exit.
+    For walks over trees whose nodes do not all share one state, such as a project.Project,
+    where every tool pass has its own.'''
+    def __init__(self):
+        super().__init__()
+        self._opened = set()  # id() of the states with an open excursion, kept alive by the stack
+
+    def add(self, state):
+        if id(state) not in self._opened:
+            self._opened.add(id(state))
+            self.enter_context(state.excursion())
+        return state
+
+
+def state_key(state):
+    '''comparable snapshot of state, positions compare exactly'''
+    return tuple((key, value.coords if isinstance(value, pt.Point) else value)
+                 for key, value in state.items())
+
+
 class Assembly(tree.Tree, transform.TransformableMixin):
-    '''tree of assembly items'''
+    '''tree of assembly items.
+    Setting a public attribute, appending a child or changing transforms, state or parent
+    marks the node and its ancestors dirty for get_actions(incremental=True).
+    Call mark_dirty() after changing anything else, such as mutating the children list in place.
+    '''
+    _root_matrix = None  # cache for root_matrix, see _invalidate_root_matrix()
+    _dirty = True  # see mark_dirty(), new nodes are dirty
+    _action_span = None  # cached ActionSpan, see get_actions(incremental=True)
+    _untracked = 0  # above 0 inside untracked_updates()
+
     def __init__(self, name=None, parent=None, state=None):
         super().__init__(name=name, parent=parent)
         if state is not None:
@@ -27,6 +95,45 @@ class Assembly(tree.Tree, transform.TransformableMixin):
         for child in self.children:
             child.state = self.state
 
+    @property
+    def parent(self):
+        return self._parent
+
+    @parent.setter
+    def parent(self, new_parent):
+        self._parent = new_parent
+        self._invalidate_root_matrix()
+        self._dirty = True
+        if isinstance(new_parent, Assembly):
+            new_parent.mark_dirty()
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if not self._dirty and name[0] != '_':
+            self.mark_dirty()
+
+    def mark_dirty(self):
+        '''mark this node and its ancestors for regeneration by get_actions(incremental=True).
+        When a node is dirty, so are all of its ancestors.'''
+        if Assembly._untracked:
+            return
+        node = self
+        while isinstance(node, Assembly) and not node._dirty:
+            node._dirty = True
+            node = node.parent
+
+    def mark_clean(self):
+        '''mark this node and its subtree clean.
+        For nodes that generate a subtree outside the normal walk, such as repeat.Repeat,
+        so that later edits in that subtree mark the node dirty again.'''
+        for kind, node in self.walk():
+            if kind == tree.PREORDER:
+                node._dirty = False
+
+    @property
+    def is_dirty(self):
+        return self._dirty
+
     def check_type(self, other):
         assert isinstance(other, Assembly)
 
@@ -34,18 +141,65 @@ class Assembly(tree.Tree, transform.TransformableMixin):
         super().append(arg)
         arg.state = self.state
 
+    def transforms_changed(self):
+        self._invalidate_root_matrix()
+        self.mark_dirty()
+
+    def _invalidate_root_matrix(self):
+        '''drop the cached root_matrix of this node and everything below it.
+        A node only has a cached matrix when its parent does, so stop at uncached nodes.'''
+        if self._root_matrix is None:
+            return
+        self._root_matrix = None
+        for child in self.children:
+            child._invalidate_root_matrix()
+
     def last(self):
         return self.children[-1]
 
-    def get_gcode(self):
-        return self.get_actions().get_gcode()
+    def travel_endpoints(self):
+        '''(entry, exit) x/y world positions of a position independent node: one that safe jogs
+        to its entry before it cuts, so its actions do not depend on where the tool was.
+        None (the default) for nodes that must keep their place, see optimize.order_children().'''
+        return None
+
+    def travel_options(self):
+        '''list of the (entry, exit) pairs a position independent node can be cut with, such as
+        each start vertex of a closed perimeter.  By default only travel_endpoints().'''
+        endpoints = self.travel_endpoints()
+        return None if endpoints is None else [endpoints]
 
-    def get_points(self):
-        return self.get_actions().get_points()
+    def travel_choice(self):
+        '''index in travel_options() of the option the node is cut with'''
+        return 0
+
+    def set_travel_option(self, index):
+        '''cut the node with travel_options()[index]'''
+        pass
+
+    def get_gcode(self, incremental=False):
+        return self.get_actions(incremental=incremental).get_gcode()
+
+    def get_points(self, incremental=False):
+        return self.get_actions(incremental=incremental).get_points()
 
     def update_children_preorder(self):
         pass
 
+    def preorder_step(self):
+        '''update_children_preorder() then get_preorder_actions(), the preorder visit of a walk.
+        The children it adds or replaces do not mark nodes dirty.'''
+        with untracked_updates():
+            self.update_children_preorder()
+            return self.get_preorder_actions()
+
+    def postorder_step(self):
+        '''get_postorder_actions() then update_children_postorder(), the postorder visit of a walk'''
+        with untracked_updates():
+            actions = self.get_postorder_actions()
+            self.update_children_postorder()
+            return actions
+
     def get_preorder_actions(self):
         return ()
 
@@ -55,19 +209,117 @@ class Assembly(tree.Tree, transform.TransformableMixin):
     def update_children_postorder(self):
         pass
 
-    def get_actions(self):
-        with self.state.excursion():
-            al = action.ActionList()
-            for step in self.depth_first_walk():
-                if step.is_visit:
-                    if step.is_preorder:
-                        step.visited.update_children_preorder()
-                        al.extend(step.visited.get_preorder_actions())
-                    elif step.is_postorder:
-                        al.extend(step.visited.get_postorder_actions())
-                        step.visited.update_children_postorder()
+    def get_actions(self, action_list_class=None, incremental=False):
+        '''walk the tree and collect actions.
+        action_list_class defaults to action.ActionList; pass action.ArrayActionList
+        for compact columnar storage of large jobs.
+        incremental=True reuses the actions cached by the last incremental call for every
+        clean subtree entered with the same state and root_matrix, only dirty nodes are
+        regenerated.'''
+        if action_list_class is None:
+            action_list_class = action.ActionList
+        al = action_list_class()
+        if incremental:
+            al.extend(self.generate_action_stream())
+        else:
+            al.extend(self.iter_actions())
         return al
 
+    def generate_action_stream(self):
+        '''regenerate the dirty parts of the tree and return the list of all non-skipped actions.
+        Every node visited records an ActionSpan of the new list. A clean node whose entry
+        key matches its span has its actions copied from the span (possibly from an older list)
+        and its state set to the span's exit state, without walking its subtree.
+        A span also keeps the entry state keys of the descendants with a state of their own, such as
+        the tool passes of a project, so changing one of those states regenerates its ancestors.
+        A subtree is assumed to only change the state of its root and the states of such descendants.'''
+        stream = []
+        last_state_keys = {}  # id(state): (checkpoint, state_key of the checkpoint)
+
+        def extend(actions):
+            stream.extend(elem for elem in actions if not elem.skip)
+
+        def current_key(state):
+            checkpoint = state.checkpoint()
+            last_state_key = last_state_keys.get(id(state))
+            if last_state_key is None or checkpoint is not last_state_key[0]:
+                last_state_key = last_state_keys[id(state)] = checkpoint, state_key(state)
+            return last_state_key[1]
+
+        def record(node, start, entry_key, exit_state, nested_keys):
+            if open_spans:
+                parent_start, parent_key, parent, parent_nested_keys = open_spans[-1]
+                parent_nested_keys.extend(nested_keys)
+                if node.state is not parent.state:
+                    parent_nested_keys.append((node.state, entry_key[0]))
+                node._action_span = ActionSpan(start - parent_start, len(stream) - parent_start,
+                                               entry_key, node.state, exit_state, nested_keys, parent=parent)
+            else:
+                node._action_span = ActionSpan(start, len(stream), entry_key, node.state, exit_state, nested_keys,
+                                               stream=stream)
+
+        def is_reusable(node, state, entry_key):
+            span = node._action_span
+            if node._dirty or span is None or span.state is not state or span.entry_key != entry_key:
+                return False
+            return all(current_key(nested_state) == key for nested_state, key in span.nested_keys)
+
+        def enter(node):
+            '''returns the children iterator for a regenerated node, None for a reused one'''
+            state = excursions.add(node.state)
+            entry_key = (current_key(state), node.root_matrix.tobytes())
+            if is_reusable(node, state, entry_key):
+                span = node._action_span
+                start = len(stream)
+                stream.extend(span.actions)
+                state.restore(span.exit_state)
+                record(node, start, entry_key, span.exit_state, span.nested_keys)
+                return None
+            actions = node.preorder_step()
+            open_spans.append((len(stream), entry_key, node, []))
+            extend(actions)
+            return iter(node.children)
+
+        def leave(node):
+            extend(node.postorder_step())
+            start, entry_key, node, nested_keys = open_spans.pop()
+            record(node, start, entry_key, node.state.checkpoint(), nested_keys)
+            node._dirty = False
+
+        with StateExcursions() as excursions:
+            open_spans = []  # (start, entry key, node, nested keys) of the regenerated nodes being walked
+            children = enter(self)
+            if children is not None:
+                stack = [(self, children)]
+                while stack:
+                    node, children = stack[-1]
+                    child = next(children, None)
+                    if child is None:
+                        stack.pop()
+                        leave(node)
+                    else:
+                        grandchildren = enter(child)
+                        if grandchildren is not None:
+                            stack.append((child, grandchildren))
+        return stream
+
+    def iter_actions(self, include_skipped=False):
+        '''walk the tree and yield each non-skipped action (every action with include_skipped=True)
+        as soon as it is generated.
+        The state of every node walked is restored once the generator is exhausted or closed.'''
+        with StateExcursions() as excursions:
+            for kind, node in self.walk():
+                if kind == tree.PREORDER:
+                    excursions.add(node.state)
+                    actions = node.preorder_step()
+                elif kind == tree.POSTORDER:
+                    actions = node.postorder_step()
+                else:
+                    continue
+                for elem in actions:
+                    if include_skipped or not elem.skip:
+                        yield elem
+
     @property
     def pos(self):
         return self.state['position']
@@ -79,6 +331,26 @@ class Assembly(tree.Tree, transform.TransformableMixin):
     def pos_offset(self, x=None, y=None, z=None):
         self.pos = self.pos.offset(x, y, z)
 
+    @property
+    def root_matrix(self):
+        '''composed 4x4 matrix of the transforms stacked all the way to the root.
+        Cached until a transform of this node or an ancestor changes, or the node is reparented.'''
+        if self._root_matrix is None:
+            mat = self.transforms.get_composition()
+            if isinstance(self.parent, Assembly):
+                mat = np.dot(mat, self.parent.root_matrix)
+                mat.setflags(write=False)
+            self._root_matrix = mat
+        return self._root_matrix
+
+    def apply_root_transforms(self, arr):
+        '''apply the transforms stacked all the way to the root to an (N, 3) array of points'''
+        return transform.apply_matrix(self.root_matrix, arr)
+
+    def apply_root_transforms_point(self, point):
+        '''apply the transforms stacked all the way to the root to a single Point'''
+        return pt.Point(*transform.apply_matrix_point(self.root_matrix, point.coords))
+
     @property
     def root_transforms(self):
         '''get transforms stacked all the way to the root'''
@@ -94,26 +366,31 @@ class Assembly(tree.Tree, transform.TransformableMixin):
 class SafeJog(Assembly):
     def __init__(self, x=0, y=0, z=0, name=None, parent=None, state=None):
         super().__init__(name=name, parent=parent, state=state)
-        self.dest = pt.PointList(((x, y, z), ))
+        self.dest = pt.Point(x, y, z)
 
     @property
     def point(self):
-        return pt.PointList(self.root_transforms(self.dest.arr))[0]
+        return self.apply_root_transforms_point(self.dest)
 
     @property
     def changes(self):
         return pt.changes(self.pos, self.point)
 
     def get_preorder_actions(self):
-        al = action.ActionList()
-        # print(self.changes)
-        if self.changes:
-            jog = partial(action.Jog, state=self.state)
-            al += jog(x=self.pos.x, y=self.pos.y, z=self.state['z_safe'])
-            al += jog(x=self.point.x, y=self.point.y, z=self.pos.z)
-            al += jog(x=self.point.x, y=self.point.y, z=self.point.z)
-            # print("safejog", self.state['position'])
-        return al
+        return safe_jog_actions(self.state, self.point)
+
+
+def safe_jog_actions(state, point):
+    '''jog up to z_safe, over to point, then down to point.
+    point is in world coordinates. Returns an empty list when already at point.'''
+    al = action.ActionList()
+    pos = state['position']
+    if pt.changes(pos, point):
+        jog = partial(action.Jog, state=state)
+        al += jog(x=pos.x, y=pos.y, z=state['z_safe'])
+        al += jog(x=point.x, y=point.y, z=state['position'].z)
+        al += jog(x=point.x, y=point.y, z=point.z)
+    return al
 
 
 class SafeZ(Assembly):
@@ -122,8 +399,7 @@ class SafeZ(Assembly):
 
     def get_preorder_actions(self):
         al = action.ActionList()
-        points = pt.PointList(((0, 0, self.state['z_margin']), ))
-        point = pt.PointList(self.root_transforms(points.arr))[0]
+        point = self.apply_root_transforms_point(pt.Point(0, 0, self.state['z_margin']))
         jog = partial(action.Jog, state=self.state)
         al += jog(x=self.pos.x, y=self.pos.y, z=self.state['z_safe'])
         return al
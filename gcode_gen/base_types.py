@@ -2,14 +2,21 @@
 
 
 class Named(object):
+    '''name defaults to default_name, which is only computed when the name is read'''
     def __init__(self, name=None):
         super().__init__()
-        if name is None:
-            self.name = self.default_name
-        else:
-            self.name = name
+        self._name = name
+
+    @property
+    def name(self):
+        if self._name is None:
+            return self.default_name
+        return self._name
+
+    @name.setter
+    def name(self, name):
+        self._name = name
 
     @property
     def default_name(self):
         return repr(self)
-
@@ -1,10 +1,11 @@
 from functools import partial
+import numpy as np
 from . import number
-from . import iter_util
 from . import point as pt
 from . import action
 from . import poly
-from .assembly import Assembly, SafeJog
+from . import transform
+from .assembly import Assembly, SafeJog, safe_jog_actions
 
 
 class UnsafeDrill(Assembly):
@@ -15,13 +16,10 @@ class UnsafeDrill(Assembly):
     def get_preorder_actions(self):
         al = action.ActionList()
         al += action.SetDrillFeedRate(self.state)
-        points = pt.PointList()
-        points.append(pt.Point(0, 0, -self.depth))
-        points.append(pt.Point(0, 0, 0))
-        points = pt.PointList(self.root_transforms(points.arr))
+        bottom, top = self.apply_root_transforms(np.array(((0, 0, -self.depth), (0, 0, 0)), dtype=np.float64))
         cut = partial(action.Cut, state=self.state)
-        al += cut(*(points[0].arr))
-        al += cut(*(points[1].arr))
+        al += cut(*bottom)
+        al += cut(*top)
         return al
 
 
@@ -43,6 +41,10 @@ class Drill(Assembly):
     def update_children_postorder(self):
         self.children = []
 
+    def travel_endpoints(self):
+        xy = self.apply_root_transforms_point(pt.Point()).xyz[:2]
+        return xy, xy
+
 
 CUT_STYLES = ('outside-cut',  # compensate for tool diameter for an OUTSIDE cut
               'inside-cut',   # compensate for tool diameter for an INSIDE cut
@@ -56,14 +58,30 @@ class UnsafeMill(Assembly):
         self.dest = pt.Point(x, y, z)
 
     def get_preorder_actions(self):
-        al = action.ActionList()
-        al += action.SetMillFeedRate(self.state)
-        points = pt.PointList()
-        points.append(self.dest)
-        points = pt.PointList(self.root_transforms(points.arr))
-        cut = partial(action.Cut, state=self.state)
-        al += cut(*(points[0].arr))
-        return al
+        return unsafe_mill_actions(self.state, self.apply_root_transforms_point(self.dest))
+
+
+def unsafe_mill_actions(state, point):
+    '''set the milling feed rate and cut straight to point (in world coordinates)'''
+    al = action.ActionList()
+    al += action.SetMillFeedRate(state)
+    al += action.Cut(*point.coords, state=state)
+    return al
+
+
+def cut_actions(state, xyz):
+    '''set the milling feed rate and cut through each row of an (N, 3) array (in world coordinates),
+    as one MotionBlock'''
+    al = action.ActionList()
+    al += action.SetMillFeedRate(state)
+    al += action.MotionBlock(xyz, action.Cut, state=state)
+    return al
+
+
+def mill_actions(state, xyz):
+    '''set the milling feed rate and cut along xyz[1:] (an (N, 3) array in world coordinates).
+    xyz[0] is where the cut starts, the caller moves there first.'''
+    return cut_actions(state, xyz[1:])
 
 
 class Mill(Assembly):
@@ -78,27 +96,28 @@ class Mill(Assembly):
         self += SafeJog(*(self.vertices[0]))
 
     def get_postorder_actions(self):
-        # print('get_preorder_actions')
-        al = action.ActionList()
-        # print(self.state['position'])
-        al += action.SetMillFeedRate(self.state)
-        points = pt.PointList(self.root_transforms(self.vertices.arr))
-        for point in points[1:]:
-            cut = partial(action.Cut, state=self.state)
-            al += cut(*(point.arr))
-        return al
+        return mill_actions(self.state, self.apply_root_transforms(self.vertices.arr))
 
     def update_children_postorder(self):
         self.children = []
 
+    def travel_endpoints(self):
+        ends = self.apply_root_transforms(self.vertices.arr[[0, -1]])
+        return ends[0, :2], ends[1, :2]
+
 
 class Polygon(Assembly):
-    '''repeatedly cut (simple) polygon to depth.'''
+    '''repeatedly cut (simple) polygon to depth.
+    The perimeter passes start and end at vertex start_vertex of the cut polygon.'''
+    _cut_poly_cache = None  # (key, cut polygon), see get_cut_poly()
+    _fill_cache = None  # (key, (fill vertices, is_mills)), see get_fill()
+
     def __init__(self,
                  vertices,
                  depth,
                  cut_style,
                  is_filled,
+                 start_vertex=0,
                  name=None, parent=None, state=None):
         super().__init__(name=name, parent=parent, state=state)
         self.depth = depth
@@ -109,62 +128,122 @@ class Polygon(Assembly):
             raise TypeError('is_filled must be bool; given arg {}'.format(is_filled))
         self.is_filled = is_filled
         self.poly = poly.SimplePolygon(vertices)
+        self.start_vertex = start_vertex
 
-    def update_children_preorder(self):
-        pre_children_len = len(self.children)
+    def get_preorder_actions(self):
+        '''The xy paths are transformed once, in one batched call, then each depth pass substitutes its z:
+        M * (x, y, z, 1) == M * (x, y, 0, 1) + z * M[:3, 2]
+        Produces the same actions as one SafeJog/UnsafeMill/Mill node per vertex per pass.'''
+        al = action.ActionList()
+        state = self.state
+        z_margin = state['z_margin']
         cut_poly = self.get_cut_poly()
-        perimeter_verts = list(iter_util.all_plus_first_iter(cut_poly))
+        perimeter = self.get_perimeter(cut_poly)
+        root_matrix = self.root_matrix
+        z_axis = root_matrix[:3, 2]
+        # the perimeter Mill is translated in z after the polygon transforms are applied
+        paths = [xy_only(perimeter), perimeter]
         if self.is_filled:
-            max_spacing = self.state['tool'].cut_diameter * (1 - self.state['milling_overlap'])
-            fill_verts, is_mills = poly.fill.calc_polygon_fill_vertices(cut_poly, max_spacing)
-            self += SafeJog(x=fill_verts[0].x, y=fill_verts[0].y, z=self.state['z_margin'])
-            # print(is_mills)
-            # from gcode_gen.poly.plot import plot_poly_and_fill_lines
-            # plot_poly_and_fill_lines(cut_poly, (fill_verts, is_mills))
-        else:
-            self += SafeJog(x=perimeter_verts[0].x, y=perimeter_verts[0].y, z=self.state['z_margin'])
-        #
-        depth_per_pass = self.state['depth_per_milling_pass']
+            fill_verts, is_mills = self.get_fill(cut_poly)
+            paths.append(xy_only(fill_verts.arr))
+        perimeter_xy, perimeter_mill, *fill_paths = transform.apply_matrix_each((root_matrix, ) * len(paths),
+                                                                                paths)
+        depth_per_pass = state['depth_per_milling_pass']
         z_cut_steps = number.calc_steps_with_max_spacing(0, -self.depth, depth_per_pass)
+
+        def at_z(xy, z):
+            return pt.Point(*(xy + z * z_axis))
+
+        def mill_perimeter(z_cut_step):
+            xyz = perimeter_mill + (0, 0, z_cut_step)
+            al.extend(unsafe_mill_actions(state, at_z(perimeter_xy[0], z_cut_step)))
+            al.extend(safe_jog_actions(state, pt.Point(*xyz[0])))
+            al.extend(mill_actions(state, xyz))
+
         if self.is_filled:
+            fill_xy, = fill_paths
+            is_convex = cut_poly.is_convex()
+            # the fill is cut in runs of mills, each run after the first starts with a safe jog
+            run_starts = [0] + [index for index, is_mill in enumerate(is_mills) if not is_mill and index > 0]
+            runs = list(zip(run_starts, run_starts[1:] + [len(is_mills)]))
+            al.extend(safe_jog_actions(state, at_z(fill_xy[0], z_margin)))
             last_z_cut_step = 0
             for z_cut_step in z_cut_steps:
-                if cut_poly.is_convex():
-                    self += UnsafeMill(fill_verts[0].x, fill_verts[0].y, last_z_cut_step)
+                fill_cuts = fill_xy + z_cut_step * z_axis
+                fill_jogs = fill_xy + (z_cut_step + z_margin) * z_axis
+                if is_convex:
+                    al.extend(unsafe_mill_actions(state, at_z(fill_xy[0], last_z_cut_step)))
                 else:
-                    self += SafeJog(fill_verts[0].x, fill_verts[0].y, z_cut_step + self.state['z_margin'])
-                for (fill_vert, is_mill), first in iter_util.is_first_tup(zip(fill_verts, is_mills)):
-                    if is_mill:
-                        self += UnsafeMill(fill_vert.x, fill_vert.y, z_cut_step)
-                    else:
-                        if not first:
-                            self += SafeJog(fill_vert.x, fill_vert.y,
-                                            z=z_cut_step + self.state['z_margin'])
-                        self += UnsafeMill(fill_vert.x, fill_vert.y, z_cut_step)
-                    first_vert = False
-                if not cut_poly.is_convex():
-                    self += SafeJog(perimeter_verts[0].x, perimeter_verts[0].y,
-                                    z=z_cut_step + self.state['z_margin'])
-                self += UnsafeMill(perimeter_verts[0].x, perimeter_verts[0].y, z_cut_step)
-                self += Mill(vertices=perimeter_verts).translate(z=z_cut_step)
+                    al.extend(safe_jog_actions(state, pt.Point(*fill_jogs[0])))
+                for start, stop in runs:
+                    if start > 0:
+                        al.extend(safe_jog_actions(state, pt.Point(*fill_jogs[start])))
+                    al.extend(cut_actions(state, fill_cuts[start:stop]))
+                if not is_convex:
+                    al.extend(safe_jog_actions(state, at_z(perimeter_xy[0], z_cut_step + z_margin)))
+                mill_perimeter(z_cut_step)
                 last_z_cut_step = z_cut_step
         else:
+            al.extend(safe_jog_actions(state, at_z(perimeter_xy[0], z_margin)))
             for z_cut_step in z_cut_steps:
-                self += UnsafeMill(perimeter_verts[0].x, perimeter_verts[0].y, z_cut_step)
-                self += Mill(vertices=perimeter_verts).translate(z=z_cut_step)
-        return ()
+                mill_perimeter(z_cut_step)
+        return al
 
-    def update_children_postorder(self):
-        self.children = []
+    def get_perimeter(self, cut_poly):
+        '''closed (N + 1, 3) path around cut_poly starting and ending at start_vertex'''
+        verts = np.roll(cut_poly.arr, -self.start_vertex, axis=0)
+        return np.concatenate((verts, verts[:1]))
+
+    def get_fill(self, cut_poly):
+        '''fill vertices and is_mills of cut_poly, see poly.fill.calc_polygon_fill_vertices().
+        Cached until cut_poly or the spacing changes, travel_options() needs it for every order.'''
+        max_spacing = self.state['tool'].cut_diameter * (1 - self.state['milling_overlap'])
+        key = (cut_poly.arr.tobytes(), max_spacing)
+        if self._fill_cache is None or self._fill_cache[0] != key:
+            self._fill_cache = (key, poly.fill.calc_polygon_fill_vertices(cut_poly, max_spacing))
+        return self._fill_cache[1]
+
+    def travel_options(self):
+        '''one (entry, exit) pair per vertex of the cut polygon, for each start_vertex.
+        The perimeter starts and ends at that vertex, a filled polygon enters at its fill.'''
+        cut_poly = self.get_cut_poly()
+        verts = self.apply_root_transforms(xy_only(cut_poly.arr))[:, :2]
+        if self.is_filled:
+            fill_verts, is_mills = self.get_fill(cut_poly)
+            entry = self.apply_root_transforms(xy_only(fill_verts.arr[:1]))[0, :2]
+            return [(entry, vert) for vert in verts]
+        return [(vert, vert) for vert in verts]
+
+    def travel_endpoints(self):
+        return self.travel_options()[self.start_vertex]
+
+    def travel_choice(self):
+        return self.start_vertex
+
+    def set_travel_option(self, index):
+        if index != self.start_vertex:
+            self.start_vertex = index
 
     def get_cut_poly(self):
+        '''the polygon the tool follows, cached until the polygon, cut style or tool changes'''
         tool_dia = self.state['tool'].cut_diameter
-        if self.cut_style == 'outside-cut':
-            return self.poly.grow(tool_dia)
-        elif self.cut_style == 'inside-cut':
-            return self.poly.shrink(tool_dia)
-        else:
-            return self.poly
+        key = (self.cut_style, tool_dia, self.poly.arr.tobytes())
+        if self._cut_poly_cache is None or self._cut_poly_cache[0] != key:
+            if self.cut_style == 'outside-cut':
+                cut_poly = self.poly.grow(tool_dia)
+            elif self.cut_style == 'inside-cut':
+                cut_poly = self.poly.shrink(tool_dia)
+            else:
+                cut_poly = self.poly
+            self._cut_poly_cache = (key, cut_poly)
+        return self._cut_poly_cache[1]
+
+
+def xy_only(arr):
+    '''copy of an (N, 3) array of points with z set to zero'''
+    result = np.array(arr, dtype=np.float64)
+    result[:, 2] = 0
+    return result
 
 
 class Cylinder(Polygon):
@@ -0,0 +1,190 @@
+'''Cycle time estimation with a GRBL-like motion planner.
+
+Motions are read from the columns of an action.ArrayActionList:
+  - cuts run at the feed rate in effect, jogs at the rapid rate, both capped by the
+    per-axis max rates;
+  - every segment accelerates and decelerates at the highest rate its axes allow;
+  - the speed through the junction between two segments is limited by the junction
+    deviation, like GRBL.
+The planner's backward (deceleration) and forward (acceleration) passes over squared speeds
+are min-plus recurrences, w[i] = min(limit[i], w[i + 1] + 2 * a * length), each solved in one
+vectorized scan: a cumulative minimum over prefix sums.
+Homing, dwell and spindle spin up times are not estimated.
+'''
+import numpy as np
+from . import action
+from . import tree
+from .assembly import StateExcursions
+
+DEFAULT_MAX_RATES = (5000.0, 5000.0, 1500.0)  # mm/min for x, y, z
+DEFAULT_ACCELERATIONS = (400.0, 400.0, 50.0)  # mm/s^2 for x, y, z
+DEFAULT_JUNCTION_DEVIATION = 0.01  # mm
+MIN_SEGMENT_LENGTH = 1e-9
+
+
+class MachineLimits(object):
+    '''motion limits of the machine, in the units of the gcode (usually mm) and minutes for rates
+    like gcode feed rates, seconds for accelerations'''
+    def __init__(self,
+                 max_rates=DEFAULT_MAX_RATES,
+                 accelerations=DEFAULT_ACCELERATIONS,
+                 junction_deviation=DEFAULT_JUNCTION_DEVIATION):
+        self.max_rates = np.array(max_rates, dtype=np.float64).reshape(3)
+        self.accelerations = np.array(accelerations, dtype=np.float64).reshape(3)
+        self.junction_deviation = junction_deviation
+
+
+def limit_by_axes(limits, unit_vecs):
+    '''largest value along each row of unit_vecs that keeps every axis within limits,
+    like GRBL's limit_value_by_axis_maximum'''
+    components = np.abs(unit_vecs)
+    with np.errstate(divide='ignore'):
+        per_axis = np.where(components > 0, limits / components, np.inf)
+    return np.min(per_axis, axis=1)
+
+
+def min_plus_backward(limits, costs):
+    '''w[i] = min(limits[i], w[i + 1] + costs[i]) with w[-1] = limits[-1], for len(costs) + 1 limits'''
+    sums = np.concatenate(((0.0, ), np.cumsum(costs)))
+    return np.minimum.accumulate((limits + sums)[::-1])[::-1] - sums
+
+
+def min_plus_forward(limits, costs):
+    '''w[i] = min(limits[i], w[i - 1] + costs[i - 1]) with w[0] = limits[0], for len(costs) + 1 limits'''
+    sums = np.concatenate(((0.0, ), np.cumsum(costs)))
+    return np.minimum.accumulate(limits - sums) + sums
+
+
+def segment_times(lengths, nominal, accel, entry, exit):
+    '''seconds for trapezoid (or triangle) speed profiles, all arguments are arrays of speeds in
+    units per second, accelerations in units per second squared'''
+    accel_dist = (nominal ** 2 - entry ** 2) / (2 * accel)
+    decel_dist = (nominal ** 2 - exit ** 2) / (2 * accel)
+    cruise_dist = lengths - accel_dist - decel_dist
+    trapezoid = (nominal - entry) / accel + (nominal - exit) / accel + np.maximum(cruise_dist, 0) / nominal
+    peak = np.sqrt(np.maximum((2 * accel * lengths + entry ** 2 + exit ** 2) / 2, 0))
+    peak = np.maximum(peak, np.maximum(entry, exit))
+    triangle = (2 * peak - entry - exit) / accel
+    return np.where(cruise_dist >= 0, trapezoid, triangle)
+
+
+def is_planner_stop(elem):
+    '''True for state changes the machine finishes its motions for, anything but a feed rate'''
+    return not isinstance(elem, action.SetFeedRate)
+
+
+def row_seconds(action_list, limits=None, start=None):
+    '''estimated seconds spent on each row of an ArrayActionList, zero for non-motion rows.
+    Arcs are planned as the chords the machine cuts them with (see ArrayActionList.linear_rows()).
+    start is the position before the first row, by default where the first row is.'''
+    if limits is None:
+        limits = MachineLimits()
+    count = len(action_list)
+    seconds = np.zeros(count)
+    if count == 0:
+        return seconds
+    if start is None:
+        start = action_list.xyz[0]
+    sources, xyz = action_list.linear_rows(start)
+    starts = np.concatenate((np.asarray(start, dtype=np.float64).reshape(1, 3), xyz[:-1]))
+    vecs = xyz - starts
+    lengths = np.sqrt(np.einsum('ij,ij->i', vecs, vecs))
+    opcodes = action_list.opcodes[sources]
+    moves = np.flatnonzero((opcodes != action.OP_STATE) & (lengths > MIN_SEGMENT_LENGTH))
+    if len(moves) == 0:
+        return seconds
+    rows = sources[moves]
+    # a planner stop between two segments brings the machine to rest
+    stops = np.zeros(count, dtype=np.int64)
+    for index, elem in action_list.objects.items():
+        stops[index] = is_planner_stop(elem)
+    stop_counts = np.cumsum(stops)[rows]
+    lengths = lengths[moves]
+    unit_vecs = vecs[moves] / lengths[:, np.newaxis]
+    rapid = limit_by_axes(limits.max_rates, unit_vecs) / 60
+    feed_rates = action_list.feed_rates[rows] / 60
+    is_cut = opcodes[moves] != action.OP_JOG
+    nominal = np.where(is_cut & ~np.isnan(feed_rates), np.fmin(feed_rates, rapid), rapid)
+    accel = limit_by_axes(limits.accelerations, unit_vecs)
+    # squared junction speed limits, the job starts and ends at rest
+    prev_vecs, next_vecs = unit_vecs[:-1], unit_vecs[1:]
+    cos_theta = -np.einsum('ij,ij->i', prev_vecs, next_vecs)
+    junction_vecs = next_vecs - prev_vecs
+    junction_lengths = np.sqrt(np.einsum('ij,ij->i', junction_vecs, junction_vecs))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        junction_accel = limit_by_axes(limits.accelerations, junction_vecs / junction_lengths[:, np.newaxis])
+        sin_theta_d2 = np.sqrt(np.maximum(0.5 * (1 - cos_theta), 0))
+        junction = junction_accel * limits.junction_deviation * sin_theta_d2 / (1 - sin_theta_d2)
+    junction = np.where(cos_theta > 0.999999, 0, np.where(cos_theta < -0.999999, np.inf, junction))
+    junction = np.minimum(junction, np.minimum(nominal[:-1], nominal[1:]) ** 2)
+    junction[stop_counts[1:] != stop_counts[:-1]] = 0
+    speed_limits = np.concatenate(((0.0, ), junction, (0.0, )))
+    costs = 2 * accel * lengths
+    squared = min_plus_forward(min_plus_backward(speed_limits, costs), costs)
+    speeds = np.sqrt(np.maximum(squared, 0))
+    times = segment_times(lengths, nominal, accel, speeds[:-1], speeds[1:])
+    return np.bincount(rows, weights=times, minlength=count)
+
+
+def estimate_actions(actions, limits=None, start=None):
+    '''estimated seconds to run actions (an ActionList or ArrayActionList)'''
+    if not isinstance(actions, action.ArrayActionList):
+        actions = action.ArrayActionList(actions)
+    return float(np.sum(row_seconds(actions, limits, start)))
+
+
+class NodeEstimate(object):
+    '''estimated seconds for the actions of node and its subtree, with one NodeEstimate per child.
+    Children include nodes generated during the walk, such as the SafeJog of a Drill.'''
+    def __init__(self, node, seconds=0.0):
+        self.node = node
+        self.seconds = seconds
+        self.children = []
+
+    @property
+    def name(self):
+        return self.node.name
+
+    def walk(self, depth=0):
+        '''yield (depth, NodeEstimate) for this estimate and every one below it, depth first'''
+        yield depth, self
+        for child in self.children:
+            yield from child.walk(depth + 1)
+
+    def format(self, max_depth=None):
+        lines = []
+        for depth, node_estimate in self.walk():
+            if max_depth is None or depth <= max_depth:
+                lines.append('{}{}: {:.1f}s'.format('  ' * depth, node_estimate.name, node_estimate.seconds))
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.format(max_depth=2)
+
+
+def estimate(root, limits=None):
+    '''walk root like Assembly.iter_actions() and estimate the cycle time of every node.
+    For a project.Project, the children of the result are the tool passes.
+    The state of every node walked is restored afterwards.
+    Returns a NodeEstimate.'''
+    al = action.ArrayActionList()
+    spans = []  # (node estimate, first row) of the nodes being walked
+    finished = []  # (node estimate, first row, stop row)
+    start = root.state['position'].xyz
+    with StateExcursions() as excursions:
+        for kind, node in root.walk():
+            if kind == tree.PREORDER:
+                excursions.add(node.state)
+                node_estimate = NodeEstimate(node)
+                if spans:
+                    spans[-1][0].children.append(node_estimate)
+                spans.append((node_estimate, len(al)))
+                al.extend(node.preorder_step())
+            elif kind == tree.POSTORDER:
+                al.extend(node.postorder_step())
+                node_estimate, first = spans.pop()
+                finished.append((node_estimate, first, len(al)))
+    totals = np.concatenate(((0.0, ), np.cumsum(row_seconds(al, limits, start))))
+    for node_estimate, first, stop in finished:
+        node_estimate.seconds = float(totals[stop] - totals[first])
+    return finished[-1][0]
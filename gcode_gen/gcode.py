@@ -1,20 +1,27 @@
 '''
 Library for gcode commands objects that render to strings.
 '''
-from .number import num2str
+import numpy as np
+from .number import num2str, NUM2STR_FORMAT
 from .point import XYZ
 
+AXIS_LABELS = ('X', 'Y', 'Z')
+
 
 class GcodePoint(XYZ):
+    __slots__ = ()
+
     def __str__(self):
         ret_list = []
-        for label, val in zip(('X', 'Y', 'Z'), self.xyz):
+        for label, val in zip(('X', 'Y', 'Z'), self.coords):
             if val is not None:
                 ret_list.append('{}{}'.format(label, num2str(val)))
         return ' '.join(ret_list)
 
 
 class BaseGcode(object):
+    __slots__ = ('cmd', 'point')
+
     def __init__(self, cmd, x=None, y=None, z=None):
         super().__init__()
         self.cmd = cmd
@@ -29,36 +36,48 @@ class BaseGcode(object):
 
 class Home(BaseGcode):
     '''homing cycle'''
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('$H')
 
 
 class Comment(BaseGcode):
     '''comment'''
+    __slots__ = ()
+
     def __str__(self):
         return '({})'.format(self.cmd)
 
 
 class UnitsInches(BaseGcode):
     '''Set system units to inches'''
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('G20')
 
 
 class UnitsMillimeters(BaseGcode):
     '''Set system units to millimeters'''
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('G21')
 
 
 class MotionAbsolute(BaseGcode):
     '''Set system to use absolute motion'''
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('G90')
 
 
 class MotionRelative(BaseGcode):
     '''Set system to use relative motion'''
+    __slots__ = ()
+
     def __init__(self):
         raise Exception('Not supported!!')
         # super().__init__('G91')
@@ -66,12 +85,16 @@ class MotionRelative(BaseGcode):
 
 class SetSpindleSpeed(BaseGcode):
     '''Set spindle rotation speed'''
+    __slots__ = ()
+
     def __init__(self, spindle_speed):
         super().__init__('S {}'.format(spindle_speed))
 
 
 class SetFeedRate(BaseGcode):
     '''set feed rate.  CAUTION: feed rate is system units per minute'''
+    __slots__ = ('feedRate', )
+
     def __init__(self, feedRate):
         self.feedRate = feedRate
         super().__init__('F {}'.format(num2str(feedRate)))
@@ -79,29 +102,39 @@ class SetFeedRate(BaseGcode):
 
 class ActivateSpindleCW(BaseGcode):
     '''Activate spindle (clockwise)'''
+    __slots__ = ()
+
     def __init__(self, ):
         super().__init__('M3')
 
 
 class StopSpindle(BaseGcode):
     '''Stop spindle'''
+    __slots__ = ()
+
     def __init__(self, ):
         super().__init__('M5')
 
 
 class G0(BaseGcode):
     '''linear NONcut motion'''
+    __slots__ = ()
+
     def __init__(self, x=None, y=None, z=None):
         super().__init__('G0', x, y, z)
 
 
 class G1(BaseGcode):
     '''linear CUT motion'''
+    __slots__ = ()
+
     def __init__(self, x=None, y=None, z=None):
         super().__init__('G1', x, y, z)
 
 
 class BaseArcGcode(BaseGcode):
+    __slots__ = ('radius', )
+
     def __init__(self, cmd, x=None, y=None, z=None, r=None):
         assert r is not None
         # need at least one rectangular coordinate
@@ -115,12 +148,40 @@ class BaseArcGcode(BaseGcode):
 
 class G2(BaseArcGcode):
     '''clockwise arc CUT motion'''
+    __slots__ = ()
+
     def __init__(self, x=None, y=None, z=None, r=None):
         super().__init__('G2', x, y, z, r)
 
 
 class G3(BaseArcGcode):
-    '''clockwise arc CUT motion'''
+    '''counterclockwise arc CUT motion'''
+    __slots__ = ()
+
     def __init__(self, x=None, y=None, z=None, r=None):
         super().__init__('G3', x, y, z, r)
 
+
+def motion_lines(cmds, xyz, emit, radii=None):
+    '''Render a block of motions to gcode lines using whole-array passes.
+    args:
+      cmds: one command string per motion, for example 'G0' or 'G1'
+      xyz: (N, 3) array of motion coordinates
+      emit: (N, 3) bool array, True where the axis word is written (modal axes are suppressed)
+      radii: optional (N, ) array of the R words of arcs, nan for other motions
+    result:
+      list of strings, identical to str(BaseGcode(cmd, x, y, z)) (or of a BaseArcGcode) with
+      unemitted axes set to None'''
+    cmds = np.asarray(cmds, dtype=object)
+    words = np.full(xyz.shape, '', dtype=object)
+    for axis, label in enumerate(AXIS_LABELS):
+        column = emit[:, axis]
+        word_format = ' {}{}'.format(label, NUM2STR_FORMAT).format
+        words[column, axis] = list(map(word_format, xyz[column, axis].tolist()))
+    lines = cmds + words[:, 0] + words[:, 1] + words[:, 2]
+    if radii is not None:
+        is_arc = ~np.isnan(radii)
+        if np.any(is_arc):
+            radius_format = ' R{}'.format(NUM2STR_FORMAT).format
+            lines[is_arc] += np.array(list(map(radius_format, radii[is_arc].tolist())), dtype=object)
+    return lines.tolist()
@@ -0,0 +1,468 @@
+'''Travel order optimization: reorder position independent siblings (such as drills, mills and
+polygons) to shorten the rapids between them.
+
+Each node is reduced to its travel options: the x/y places where it can be entered and left
+(see Assembly.travel_options()).  The order is planned with a nearest neighbor tour over the
+entries, found with a GridIndex.  When every node is left where it is entered the tour is
+improved by 2-opt and Or-opt moves restricted to the nearest neighbors of each location.
+'''
+import math
+import time
+import numpy as np
+from . import tree
+
+DEFAULT_RAPID_RATE = 5000.0  # mm/min, only used to estimate the time saved
+
+
+class GridIndex(object):
+    '''uniform grid over 2-d points for nearest neighbor queries.
+    Points can be removed, which is what a nearest neighbor tour needs.'''
+    def __init__(self, xy, cell_size=None):
+        xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        self.xs = xy[:, 0].tolist()
+        self.ys = xy[:, 1].tolist()
+        count = len(self.xs)
+        self.origin = xy.min(axis=0) if count else np.zeros(2)
+        span = float(np.max(np.ptp(xy, axis=0))) if count else 0.0
+        if cell_size is None:
+            # about one point per cell
+            cell_size = span / math.sqrt(count) if count else 1.0
+        self.cell_size = cell_size if cell_size > 0 else 1.0
+        keys = np.floor((xy - self.origin) / self.cell_size).astype(np.int64)
+        self.max_ring = int(keys.max()) + 1 if count else 0
+        self.cell_keys = list(map(tuple, keys.tolist()))
+        self.cells = {}
+        for index, key in enumerate(self.cell_keys):
+            self.cells.setdefault(key, []).append(index)
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def remove(self, index):
+        self.cells[self.cell_keys[index]].remove(index)
+        self.count -= 1
+
+    def _key(self, x, y):
+        return (int(math.floor((x - self.origin[0]) / self.cell_size)),
+                int(math.floor((y - self.origin[1]) / self.cell_size)))
+
+    def _ring(self, center, ring):
+        '''indices in the cells at chebyshev distance ring from the center cell'''
+        cx, cy = center
+        cells = self.cells
+        if ring == 0:
+            yield from cells.get(center, ())
+            return
+        for dx in range(-ring, ring + 1):
+            yield from cells.get((cx + dx, cy - ring), ())
+            yield from cells.get((cx + dx, cy + ring), ())
+        for dy in range(-ring + 1, ring):
+            yield from cells.get((cx - ring, cy + dy), ())
+            yield from cells.get((cx + ring, cy + dy), ())
+
+    def k_nearest(self, x, y, k, exclude=None):
+        '''up to k (distance, index) pairs nearest to x/y, closest first'''
+        center = self._key(x, y)
+        # the query may be outside the grid, rings must reach every cell
+        max_ring = self.max_ring + max(abs(center[0]), abs(center[1]))
+        xs, ys = self.xs, self.ys
+        found = []
+        for ring in range(max_ring + 1):
+            for index in self._ring(center, ring):
+                if index != exclude:
+                    found.append((math.hypot(xs[index] - x, ys[index] - y), index))
+            # points in further rings are at least ring * cell_size away
+            if len(found) >= k:
+                found.sort()
+                if found[k - 1][0] <= ring * self.cell_size:
+                    break
+        found.sort()
+        return found[:k]
+
+    def nearest(self, x, y):
+        '''index of the point nearest to x/y, None when the index is empty'''
+        if self.count == 0:
+            return None
+        return self.k_nearest(x, y, 1)[0][1]
+
+
+def path_length(xy, order, start=None):
+    '''length of the path through xy[order], from start (an x/y pair) when given'''
+    xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)[list(order)]
+    if start is not None:
+        xy = np.concatenate(((start[:2], ), xy))
+    if len(xy) < 2:
+        return 0.0
+    return float(np.sum(np.hypot(*np.diff(xy, axis=0).T)))
+
+
+def nearest_neighbor_order(xy, start=None, index=None):
+    '''visit order of the rows of xy, always going to the nearest unvisited point.
+    Starts from start (an x/y pair), or with row 0 when start is None.'''
+    if index is None:
+        index = GridIndex(xy)
+    count = len(index.xs)
+    if count == 0:
+        return []
+    order = []
+    if start is None:
+        current = 0
+    else:
+        current = index.nearest(start[0], start[1])
+    while True:
+        order.append(current)
+        index.remove(current)
+        if len(order) == count:
+            return order
+        current = index.nearest(index.xs[current], index.ys[current])
+
+
+def past(deadline, step=0):
+    '''True once time.perf_counter() passes deadline (never for None), only checked every 64 steps'''
+    return deadline is not None and step % 64 == 0 and time.perf_counter() >= deadline
+
+
+class _Tour(object):
+    '''open path with a fixed first location, for in place 2-opt and Or-opt moves.
+    Location count (the last one) is the start; without a start, the first point is kept first.'''
+    def __init__(self, xy, order, start):
+        self.xs = xy[:, 0].tolist()
+        self.ys = xy[:, 1].tolist()
+        if start is None:
+            self.path = list(order)
+        else:
+            self.xs.append(float(start[0]))
+            self.ys.append(float(start[1]))
+            self.path = [len(xy)] + list(order)
+        self.update_positions()
+
+    def update_positions(self):
+        self.positions = [0] * len(self.xs)
+        for position, location in enumerate(self.path):
+            self.positions[location] = position
+
+    def dist(self, location0, location1):
+        return math.hypot(self.xs[location0] - self.xs[location1], self.ys[location0] - self.ys[location1])
+
+    def edge(self, position):
+        '''length of the edge from path[position] to the next location, 0 past the end'''
+        if position < 0 or position + 1 >= len(self.path):
+            return 0.0
+        return self.dist(self.path[position], self.path[position + 1])
+
+    def two_opt(self, neighbors, deadline=None):
+        '''apply improving segment reversals, returns the number applied'''
+        path = self.path
+        last = len(path) - 1
+        applied = 0
+        for position in range(last):
+            if past(deadline, position):
+                break
+            location = path[position]
+            next_location = path[position + 1]
+            current = self.dist(location, next_location)
+            for new_edge, other in neighbors[location]:
+                if new_edge >= current:
+                    break
+                other_position = self.positions[other]
+                if other_position <= position + 1:
+                    continue
+                # reverse path[position + 1:other_position + 1]
+                delta = new_edge - current - self.edge(other_position)
+                if other_position < last:
+                    delta += self.dist(next_location, path[other_position + 1])
+                if delta < -1e-9:
+                    path[position + 1:other_position + 1] = path[position + 1:other_position + 1][::-1]
+                    for moved in range(position + 1, other_position + 1):
+                        self.positions[path[moved]] = moved
+                    applied += 1
+                    break
+        return applied
+
+    def or_opt(self, neighbors, deadline=None, max_segment=3):
+        '''move segments of up to max_segment locations next to a neighbor of one of their ends,
+        possibly reversed.  Returns the number of moves applied.'''
+        path = self.path
+        positions = self.positions
+        dist = self.dist
+        applied = 0
+        for length in range(1, max_segment + 1):
+            position = 1
+            while position + length <= len(path):
+                if past(deadline, position):
+                    return applied
+                first, last = position, position + length - 1
+                has_next = last + 1 < len(path)
+                remove_gain = self.edge(first - 1) + self.edge(last)
+                if has_next:
+                    remove_gain -= dist(path[first - 1], path[last + 1])
+                best = None
+                for end, other_end in ((path[first], path[last]), (path[last], path[first])):
+                    for distance, other in neighbors[end]:
+                        if distance >= remove_gain:
+                            break
+                        other_position = positions[other]
+                        if first <= other_position <= last:
+                            continue
+                        # end next to other, with other_end next to the location after or before other
+                        for side in (1, -1):
+                            side_position = other_position + side
+                            if first <= side_position <= last:
+                                # once the segment is removed, other is next to the location beyond it
+                                side_position = last + 1 if side == 1 else first - 1
+                            if 0 <= side_position < len(path):
+                                side_location = path[side_position]
+                                add = distance + dist(other_end, side_location) - dist(other, side_location)
+                            elif side == 1:
+                                add = distance
+                            else:
+                                continue
+                            if add < remove_gain - 1e-9 and (best is None or add < best[0]):
+                                best = (add, other, side, end)
+                if best is None:
+                    position += 1
+                    continue
+                add, other, side, end = best
+                segment = path[first:last + 1]
+                if (side == 1) != (end == segment[0]):
+                    segment.reverse()
+                del path[first:last + 1]
+                other_position = positions[other]
+                if other_position > last:
+                    other_position -= length
+                insert_at = other_position + 1 if side == 1 else other_position
+                path[insert_at:insert_at] = segment
+                for moved in range(min(first, insert_at), max(last + 1, insert_at + length)):
+                    positions[path[moved]] = moved
+                applied += 1
+        return applied
+
+
+def improve_order(xy, order, start=None, deadline=None, neighbor_count=8):
+    '''refine order with 2-opt and Or-opt moves until no move improves it or time.perf_counter()
+    passes deadline.  Moves only consider the neighbor_count nearest neighbors of each location.'''
+    xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+    if len(order) < 3:
+        return list(order)
+    tour = _Tour(xy, order, start)
+    index = GridIndex(np.stack((tour.xs, tour.ys), axis=1))
+    neighbors = [index.k_nearest(x, y, neighbor_count, exclude=location)
+                 for location, (x, y) in enumerate(zip(tour.xs, tour.ys))]
+    while not past(deadline):
+        applied = tour.two_opt(neighbors, deadline)
+        applied += tour.or_opt(neighbors, deadline)
+        if applied == 0:
+            break
+    if start is None:
+        return tour.path
+    return tour.path[1:]
+
+
+def plan_order(xy, start=None, time_budget=1.0):
+    '''nearest neighbor order of the rows of xy improved for up to time_budget seconds
+    (None for no limit), starting from start (an x/y pair) or from row 0'''
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    order = nearest_neighbor_order(xy, start)
+    return improve_order(xy, order, start, deadline)
+
+
+def travel_length(options, order, choices, start=None):
+    '''rapid x/y distance from start (when given) through the features in order, each cut with
+    the (entry, exit) pair options[feature][choice]'''
+    length = 0.0
+    position = start
+    for feature, choice in zip(order, choices):
+        entry, exit = options[feature][choice]
+        if position is not None:
+            length += math.hypot(entry[0] - position[0], entry[1] - position[1])
+        position = exit
+    return length
+
+
+def nearest_option_order(options, start):
+    '''visit order and option choices of features, always going from the exit of the last
+    feature to the nearest entry of any option of an unvisited feature.
+    options is a list with a list of (entry, exit) x/y pairs per feature.'''
+    offsets = [0]
+    for feature_options in options:
+        offsets.append(offsets[-1] + len(feature_options))
+    owners = [feature for feature, feature_options in enumerate(options) for entry in feature_options]
+    index = GridIndex([entry for feature_options in options for entry, exit in feature_options])
+    order = []
+    choices = []
+    x, y = start
+    while len(order) < len(options):
+        location = index.nearest(x, y)
+        feature = owners[location]
+        choice = location - offsets[feature]
+        order.append(feature)
+        choices.append(choice)
+        for option_location in range(offsets[feature], offsets[feature + 1]):
+            index.remove(option_location)
+        x, y = options[feature][choice][1]
+    return order, choices
+
+
+def refine_choices(options, order, choices, start, sweeps=2):
+    '''for each feature in turn, choose the option closest to its neighbors in order'''
+    choices = list(choices)
+    for sweep in range(sweeps):
+        changed = False
+        for position, feature in enumerate(order):
+            if position == 0:
+                previous = start
+            else:
+                previous = options[order[position - 1]][choices[position - 1]][1]
+            if position + 1 < len(order):
+                following = options[order[position + 1]][choices[position + 1]][0]
+            else:
+                following = None
+            best = None
+            for choice, (entry, exit) in enumerate(options[feature]):
+                cost = math.hypot(entry[0] - previous[0], entry[1] - previous[1])
+                if following is not None:
+                    cost += math.hypot(following[0] - exit[0], following[1] - exit[1])
+                if best is None or cost < best[0] - 1e-9:
+                    best = (cost, choice)
+            if best[1] != choices[position]:
+                choices[position] = best[1]
+                changed = True
+        if not changed:
+            break
+    return choices
+
+
+def is_symmetric(feature_options):
+    '''True when every option of a feature enters and exits at the same place, so the feature
+    can be visited in either direction of a path'''
+    return all(entry[0] == exit[0] and entry[1] == exit[1] for entry, exit in feature_options)
+
+
+def plan_feature_order(options, start, deadline=None):
+    '''visit order and option choices for features with several (entry, exit) options.
+    Starts with nearest_option_order(); then each stretch of features that enter where they exit
+    (drills, perimeters) is improved like plan_order() between the features around it, which
+    keep their place, and the options are chosen again for the final order.'''
+    order, choices = nearest_option_order(options, start)
+    symmetric = [is_symmetric(feature_options) for feature_options in options]
+    position = 0
+    while position < len(order):
+        stop = position
+        while stop < len(order) and symmetric[order[stop]]:
+            stop += 1
+        if stop - position > 2:
+            previous = start if position == 0 else options[order[position - 1]][choices[position - 1]][1]
+            xy = np.array([options[feature][choice][0]
+                           for feature, choice in zip(order[position:stop], choices[position:stop])],
+                          dtype=np.float64)
+            improved = [position + index for index in improve_order(xy, range(len(xy)), previous, deadline)]
+            new_order = order[:position] + [order[index] for index in improved] + order[stop:]
+            new_choices = choices[:position] + [choices[index] for index in improved] + choices[stop:]
+            # the stretch and the travel into the feature after it
+            end = stop + 1
+            old_length = travel_length(options, order[position:end], choices[position:end], previous)
+            new_length = travel_length(options, new_order[position:end], new_choices[position:end], previous)
+            if new_length < old_length:
+                order, choices = new_order, new_choices
+        position = max(stop, position + 1)
+    return order, refine_choices(options, order, choices, start)
+
+
+class OrderReport(object):
+    '''rapid (x/y travel) distance between the reordered nodes before and after ordering.
+    The time saved is estimated at rapid_rate (in distance units per minute).'''
+    def __init__(self, node_count=0, rapid_before=0.0, rapid_after=0.0, seconds=0.0,
+                 rapid_rate=DEFAULT_RAPID_RATE):
+        self.node_count = node_count
+        self.rapid_before = rapid_before
+        self.rapid_after = rapid_after
+        self.seconds = seconds
+        self.rapid_rate = rapid_rate
+
+    @property
+    def saved(self):
+        return self.rapid_before - self.rapid_after
+
+    @property
+    def time_saved(self):
+        '''estimated seconds of rapids saved'''
+        return 60 * self.saved / self.rapid_rate
+
+    def __iadd__(self, other):
+        self.node_count += other.node_count
+        self.rapid_before += other.rapid_before
+        self.rapid_after += other.rapid_after
+        self.seconds += other.seconds
+        return self
+
+    def __str__(self):
+        ratio = self.saved / self.rapid_before if self.rapid_before > 0 else 0.0
+        return ('{} nodes: rapid distance {:.1f} -> {:.1f} ({:.0%} saved, about {:.1f}s at {:g}/min) '
+                'in {:.2f}s').format(self.node_count, self.rapid_before, self.rapid_after, ratio,
+                                     self.time_saved, self.rapid_rate, self.seconds)
+
+
+def travel_runs(children):
+    '''split children into runs of consecutive nodes with travel options.
+    Yields (first index, stop index, options) for each run of at least 2 nodes.'''
+    run = []
+    for index, child in enumerate(children):
+        options = child.travel_options()
+        if options:
+            run.append(options)
+            continue
+        if len(run) > 1:
+            yield index - len(run), index, run
+        run = []
+    if len(run) > 1:
+        yield len(children) - len(run), len(children), run
+
+
+def order_children(assembly, time_budget=1.0, start=None, recursive=False,
+                   rapid_rate=DEFAULT_RAPID_RATE):
+    '''reorder each run of consecutive position independent children of assembly (nodes with
+    travel_options(), such as cut.Drill, cut.Mill and cut.Polygon) to shorten the rapids between
+    them, and choose where each one is entered (such as the start vertex of a polygon).
+    Other children, such as the tool passes of a project, keep their place and split the runs,
+    so nothing moves across them.
+    A run at the beginning starts from start (an x/y pair) when given, other runs start where
+    their current first node is entered.
+    time_budget is in seconds for the whole call (None for no limit), recursive=True also
+    orders the children of every assembly below.
+    Returns an OrderReport, with the time saved estimated at rapid_rate.'''
+    begin = time.perf_counter()
+    deadline = None if time_budget is None else begin + time_budget
+    report = OrderReport(rapid_rate=rapid_rate)
+    if recursive:
+        assemblies = [node for kind, node in assembly.walk() if kind == tree.PREORDER]
+    else:
+        assemblies = [assembly]
+    for node in assemblies:
+        if not isinstance(node.children, list):
+            # such as arena.ArenaChildren, whose rows are not reordered
+            continue
+        children = node.children
+        new_children = list(children)
+        for first, stop, options in travel_runs(children):
+            run = children[first:stop]
+            current = [feature_options[run_child.travel_choice()]
+                       for run_child, feature_options in zip(run, options)]
+            # where the child before a run leaves the tool is not known without generating it,
+            # so such a run starts at the entry of its current first node
+            run_start = start if first == 0 and start is not None else current[0][0]
+            before = travel_length([[endpoints] for endpoints in current], range(len(run)),
+                                   [0] * len(run), run_start)
+            order, choices = plan_feature_order(options, run_start, deadline)
+            after = travel_length(options, order, choices, run_start)
+            if after >= before:
+                report += OrderReport(len(run), before, before)
+                continue
+            for feature, choice in zip(order, choices):
+                run[feature].set_travel_option(choice)
+            new_children[first:stop] = [run[feature] for feature in order]
+            report += OrderReport(len(run), before, after)
+        if new_children != children:
+            node.children = new_children
+    report.seconds = time.perf_counter() - begin
+    return report
@@ -4,14 +4,21 @@ A basic base class for point and point lists
 import numpy as np
 from collections.abc import MutableSequence, Iterable
 from . import number
+from . import array_util
 
 
 class XYZ(object):
     '''Tuple of x, y, z where the types of x/y/z could be anything
     Not intended to be mutable!
     '''
+    __slots__ = ('coords', )
+
     def __init__(self, x=None, y=None, z=None):
-        self.xyz = (x, y, z)
+        self.coords = (x, y, z)
+
+    @property
+    def xyz(self):
+        return self.coords
 
     @property
     def arr(self):
@@ -19,90 +26,107 @@ class XYZ(object):
 
     @property
     def x(self):
-        return self.xyz[0]
+        return self.coords[0]
 
     @property
     def y(self):
-        return self.xyz[1]
+        return self.coords[1]
 
     @property
     def z(self):
-        return self.xyz[2]
+        return self.coords[2]
 
     def __iter__(self):
-        return iter(self.xyz)
+        return iter(self.coords)
 
     def __str__(self):
-        return "({}, {}, {})".format(*self.xyz)
+        return "({}, {}, {})".format(*self.coords)
+
+
+def _float_or_nan(value):
+    return np.nan if value is None else float(value)
 
 
 class Point(XYZ):
     '''Point class for representing 3-d x/y/z cartesian coordinates.
-    x/y/z elements are 64 bit floats
-    x/y/z not specified are assumed to be zero
+    x/y/z elements are 64 bit floats, kept as the coords tuple
+    x/y/z not specified are assumed to be zero (None becomes nan)
+    xyz (and arr) is a read-only numpy array of x/y/z, made on first access
     Not intended to be mutable!
     '''
+    __slots__ = ('_xyz', )
+
     def __init__(self, x=0, y=0, z=0):
-        self.xyz = np.array((x, y, z), dtype=np.float64)
+        try:
+            self.coords = (float(x), float(y), float(z))
+        except TypeError:
+            self.coords = (_float_or_nan(x), _float_or_nan(y), _float_or_nan(z))
+        self._xyz = None
+
+    @property
+    def xyz(self):
+        if self._xyz is None:
+            xyz = np.array(self.coords)
+            xyz.setflags(write=False)
+            self._xyz = xyz
+        return self._xyz
 
     def copy(self):
         return self.__copy__()
 
     def __copy__(self):
-        return Point(*self.xyz.copy())
+        return Point(*self.coords)
 
     def offset(self, x=None, y=None, z=None):
         '''Returns a new point with the the offset applied'''
-        new_xyz = np.copy(self.xyz)
-        for index, offset in enumerate((x, y, z)):
-            if offset is not None:
-                new_xyz[index] += offset
-        return Point(*new_xyz)
+        return Point(*(value if offset is None else value + offset
+                       for value, offset in zip(self.coords, (x, y, z))))
 
     def __eq__(self, other):
-        return np.allclose(self.xyz, other.xyz)
+        # same tolerances as np.allclose
+        for value, other_value in zip(self.coords, other.coords):
+            if not (value == other_value or abs(value - other_value) <= 1e-8 + 1e-5 * abs(other_value)):
+                return False
+        return True
 
     def __str__(self):
-        return '({}, {}, {})'.format(*(map(number.num2str, self.xyz)))
+        return '({}, {}, {})'.format(*(map(number.num2str, self.coords)))
 
 
 class PointList(MutableSequence):
     '''A list of 3-d Points.
-    Underlying representation is a 4-d numpy array of np.float64
+    Underlying representation is an (N, 3) numpy array of np.float64, stored in a backing
+    buffer with spare capacity so append/extend are amortized O(1) per point.
+    arr returns a view of the filled region, so do not hold on to it across appends.
     Access points within the array like any other list.
     While the list is mutable, the points within the list are not intended to be.
     Note: slice assignment is not supported
     '''
     def __init__(self, arg=None):
         if arg is None:
-            self._arr = np.empty((0, 3), dtype=np.float64)
+            self._points = array_util.GrowableArray((3, ))
         else:
             cast_arg = np.asarray((self._cast_arr(arg)), dtype=np.float64)
-            # print(cast_arg)
-            # print(type(cast_arg))
-            self._arr = cast_arg
+            self._points = array_util.GrowableArray.from_array(cast_arg)
 
     def _cast_arr(self, arg):  # cast arg to np array suitable for extending/inserting PointList
-        err = TypeError('cannot cast type={} val={}'.format(type(arg), arg))
         if isinstance(arg, PointList):
             return arg.arr
         elif isinstance(arg, Point):
-            return np.asarray((arg.arr, ))
+            return np.asarray((arg.coords, ))
         elif isinstance(arg, np.ndarray):
             if len(arg.shape) == 1:
-                return np.asarray(((Point(*arg).arr, )))
+                return np.asarray(((Point(*arg).coords, )))
             elif len(arg.shape) == 2 and arg.shape[1] == 3:
                 return arg
-            else:
-                raise err
         elif isinstance(arg, Iterable):
-            return np.asarray([Point(*raw_point).arr for raw_point in arg])
-        else:
-            raise err
+            return np.asarray([Point(*raw_point).coords for raw_point in arg]).reshape(-1, 3)
+        # the message formats arg, which is slow for large arrays, so only build it to raise
+        raise TypeError('cannot cast type={} val={}'.format(type(arg), arg))
 
     @property
     def arr(self):
-        return self._arr
+        return self._points.arr
 
     @property
     def shape(self):
@@ -113,10 +137,10 @@ class PointList(MutableSequence):
         if len(self) == 0:
             raise IndexError('attempt to deference an empty PointList')
         elif isinstance(index, int):
-            return Point(*self._arr[index])
+            return Point(*self.arr[index])
         elif isinstance(index, slice):
             # raise KeyError('slice access not supported')
-            return PointList(self._arr[index])
+            return PointList(self.arr[index])
         else:
             raise TypeError('Invalid index/slice type')
 
@@ -124,19 +148,27 @@ class PointList(MutableSequence):
         if isinstance(index, slice):
             raise KeyError('slice assignment not supported')
         # print("__setitem__", index, value)
-        self._arr[index, :] = value
+        self.arr[index, :] = value
 
     def __delitem__(self, index):
         raise NotImplementedError("deletion not supported")
 
     def __len__(self):
-        return self.arr.shape[0]
+        return len(self._points)
 
     def insert(self, index, value):
         # print("insert", index, value)
         if isinstance(index, slice):
             raise KeyError('slice assignment not supported')
-        self._arr = np.insert(self._arr, index, value.arr.reshape(1, 3), axis=0)
+        # clamp like list.insert
+        length = len(self)
+        if index < 0:
+            index = max(0, index + length)
+        self._points.insert(min(index, length), value.coords)
+
+    def extend(self, values):
+        '''append all points of values (a PointList, (N, 3) array or iterable of points) at once'''
+        self._points.extend(self._cast_arr(values))
 
     def __str__(self):
         if len(self) == 0:
@@ -150,7 +182,64 @@ PL_ZERO = PointList(Point())
 
 def changes(point0, point1):
     result = {}
-    for key, elem0, elem1 in zip(('x', 'y', 'z'), point0.arr, point1.arr):
+    for key, elem0, elem1 in zip(('x', 'y', 'z'), point0.coords, point1.coords):
         if not number.isclose(elem0, elem1):
             result[key] = elem1
     return result
+
+
+def block_changes(start, xyz, close_tolerance=number.CLOSE_TOLERANCE):
+    '''changes() for a block of successive moves from start through the rows of an (N, 3) array,
+    in one pass over the block.
+    Returns (emit, redundant):
+      emit: (N, 3) bool array, True where the axis is in changes(previous, xyz[i])
+      redundant: (N, ) bool array, True for moves that change no axis (they would be skipped)
+    where previous is xyz[i - 1], or start for the first row.'''
+    xyz = np.asarray(xyz, dtype=np.float64)
+    if xyz.shape[0] == 0:
+        return np.zeros((0, 3), dtype=bool), np.zeros(0, dtype=bool)
+    prev = np.empty_like(xyz)
+    prev[0] = start
+    prev[1:] = xyz[:-1]
+    return step_changes(prev, xyz, close_tolerance)
+
+
+def step_changes(prev, xyz, close_tolerance=number.CLOSE_TOLERANCE):
+    '''changes() from each row of prev to the same row of xyz ((N, 3) arrays), returns
+    (emit, redundant) like block_changes()'''
+    # same test as math.isclose(a, b, abs_tol=close_tolerance) with its default rel_tol
+    tolerance = np.maximum(1e-9 * np.maximum(np.abs(xyz), np.abs(prev)), close_tolerance)
+    emit = ~((np.abs(xyz - prev) <= tolerance) | (xyz == prev))
+    return emit, ~emit.any(axis=1)
+
+
+def arc_points(starts, ends, radii, tolerance):
+    '''chords of the x/y arcs from the rows of starts to ends ((N, 3) arrays) by signed radii
+    (negative clockwise, like ArrayActionList.arc_radii), z moving evenly along them.  Each arc turns less than
+    half a circle and is split into equal chords within tolerance of it.
+    Returns (points, counts): where each chord ends, arc after arc, and the chords of each arc.'''
+    sizes = np.abs(radii)
+    directions = np.sign(radii)
+    vecs = ends[:, :2] - starts[:, :2]
+    lengths = np.hypot(vecs[:, 0], vecs[:, 1])
+    # like the machine, a radius shorter than half the chord makes a half circle
+    half_chords = np.minimum(lengths / 2, sizes)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lefts = np.column_stack((-vecs[:, 1], vecs[:, 0])) / lengths[:, np.newaxis]
+    lefts[lengths == 0] = 0
+    heights = directions * np.sqrt(sizes ** 2 - half_chords ** 2)
+    centers = (starts[:, :2] + ends[:, :2]) / 2 + heights[:, np.newaxis] * lefts
+    sweeps = 2 * np.arcsin(half_chords / sizes)
+    steps = 2 * np.arccos(np.clip(1 - tolerance / sizes, -1, 1))
+    counts = np.maximum(np.ceil(sweeps / steps), 1).astype(np.int64)
+    arcs = np.repeat(np.arange(len(radii)), counts)
+    firsts = np.cumsum(counts) - counts
+    fractions = (np.arange(int(counts.sum())) - firsts[arcs] + 1) / counts[arcs]
+    start_angles = np.arctan2(starts[:, 1] - centers[:, 1], starts[:, 0] - centers[:, 0])
+    angles = start_angles[arcs] + (directions * sweeps)[arcs] * fractions
+    points = np.column_stack((centers[arcs, 0] + sizes[arcs] * np.cos(angles),
+                              centers[arcs, 1] + sizes[arcs] * np.sin(angles),
+                              starts[arcs, 2] + (ends[arcs, 2] - starts[arcs, 2]) * fractions))
+    # the last chord ends exactly at the end of its arc
+    points[firsts + counts - 1] = ends
+    return points, counts
@@ -2,8 +2,9 @@
 import numpy as np
 from numpy.linalg import norm
 import math
-import itertools
+import random
 from .. import iter_util
+from .. import number
 from .. import point
 from .. import transform
 from ..debug import DBGP
@@ -15,6 +16,21 @@ def unit(vec):
     return vec / norm(vec)
 
 
+def unit_rows(vecs):
+    '''return unit vector for each row of vecs'''
+    return vecs / norm(vecs, axis=1)[:, np.newaxis]
+
+
+def is_zero_rows(vecs):
+    '''per row version of np.allclose(vec, (0, 0, 0))'''
+    return np.all(np.abs(vecs) <= 1e-8, axis=1)
+
+
+def is_allclose_rows(vec, vecs):
+    '''per row version of np.allclose(vec, row)'''
+    return np.all(np.abs(vec - vecs) <= 1e-8 + 1e-5 * np.abs(vecs), axis=1)
+
+
 def poly_circle_verts(segments_per_circle=32):
     spc = segments_per_circle
     assert spc >= 3
@@ -63,41 +79,35 @@ class Polygon(transform.TransformablePointList):
         The first element of each is the vector from the previous vertex to the corner center vertex.
         The second element of each is the vector from the corner center vertex to the next vertex.
         NOTE: starts with the corner centered on self.get_vertices()[0]'''
+        return list(zip(*self.get_corner_vector_arrays()))
+
+    def get_corner_vector_arrays(self):
+        '''Same vectors as get_corner_vectors, as a tuple of two (N, 3) arrays:
+        (vectors into each corner, vectors out of each corner)'''
         vec0s = self.arr - np.roll(self.arr, 1, axis=0)
         vec1s = np.roll(self.arr, -1, axis=0) - self.arr
-        return list(zip(vec0s, vec1s))
+        return vec0s, vec1s
 
     def get_corner_vector_crossproducts(self):
         '''for each vector pair from get_corner_vectors,
              perform the crossproduct and
              return all results as list
         '''
-        return np.cross(*zip(*self.get_corner_vectors()))
+        return np.cross(*self.get_corner_vector_arrays())
 
     def is_coplanar(self):
         '''returns true if all vertices are in the same plane'''
         cprods = self.get_corner_vector_crossproducts()
-        expected_normal = None
-        result = True
-        for cprod in cprods:
-            if np.allclose(cprod, np.asarray((0, 0, 0))):  # early bail on collinear!
-                pass
-            elif expected_normal is None:
-                expected_normal = np.fabs(unit(cprod))
-            elif not np.allclose(expected_normal, np.fabs(unit(cprod))):
-                result = False
-                break
-        return result
+        cprods = cprods[~is_zero_rows(cprods)]  # collinear corners do not define a plane
+        if len(cprods) == 0:
+            return True
+        normals = np.fabs(unit_rows(cprods))
+        return bool(np.all(is_allclose_rows(normals[0], normals)))
 
     def is_all_collinear(self):
         '''returns true if all vertices along the same line'''
         cprods = self.get_corner_vector_crossproducts()
-        result = True
-        for cprod in cprods:
-            if not np.allclose(cprod, np.asarray((0, 0, 0))):  # early bail on not collinear!
-                result = False
-                break
-        return result
+        return bool(np.all(is_zero_rows(cprods)))
 
     @property
     def bounds(self):
@@ -144,10 +154,7 @@ class CoplanarPolygon(Polygon):
     def get_normal(self):
         '''returns unit vector normal to the polygon plane'''
         cprods = self.get_corner_vector_crossproducts()
-        result = cprods[0]
-        for cprod in cprods[1:]:
-            result += cprod
-        return unit(result)
+        return unit(np.sum(cprods, axis=0))
 
     def get_corner_angle_class(self):
         '''return a list of numbers, one per corner matching the vertex order,
@@ -158,110 +165,270 @@ class CoplanarPolygon(Polygon):
          '''
         cprods = self.get_corner_vector_crossproducts()
         poly_normal = self.get_normal()
-        result = []
-        for cprod in cprods:
-            if np.allclose(cprod, np.asarray((0, 0, 0))):  # early test on collinear to prevent div0
-                result.append(0)
-            elif np.allclose(poly_normal, unit(cprod)):
-                result.append(1)
-            elif np.allclose(poly_normal, -unit(cprod)):
-                result.append(-1)
-            else:
-                PolygonError("Unexpected error in get_corner_angle_class()")
-        return result
+        result = np.zeros(len(cprods), dtype=int)
+        turning = ~is_zero_rows(cprods)  # test collinear first to prevent div0
+        u_cprods = unit_rows(cprods[turning])
+        convex = is_allclose_rows(poly_normal, u_cprods)
+        concave = is_allclose_rows(poly_normal, -u_cprods)
+        if not np.all(convex | concave):
+            raise PolygonError("Unexpected error in get_corner_angle_class()")
+        result[turning] = np.where(convex, 1, -1)
+        return result.tolist()
 
     def is_convex(self):
         cprods = self.get_corner_vector_crossproducts()
-        expected_normal = None
-        result = True
-        for cprod in cprods:
-            if np.allclose(cprod, np.asarray((0, 0, 0))):  # early bail on collinear!
-                pass
-            elif expected_normal is None:
-                expected_normal = unit(cprod)
-            elif not np.allclose(expected_normal, unit(cprod)):
-                result = False
-                break
-        return result
+        cprods = cprods[~is_zero_rows(cprods)]  # collinear corners turn neither way
+        if len(cprods) == 0:
+            return True
+        normals = unit_rows(cprods)
+        return bool(np.all(is_allclose_rows(normals[0], normals)))
+
+    def get_plane_coords(self):
+        '''return (N, 2) vertex coordinates in the polygon plane,
+        dropping the axis closest to the polygon normal'''
+        drop_axis = np.argmax(np.fabs(self.get_normal()))
+        keep_axes = [axis for axis in range(3) if axis != drop_axis]
+        return self.arr[:, keep_axes]
 
     def is_simple(self):
+        '''returns true when no two edges intersect, except for neighboring edges
+        meeting at their shared vertex.'''
         if self.is_convex():
             return True
         else:
-            # lifted from my old code
-            edges = self.get_edges()
-            for edge_idx_pair in itertools.combinations(range(len(self.arr)), 2):
-                if np.allclose(((edge_idx_pair[0] + 1) % len(edges)), edge_idx_pair[1]):
-                    # print("adjacent")
-                    continue
-                elif np.allclose(((edge_idx_pair[0] - 1) % len(edges)), edge_idx_pair[1]):
-                    # print("adjacent")
-                    continue
-                else:
-                    # DBGP(edge_idx_pair)
-                    # DBGP(edges[edge_idx_pair[0]])
-                    # DBGP(edges[edge_idx_pair[1]])
-                    # print("** NOT adjacent **")
-                    if (is_edge_intersect(edges[edge_idx_pair[0]], edges[edge_idx_pair[1]])):
-                        # print("** Intersected! **")
-                        return False
-            return True
-        return self._simple
+            return not has_edge_intersection(self.get_plane_coords())
+
+
+def orientation(p, q, r, tolerance=number.CLOSE_TOLERANCE):
+    '''returns 1 if r is left of the directed line p->q, -1 if right,
+    0 if r is within tolerance of the line'''
+    qx, qy = q[0] - p[0], q[1] - p[1]
+    cross = qx * (r[1] - p[1]) - qy * (r[0] - p[0])
+    if abs(cross) <= tolerance * math.hypot(qx, qy):
+        return 0
+    return 1 if cross > 0 else -1
+
+
+def is_within_box(p, q, r, tolerance=number.CLOSE_TOLERANCE):
+    '''returns true if r is inside the bounding box of p and q'''
+    in_x = min(p[0], q[0]) - tolerance <= r[0] <= max(p[0], q[0]) + tolerance
+    in_y = min(p[1], q[1]) - tolerance <= r[1] <= max(p[1], q[1]) + tolerance
+    return in_x and in_y
 
 
 def is_edge_intersect(edge0, edge1):
-    left = max(min(edge0[0][0], edge0[1][0]), min(edge1[0][0], edge1[1][0]))
-    right = min(max(edge0[0][0], edge0[1][0]), max(edge1[0][0], edge1[1][0]))
-    top = max(min(edge0[0][1], edge0[1][1]), min(edge1[0][1], edge1[1][1]))
-    bottom = min(max(edge0[0][1], edge0[1][1]), max(edge1[0][1], edge1[1][1]))
-    if top > bottom or left > right:
-        return False
-    else:
+    '''returns true if the closed segments edge0 and edge1 touch or cross in x/y'''
+    (p0, p1), (q0, q1) = edge0, edge1
+    o0 = orientation(p0, p1, q0)
+    o1 = orientation(p0, p1, q1)
+    o2 = orientation(q0, q1, p0)
+    o3 = orientation(q0, q1, p1)
+    if o0 * o1 < 0 and o2 * o3 < 0:
+        return True
+    # touching, or collinear and overlapping
+    touches = ((o0, p0, p1, q0), (o1, p0, p1, q1), (o2, q0, q1, p0), (o3, q0, q1, p1))
+    return any(orient == 0 and is_within_box(p, q, r) for orient, p, q, r in touches)
+
+
+class SweepStatus(object):
+    '''ordered set of the edges 0..count-1 crossing the sweep line, as a treap: a binary search
+    tree kept balanced by random heap priorities.  Insert, remove and neighbor lookups take
+    O(log n) expected steps.  The order is decided by the is_before(edge) passed to insert(),
+    and edges are removed by name, without comparing them again.'''
+    NONE = -1
+
+    def __init__(self, count, seed=0):
+        rng = random.Random(seed)
+        self.priorities = [rng.random() for _ in range(count)]
+        self.lefts = [self.NONE] * count
+        self.rights = [self.NONE] * count
+        self.parents = [self.NONE] * count
+        self.root = self.NONE
+
+    def _replace_child(self, parent, old, new):
+        if parent == self.NONE:
+            self.root = new
+        elif self.lefts[parent] == old:
+            self.lefts[parent] = new
+        else:
+            self.rights[parent] = new
+        if new != self.NONE:
+            self.parents[new] = parent
+
+    def _rotate_up(self, node):
+        '''rotate node above its parent, keeping the in-order sequence'''
+        lefts, rights = self.lefts, self.rights
+        parent = self.parents[node]
+        self._replace_child(self.parents[parent], parent, node)
+        if lefts[parent] == node:
+            lefts[parent] = rights[node]
+            if rights[node] != self.NONE:
+                self.parents[rights[node]] = parent
+            rights[node] = parent
+        else:
+            rights[parent] = lefts[node]
+            if lefts[node] != self.NONE:
+                self.parents[lefts[node]] = parent
+            lefts[node] = parent
+        self.parents[parent] = node
+
+    def insert(self, edge, is_before):
+        '''add edge after the edges that is_before(other) is True for, before the others'''
+        parent, node, is_left = self.NONE, self.root, True
+        while node != self.NONE:
+            parent, is_left = node, not is_before(node)
+            node = self.lefts[node] if is_left else self.rights[node]
+        self.parents[edge] = parent
+        self.lefts[edge] = self.rights[edge] = self.NONE
+        if parent == self.NONE:
+            self.root = edge
+        elif is_left:
+            self.lefts[parent] = edge
+        else:
+            self.rights[parent] = edge
+        priorities = self.priorities
+        while self.parents[edge] != self.NONE and priorities[edge] < priorities[self.parents[edge]]:
+            self._rotate_up(edge)
+
+    def remove(self, edge):
+        lefts, rights, priorities = self.lefts, self.rights, self.priorities
+        # rotate edge down to a leaf, then cut it off
+        while lefts[edge] != self.NONE or rights[edge] != self.NONE:
+            left, right = lefts[edge], rights[edge]
+            if right == self.NONE or (left != self.NONE and priorities[left] < priorities[right]):
+                self._rotate_up(left)
+            else:
+                self._rotate_up(right)
+        self._replace_child(self.parents[edge], edge, self.NONE)
+
+    def prev(self, edge):
+        '''the edge before edge, or NONE'''
+        return self._neighbor(edge, self.lefts, self.rights)
+
+    def next(self, edge):
+        '''the edge after edge, or NONE'''
+        return self._neighbor(edge, self.rights, self.lefts)
+
+    def _neighbor(self, edge, toward, away):
+        node = toward[edge]
+        if node != self.NONE:
+            while away[node] != self.NONE:
+                node = away[node]
+            return node
+        node, parent = edge, self.parents[edge]
+        while parent != self.NONE and toward[parent] == node:
+            node, parent = parent, self.parents[parent]
+        return parent
+
+    def __iter__(self):
+        '''edges in order'''
+        stack, node = [], self.root
+        while stack or node != self.NONE:
+            while node != self.NONE:
+                stack.append(node)
+                node = self.lefts[node]
+            node = stack.pop()
+            yield node
+            node = self.rights[node]
+
+
+def has_edge_intersection(verts):
+    '''Shamos-Hoey sweep line test for intersecting edges of the closed polygon verts (N, 2).
+    Neighboring edges may meet at their shared vertex, but may not fold back over each other.
+    Edges enter and leave a y sorted SweepStatus as the sweep moves along x, and only edges
+    that become neighbors in it are tested, so the test is O(n log n).'''
+    num_edges = len(verts)
+    starts = np.asarray(verts, dtype=np.float64)
+    ends = np.roll(starts, -1, axis=0)
+    # neighboring edges folding back over each other
+    prev_vecs = starts - np.roll(starts, 1, axis=0)
+    next_vecs = ends - starts
+    cross = prev_vecs[:, 0] * next_vecs[:, 1] - prev_vecs[:, 1] * next_vecs[:, 0]
+    dot = np.sum(prev_vecs * next_vecs, axis=1)
+    lengths = norm(prev_vecs, axis=1) * norm(next_vecs, axis=1)
+    if np.any((np.abs(cross) <= number.CLOSE_TOLERANCE * lengths) & (dot < 0)):
         return True
+    # orient each edge left to right, bottom to top for vertical edges
+    swap = (starts[:, 0] > ends[:, 0]) | ((starts[:, 0] == ends[:, 0]) & (starts[:, 1] > ends[:, 1]))
+    lefts = np.where(swap[:, np.newaxis], ends, starts)
+    rights = np.where(swap[:, np.newaxis], starts, ends)
+    deltas = rights - lefts
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slopes = np.where(deltas[:, 0] != 0, deltas[:, 1] / deltas[:, 0], np.inf).tolist()
+    # events sorted by x, then y, with insertions before removals at the same point
+    event_points = np.concatenate((lefts, rights))
+    event_kinds = np.repeat((0, 1), num_edges)
+    events = np.lexsort((event_kinds, event_points[:, 1], event_points[:, 0])).tolist()
+    lefts = lefts.tolist()
+    rights = rights.tolist()
+
+    def status_key(edge, x):
+        left, slope = lefts[edge], slopes[edge]
+        if slope == np.inf:
+            return left[1], slope
+        return left[1] + (x - left[0]) * slope, slope
+
+    def is_crossing(edge0, edge1):
+        if (edge0 - edge1) % num_edges in (1, num_edges - 1):
+            return False  # neighbors meet at their shared vertex, fold backs are handled above
+        return is_edge_intersect((lefts[edge0], rights[edge0]), (lefts[edge1], rights[edge1]))
+
+    status = SweepStatus(num_edges)
+    none = SweepStatus.NONE
+    for event in events:
+        edge = event % num_edges
+        if event < num_edges:  # insert
+            x = lefts[edge][0]
+            key = status_key(edge, x)
+            status.insert(edge, lambda other: status_key(other, x) < key)
+            below, above = status.prev(edge), status.next(edge)
+            if below != none and is_crossing(below, edge):
+                return True
+            if above != none and is_crossing(edge, above):
+                return True
+        else:  # remove
+            below, above = status.prev(edge), status.next(edge)
+            if below != none and above != none and is_crossing(below, above):
+                return True
+            status.remove(edge)
+    return False
 
 
 class SimplePolygon(CoplanarPolygon):
-
-    def __init__(self, *args, **kwargs):
+    '''validate=False skips the is_simple() check, for callers that already know the
+    vertices form a simple polygon.'''
+    def __init__(self, *args, validate=True, **kwargs):
         super().__init__(*args, **kwargs)
-        if not self.is_simple():
+        if validate and not self.is_simple():
             raise PolygonError("SimplePolygon vertices must form a simple polygon's mathematical definition")
 
-    def shrink(self, amount):
+    def shrink(self, amount, validate=True):
+        '''Offset every edge inwards by amount (outwards for negative amount).
+        validate=False skips re-checking the result is simple, only use it when the caller
+        knows the offset cannot make edges cross.'''
         poly_normal = self.get_normal()
-        correction_vecs = []
-        for corner_vecs, corner_class in zip(self.get_corner_vectors(), self.get_corner_angle_class()):
-            # DBGP(corner_vecs)
-            # DBGP(corner_class)
-            u_prev_vec = unit(corner_vecs[0])
-            u_next_vec = unit(corner_vecs[1])
-            # DBGP(u_prev_vec)
-            # DBGP(u_next_vec)
-            if corner_class == 0:  # straight, handle first to avoid div0
-                u_correction_vec = unit(np.cross(poly_normal, u_prev_vec))
-                correction_vec_len = amount
-            elif corner_class == 1:  # convex
-                u_correction_vec = unit(-u_prev_vec + u_next_vec)
-            elif corner_class == -1:  # concave
-                u_correction_vec = -unit(-u_prev_vec + u_next_vec)
-            # DBGP(u_correction_vec)
-            if corner_class == 0:  # straight, handle first to avoid div0
-                correction_vec_len = amount
-            else:
-                # correction_vec_len = amount / np.cross(u_next_vec, u_correction_vec)
-                dot_prod = np.dot(u_correction_vec, u_next_vec)
-                base_correction_len = np.sqrt(1 / (1 - (dot_prod**2)))
-                # DBGP(base_correction_len)
-                correction_vec_len = amount * base_correction_len
-            # DBGP(correction_vec_len)
-            correction_vecs.append(correction_vec_len * u_correction_vec)
-        newVerts = point.PointList(self.arr + np.asarray(correction_vecs))
-        # DBGP(newVerts.arr)
-        result = SimplePolygon(newVerts)
+        vec0s, vec1s = self.get_corner_vector_arrays()
+        corner_classes = np.asarray(self.get_corner_angle_class())
+        u_prev_vecs = unit_rows(vec0s)
+        u_next_vecs = unit_rows(vec1s)
+        straight = corner_classes == 0
+        turning = ~straight
+        u_correction_vecs = np.empty_like(u_prev_vecs)
+        correction_vec_lens = np.full(len(corner_classes), float(amount))
+        # straight, handled separately to avoid div0
+        u_correction_vecs[straight] = unit_rows(np.cross(poly_normal, u_prev_vecs[straight]))
+        # convex corners move along the corner bisector, concave ones against it
+        bisectors = unit_rows(u_next_vecs[turning] - u_prev_vecs[turning])
+        u_correction_vecs[turning] = corner_classes[turning, np.newaxis] * bisectors
+        dot_prods = np.sum(u_correction_vecs[turning] * u_next_vecs[turning], axis=1)
+        correction_vec_lens[turning] = amount * np.sqrt(1 / (1 - (dot_prods**2)))
+        correction_vecs = correction_vec_lens[:, np.newaxis] * u_correction_vecs
+        newVerts = point.PointList(self.arr + correction_vecs)
+        result = SimplePolygon(newVerts, validate=validate)
         return result
 
-    def grow(self, amount):
-        return self.shrink(-amount)
+    def grow(self, amount, validate=True):
+        return self.shrink(-amount, validate=validate)
 
 
 
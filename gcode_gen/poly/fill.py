@@ -1,6 +1,5 @@
 '''polygon fill library'''
 import numpy as np
-from .. import iter_util
 from .. import number
 from .. import point as pt
 from .. import poly
@@ -60,6 +59,8 @@ class FillEdgeTable(list):
 def calc_polygon_fill_vertices(pgon, max_spacing):
     '''Traces out a y-min to y-max scan-line path to fill a given polygon with a
     max spacing between rows.
+    Uses an active edge table: edges enter in y_min order and leave once the scan line
+    passes their y_max, and the intersections of each row are computed as numpy arrays.
     args:
       polyon to fill
       max spacing between passes
@@ -69,72 +70,72 @@ def calc_polygon_fill_vertices(pgon, max_spacing):
         the sequence of bools indicate
           a cut when true, else indicates a jog (aka travel) action for each point'''
     assert isinstance(pgon, poly.SimplePolygon)
-    result_point_list = pt.PointList()
-    result_iscut_list = []
     convex = pgon.is_convex()
-    print("convex={}".format(convex))
     bounds = pgon.bounds
     pgon_y_min, pgon_y_max = bounds[1]
     y_step_list = number.calc_steps_with_max_spacing(pgon_y_min, pgon_y_max, max_spacing)
     edge_table = FillEdgeTable(pgon)
-    cuts, jogs = [], []
-    # [1:-1] because the perimeter trace already handles top and bottom
+    y_mins = np.array([edge.y_min for edge in edge_table], dtype=np.float64)
+    y_maxs = np.array([edge.y_max for edge in edge_table], dtype=np.float64)
+    x_bases = np.array([edge.x_base for edge in edge_table], dtype=np.float64)
+    x_slopes = np.array([edge.x_slope for edge in edge_table], dtype=np.float64)
+    next_edge = 0
+    active = np.empty(0, dtype=np.intp)  # edge table indices, kept in edge table order
+    row_xs, row_ys, row_cuts = [], [], []
     last_edge = None
     dir_left_to_right = True
-    for y_step in list(y_step_list)[1:-1]:
-        active_list = []
-        wait_list = []
-        for edge in edge_table:
-            if edge.y_min <= y_step <= edge.y_max:
-                active_list.append(edge)
-        active_list = sorted(active_list,
-                             key=lambda edge: edge.get_x_for_y(y_step))
+    # [1:-1] because the perimeter trace already handles top and bottom
+    for y_step in y_step_list[1:-1]:
+        entered = np.searchsorted(y_mins, y_step, side='right')
+        if entered > next_edge:
+            active = np.concatenate((active, np.arange(next_edge, entered)))
+            next_edge = entered
+        # the scan line only moves up, so edges below it are gone for good
+        active = active[y_maxs[active] >= y_step]
+        if len(active) == 0:
+            continue
+        xs = x_bases[active] + x_slopes[active] * (y_step - y_mins[active])
+        order = np.argsort(xs, kind='stable')
         if not dir_left_to_right:
-            active_list = list(reversed(active_list))
-        raw_points = []
-        for edge in active_list:
-            point = pt.Point(edge.get_x_for_y(y_step), y_step)
-            raw_points.append(point)
-        delete_indices = []
-        for idx, ((p0, e0), (p1, e1)) in enumerate(iter_util.pairwise_iter(zip(raw_points, active_list))):
-            # when two consecutive points are equal, we hit a vertex
-            # drop both points for maxima/minima
-            # otherwise, drop 1 point
-            if p0 == p1:
-                delete_indices.append(idx)
-                if number.isclose(p0.y, e0.y_min) and number.isclose(p1.y, e1.y_min):
-                    delete_indices.append(idx + 1)
-                if number.isclose(p0.y, e0.y_max) and number.isclose(p1.y, e1.y_max):
-                    delete_indices.append(idx + 1)
-        #
-        points = []
-        for idx, point in enumerate(raw_points):
-            if idx not in delete_indices:
-                points.append(point)
-        # print('*' * 80)
-        # for p0, e0 in zip(points, active_list):
-        #     print(p0, e0)
+            order = order[::-1]
+        xs = xs[order]
+        edges = active[order]
+        # when two consecutive points are equal, we hit a vertex
+        # drop both points for maxima/minima
+        # otherwise, drop 1 point
+        keep = np.ones(len(xs), dtype=bool)
+        for idx in np.flatnonzero(np.isclose(xs[:-1], xs[1:])):
+            keep[idx] = False
+            e0, e1 = edge_table[edges[idx]], edge_table[edges[idx + 1]]
+            if number.isclose(y_step, e0.y_min) and number.isclose(y_step, e1.y_min):
+                keep[idx + 1] = False
+            if number.isclose(y_step, e0.y_max) and number.isclose(y_step, e1.y_max):
+                keep[idx + 1] = False
+        xs = xs[keep]
         #
         first_point_is_cut = False
         if last_edge is not None:
             if convex:
                 first_point_is_cut = True
-            elif active_list[0] == last_edge:
+            elif edges[0] == last_edge:
                 first_point_is_cut = True
-        #
-        is_cut = False
-        for point, is_first in iter_util.is_first_tup(points):
-            result_point_list.append(point)
-            if is_first:
-                result_iscut_list.append(first_point_is_cut)
-            else:
-                result_iscut_list.append(is_cut)
-            is_cut = not is_cut
+        # cut state alternates after the first point: first, cut, jog, cut, ...
+        is_cuts = np.arange(len(xs)) % 2 == 1
+        if len(xs) > 0:
+            is_cuts[0] = first_point_is_cut
+        row_xs.append(xs)
+        row_ys.append(np.full(len(xs), y_step))
+        row_cuts.append(is_cuts)
         dir_left_to_right = not dir_left_to_right
-        last_edge = active_list[-1]
+        last_edge = edges[-1]
+    if row_xs:
+        xs, ys = np.concatenate(row_xs), np.concatenate(row_ys)
+        result_point_list = pt.PointList(np.stack((xs, ys, np.zeros_like(xs)), axis=1))
+        result_iscut_list = np.concatenate(row_cuts).tolist()
+    else:
+        result_point_list = pt.PointList()
+        result_iscut_list = []
     result = (result_point_list, result_iscut_list)
     # from .plot import plot_poly_and_fill_lines
     # plot_poly_and_fill_lines(pgon, result)
     return result
-
-
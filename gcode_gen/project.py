@@ -1,8 +1,13 @@
+from concurrent.futures import ProcessPoolExecutor
 from .tool import Tool
 from . import state as st
 from . import action
+from . import arc_fit
 from . import assembly
 
+# number of actions rendered per chunk when streaming gcode to a file
+GCODE_CHUNK_SIZE = 4096
+
 
 class Header(assembly.Assembly):
     def get_preorder_actions(self):
@@ -34,12 +39,15 @@ class Footer(assembly.Assembly):
 
 
 class ToolPass(assembly.Assembly):
-    '''one gcode file, typically used one per tool needed for a project'''
-    def __init__(self, name, parent=None, state=None, filename=None):
+    '''one gcode file, typically used one per tool needed for a project
+    fit_arcs=True replaces runs of cuts along a circle with G2/G3 arcs in the gcode written by
+    iter_gcode_lines() and the dumps built on it, see arc_fit.'''
+    def __init__(self, name, parent=None, state=None, filename=None, fit_arcs=False):
         super().__init__(name=name, parent=parent, state=state)
         self.filename = filename
         if filename is None:
             self.filename = '{}.gcode'.format(self.name)
+        self.fit_arcs = fit_arcs
 
     def update_children_preorder(self):
         self += Header()
@@ -49,16 +57,33 @@ class ToolPass(assembly.Assembly):
     def update_children_postorder(self):
         self.children = self.children[1:-1]
 
+    def iter_gcode_lines(self, chunk_size=GCODE_CHUNK_SIZE):
+        '''yield lists of gcode lines, rendering chunk_size actions at a time
+        so the whole pass never has to be held in memory.
+        With fit_arcs the cuts at the end of a chunk are carried over to the next one, so
+        circles cut across two chunks are fitted whole, see arc_fit.iter_fit_arcs().'''
+        if self.fit_arcs:
+            for al in arc_fit.iter_fit_arcs(self.iter_actions(), chunk_size):
+                yield al.get_gcode_lines()
+            return
+        al = action.ArrayActionList()
+        for elem in self.iter_actions():
+            al.append(elem)
+            if len(al) >= chunk_size:
+                yield al.get_gcode_lines()
+                al = action.ArrayActionList()
+        if len(al) > 0:
+            yield al.get_gcode_lines()
+
     def gcode_dumps(self):
         '''dump gcode as a string'''
-        gcode_list = self.get_gcode()
-        return '\n'.join(map(str, gcode_list))
+        return '\n'.join(line for lines in self.iter_gcode_lines() for line in lines)
 
     def gcode_dump(self, fp):
-        '''dump gcode to a file object'''
-        gcode_list = self.get_gcode()
-        for gcode in gcode_list:
-            fp.write('{}\n'.format(str(gcode)))
+        '''dump gcode to a file object, one chunk of lines at a time'''
+        for lines in self.iter_gcode_lines():
+            if lines:
+                fp.write('\n'.join(lines) + '\n')
 
     def write_gcode_file(self):
         '''dump gcode to a file specified by filename'''
@@ -67,23 +92,43 @@ class ToolPass(assembly.Assembly):
 
 
 class Project(assembly.Assembly):
-    '''Gcode generation project made up of multiple tool passes'''
-    def __init__(self, name, parent=None):
+    '''Gcode generation project made up of multiple tool passes
+    fit_arcs sets fit_arcs of every tool pass, see ToolPass.'''
+    _fit_arcs = False
+
+    def __init__(self, name, parent=None, fit_arcs=False):
         state = st.CncState()
         super().__init__(name=name, parent=parent, state=state)
         self.tool_passes = {}
         self.tools = {}
+        self.fit_arcs = fit_arcs
 
     def append(self, tool):
         name = '{}_{}'.format(self.name, tool.name)
         state_copy = self.state.copy()
         state_copy['tool'] = tool
-        tool_pass = ToolPass(name=name)
+        tool_pass = ToolPass(name=name, fit_arcs=self.fit_arcs)
         super().append(tool_pass)
         tool_pass.state = state_copy
 
-    def write_gcode_files(self, do_print=True):
-        '''dump gcode for each toolpass to a file'''
+    @property
+    def fit_arcs(self):
+        return self._fit_arcs
+
+    @fit_arcs.setter
+    def fit_arcs(self, value):
+        self._fit_arcs = value
+        for tool_pass in self.children:
+            tool_pass.fit_arcs = value
+
+    def write_gcode_files(self, do_print=True, parallel=False, max_workers=None):
+        '''dump gcode for each toolpass to a file
+        parallel=True renders and writes the tool passes concurrently in a pool of
+        max_workers processes (default: one per cpu).  The files and printed messages
+        are the same as in serial mode.'''
+        if parallel:
+            self._write_gcode_files_parallel(do_print, max_workers)
+            return
         for tool_pass in self.children:
             if do_print:
                 print('Writing file {} ...'.format(tool_pass.filename), end='')
@@ -91,4 +136,27 @@ class Project(assembly.Assembly):
             if do_print:
                 print('done!')
 
+    def _write_gcode_files_parallel(self, do_print, max_workers):
+        # the project is sent once per worker process, tasks only carry a child index
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 initializer=_init_worker_project,
+                                 initargs=(self, )) as executor:
+            futures = [executor.submit(_write_worker_tool_pass, index) for index in range(len(self.children))]
+            for tool_pass, future in zip(self.children, futures):
+                if do_print:
+                    print('Writing file {} ...'.format(tool_pass.filename), end='')
+                future.result()
+                if do_print:
+                    print('done!')
+
+
+_worker_project = None
+
+
+def _init_worker_project(prj):
+    global _worker_project
+    _worker_project = prj
+
 
+def _write_worker_tool_pass(index):
+    _worker_project.children[index].write_gcode_file()
@@ -0,0 +1,126 @@
+'''Instanced assemblies: one subtree cut at many placements, such as boards on a panel.'''
+import numpy as np
+from . import action
+from . import point as pt
+from . import transform
+from .assembly import Assembly, safe_jog_actions
+
+
+def grid_placements(columns, rows, dx, dy):
+    '''placement matrices for a columns x rows grid with dx/dy spacing, row by row'''
+    placements = np.tile(np.identity(4), (columns * rows, 1, 1))
+    placements[:, 0, 3] = np.tile(np.arange(columns) * dx, rows)
+    placements[:, 1, 3] = np.repeat(np.arange(rows) * dy, columns)
+    return placements
+
+
+class Repeat(Assembly):
+    '''Cut the instance subtree once per placement.
+    The instance is generated once, then every placement (a 4x4 matrix) is applied to the
+    generated toolpath points with one batched matrix multiply.  Placements are applied after
+    all transforms of the tree, in machine coordinates.
+    Each copy is replayed against the live state: the motions up to the first cut are replaced
+    by a safe jog to where the first cut starts, then the remaining actions are rebuilt so feed
+    rate changes and skipped motions are decided for that copy.
+    Jogs at z_safe stay at z_safe in every copy, so placements that move or tilt z do not move
+    the retract height.
+    The instance is not one of the children, it is only visited through the Repeat.
+    '''
+    def __init__(self, instance, placements, name=None, parent=None, state=None):
+        super().__init__(name=name, parent=parent, state=state)
+        if not isinstance(instance, Assembly):
+            raise TypeError('instance must be of type Assembly, not {}'.format(type(instance)))
+        self.placements = placements
+        self.instance = instance
+        instance.parent = self
+        instance.state = self.state
+
+    @property
+    def placements(self):
+        return self._placements
+
+    @placements.setter
+    def placements(self, placements):
+        placements = np.array(placements, dtype=np.float64).reshape(-1, 4, 4)
+        placements.setflags(write=False)
+        self._placements = placements
+        self.mark_dirty()
+
+    @Assembly.state.setter
+    def state(self, new_state):
+        Assembly.state.fset(self, new_state)
+        if 'instance' in self.__dict__:
+            self.instance.state = new_state
+
+    def _invalidate_root_matrix(self):
+        if self._root_matrix is None:
+            return
+        super()._invalidate_root_matrix()
+        self.instance._invalidate_root_matrix()
+
+    def record(self):
+        '''generate the instance once, returns all of its actions including skipped ones'''
+        recorded = list(self.instance.iter_actions(include_skipped=True))
+        self.instance.mark_clean()
+        return recorded
+
+    def stamp(self, points):
+        '''apply every placement to an (N, 3) array of points, returns a (placements, N, 3) array'''
+        count = points.shape[0]
+        offsets = np.arange(len(self.placements) + 1) * count
+        stamped = transform.apply_matrix_segments(self.placements, np.tile(points, (len(self.placements), 1)),
+                                                  offsets)
+        return stamped.reshape(-1, count, 3)
+
+    def get_preorder_actions(self):
+        al = action.ActionList()
+        if len(self.placements) == 0:
+            return al
+        recorded = self.record()
+        first_cut = next((index for index, elem in enumerate(recorded) if is_motion(elem, action.Cut)),
+                         len(recorded))
+        lead_jogs = [index for index, elem in enumerate(recorded[:first_cut]) if is_motion(elem, action.Jog)]
+        if not lead_jogs and first_cut < len(recorded):
+            raise ValueError('the repeated instance must jog to its first cut, for example with a SafeJog')
+        # the lead jogs are replaced by a single safe jog at the position of the last one
+        last_lead_jog = lead_jogs[-1] if lead_jogs else None
+        state = self.state
+        if lead_jogs:
+            local_points = [recorded[last_lead_jog].point.coords]
+            is_jog = [False]  # the lead jog is replaced by a safe jog
+            for elem in recorded[first_cut:]:
+                if isinstance(elem, action.MotionBlock):
+                    local_points.extend(elem.xyz)
+                    is_jog.extend([issubclass(elem.motion_class, action.Jog)] * len(elem))
+                elif isinstance(elem, action.Motion):
+                    local_points.append(elem.point.coords)
+                    is_jog.append(isinstance(elem, action.Jog))
+            local_points = np.array(local_points, dtype=np.float64).reshape(-1, 3)
+            stamped = self.stamp(local_points)
+            if state['z_safe'] is not None:
+                stamped[:, np.asarray(is_jog) & (local_points[:, 2] == state['z_safe']), 2] = state['z_safe']
+        for copy_index in range(len(self.placements)):
+            copy_points = stamped[copy_index] if lead_jogs else None
+            next_point = 1
+            for index, elem in enumerate(recorded):
+                if index < first_cut:
+                    if index == last_lead_jog:
+                        al.extend(safe_jog_actions(state, pt.Point(*copy_points[0])))
+                    elif not is_motion(elem, action.Jog):
+                        al += elem.replay(state)
+                elif isinstance(elem, action.MotionBlock):
+                    al += elem.replay(state, copy_points[next_point:next_point + len(elem)])
+                    next_point += len(elem)
+                elif isinstance(elem, action.Motion):
+                    al += elem.replay(state, copy_points[next_point])
+                    next_point += 1
+                else:
+                    al += elem.replay(state)
+        return al
+
+
+def is_motion(elem, motion_class):
+    '''True for a motion_class action or a non-empty MotionBlock of motion_class motions'''
+    if isinstance(elem, action.MotionBlock):
+        return issubclass(elem.motion_class, motion_class) and len(elem) > 0
+    return isinstance(elem, motion_class)
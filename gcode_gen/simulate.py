@@ -0,0 +1,402 @@
+'''Stock removal simulation on a 2.5D heightmap.
+
+A flat end mill of the tool's cut diameter is swept along every motion of an action stream.
+The area a move sweeps is a capsule (the segment thickened by the tool radius).  Each grid
+row is cut by the capsule in one interval, so moves are rasterized as row spans, then as
+cells, a chunk of moves at a time, and the heightmap is lowered once per chunk.
+A move that continues from the previous one without going down skips the cells under its
+start, which the previous move already lowered to its height, so the work is proportional to
+the swept area rather than to the number of moves times the tool footprint.
+'''
+import numpy as np
+from . import action
+from . import estimate
+
+DEFAULT_RESOLUTION = 0.05  # mm
+DEFAULT_CHUNK_SIZE = 1024  # moves
+DEFAULT_CHUNK_CELLS = 1 << 21  # cells swept, bounds the memory used per chunk
+TOLERANCE = 1e-6  # mm, heights within this are the same
+
+
+class Heightmap(object):
+    '''grid of stock top heights, heights[row, col] is the height at the center of the cell
+    x = x_min + (col + 0.5) * resolution, y = y_min + (row + 0.5) * resolution'''
+    def __init__(self, x_min, y_min, x_max, y_max, resolution=DEFAULT_RESOLUTION, top=0.0):
+        self.x_min = x_min
+        self.y_min = y_min
+        self.resolution = resolution
+        cols = max(1, int(np.ceil((x_max - x_min) / resolution)))
+        rows = max(1, int(np.ceil((y_max - y_min) / resolution)))
+        self.heights = np.full((rows, cols), top, dtype=np.float64)
+
+    @classmethod
+    def around(cls, xyz, margin, resolution=DEFAULT_RESOLUTION, top=0.0):
+        '''heightmap covering the x/y extent of an (N, 3) array of points plus margin'''
+        xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+        low = xyz[:, :2].min(axis=0) - margin
+        high = xyz[:, :2].max(axis=0) + margin
+        return cls(low[0], low[1], high[0], high[1], resolution, top)
+
+    @property
+    def shape(self):
+        return self.heights.shape
+
+    @property
+    def cell_area(self):
+        return self.resolution ** 2
+
+    def copy(self):
+        result = self.__class__.__new__(self.__class__)
+        result.x_min = self.x_min
+        result.y_min = self.y_min
+        result.resolution = self.resolution
+        result.heights = self.heights.copy()
+        return result
+
+    def first_index(self, low, axis_min):
+        '''index of the first cell whose center is at or above low'''
+        return np.ceil((low - axis_min) / self.resolution - 0.5).astype(np.int64)
+
+    def last_index(self, high, axis_min):
+        '''index of the last cell whose center is at or below high'''
+        return np.floor((high - axis_min) / self.resolution - 0.5).astype(np.int64)
+
+
+def linear_interval(slopes, offsets, low, high):
+    '''(left, right) arrays of the x where low <= slopes * x + offsets <= high, left > right
+    when there is none'''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bound0 = (low - offsets) / slopes
+        bound1 = (high - offsets) / slopes
+    flat_inside = (low <= offsets) & (offsets <= high)
+    left = np.where(slopes > 0, bound0, np.where(slopes < 0, bound1, np.where(flat_inside, -np.inf, np.inf)))
+    right = np.where(slopes > 0, bound1, np.where(slopes < 0, bound0, np.where(flat_inside, np.inf, -np.inf)))
+    return left, right
+
+
+def disk_interval(center_x, center_y, radius, row_y):
+    '''(left, right) arrays of the x of row_y inside the disks, left > right when outside'''
+    dy = row_y - center_y
+    half = np.sqrt(np.maximum(radius ** 2 - dy ** 2, 0))
+    inside = np.abs(dy) <= radius
+    return np.where(inside, center_x - half, np.inf), np.where(inside, center_x + half, -np.inf)
+
+
+def capsule_interval(x0, y0, x1, y1, radius, row_y):
+    '''(left, right) arrays of the x of row_y within radius of the segments, left > right when
+    there is none.  The capsule is convex, so it is the hull of its two disks and its body.'''
+    dx = x1 - x0
+    dy = y1 - y0
+    length_sq = dx ** 2 + dy ** 2
+    rel_y = row_y - y0
+    # body: 0 <= (p - p0) . d <= |d|^2 and |(p - p0) x d| <= radius * |d|
+    along_left, along_right = linear_interval(dx, rel_y * dy - x0 * dx, 0, length_sq)
+    reach = radius * np.sqrt(length_sq)
+    across_left, across_right = linear_interval(-dy, rel_y * dx + x0 * dy, -reach, reach)
+    body_left = np.maximum(along_left, across_left)
+    body_right = np.minimum(along_right, across_right)
+    has_body = (length_sq > 0) & (body_left <= body_right)
+    start_left, start_right = disk_interval(x0, y0, radius, row_y)
+    end_left, end_right = disk_interval(x1, y1, radius, row_y)
+    left = np.minimum(np.minimum(start_left, end_left), np.where(has_body, body_left, np.inf))
+    right = np.maximum(np.maximum(start_right, end_right), np.where(has_body, body_right, -np.inf))
+    return left, right
+
+
+def lowest_z(x0, y0, z0, x1, y1, z1, radius, cell_x, cell_y):
+    '''lowest tool tip z over the part of each move within radius of each cell center.
+    z is linear along the move, so it is lowest at one end of that part.'''
+    dx = x1 - x0
+    dy = y1 - y0
+    length_sq = dx ** 2 + dy ** 2
+    rel_x = cell_x - x0
+    rel_y = cell_y - y0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        along = (rel_x * dx + rel_y * dy) / length_sq
+        across_sq = np.maximum(rel_x ** 2 + rel_y ** 2 - along ** 2 * length_sq, 0)
+        half = np.sqrt(np.maximum(radius ** 2 - across_sq, 0) / length_sq)
+    near = np.clip(along - half, 0, 1)
+    far = np.clip(along + half, 0, 1)
+    z = np.minimum(z0 + (z1 - z0) * near, z0 + (z1 - z0) * far)
+    return np.where(length_sq > 0, z, np.minimum(z0, z1))
+
+
+def expand_spans(span_starts, span_stops):
+    '''every index in the half open ranges [span_starts, span_stops), range after range'''
+    lengths = span_stops - span_starts
+    offsets = np.cumsum(lengths) - lengths
+    return np.arange(int(lengths.sum())) - np.repeat(offsets - span_starts, lengths)
+
+
+class SimulationReport(object):
+    '''results of simulate():
+      heightmap: the stock after the job
+      removed_volume: stock volume removed
+      cut_seconds: estimated time of all cut moves
+      air_cut_seconds: estimated time of cut moves that removed nothing
+      air_cut_rows: action list row index of every cut move that removed nothing
+      rapid_collision_rows: row index of every jog that removed stock
+      gouge_area, max_gouge: area below the target (minus tolerance) and the deepest gouge
+    '''
+    def __init__(self, heightmap, removed_volume, cut_seconds, air_cut_seconds, air_cut_rows,
+                 rapid_collision_rows, gouge_area=0.0, max_gouge=0.0):
+        self.heightmap = heightmap
+        self.removed_volume = removed_volume
+        self.cut_seconds = cut_seconds
+        self.air_cut_seconds = air_cut_seconds
+        self.air_cut_rows = air_cut_rows
+        self.rapid_collision_rows = rapid_collision_rows
+        self.gouge_area = gouge_area
+        self.max_gouge = max_gouge
+
+    def __str__(self):
+        lines = ['removed volume: {:.1f}'.format(self.removed_volume),
+                 'air cutting: {:.1f}s of {:.1f}s cutting ({} moves)'.format(
+                     self.air_cut_seconds, self.cut_seconds, len(self.air_cut_rows)),
+                 'rapids into stock: {}'.format(len(self.rapid_collision_rows)),
+                 'gouges: area {:.2f}, deepest {:.3f}'.format(self.gouge_area, self.max_gouge),
+                 ]
+        return '\n'.join(lines)
+
+
+def move_spans(heightmap, starts, ends, radius, skip_start):
+    '''row spans of the cells each move from a row of starts to the same row of ends sweeps.
+    skip_start marks moves whose start cells are left out.
+    Returns (moves, rows, firsts, stops) arrays, one entry per span of cells
+    heights[rows, firsts:stops].'''
+    rows, cols = heightmap.shape
+    x0, y0 = starts[:, 0], starts[:, 1]
+    x1, y1 = ends[:, 0], ends[:, 1]
+    # one (move, row) pair per grid row the capsule reaches
+    row_first = np.maximum(heightmap.first_index(np.minimum(y0, y1) - radius, heightmap.y_min), 0)
+    row_last = np.minimum(heightmap.last_index(np.maximum(y0, y1) + radius, heightmap.y_min), rows - 1)
+    row_counts = np.maximum(row_last + 1 - row_first, 0)
+    pair_moves = np.repeat(np.arange(len(starts)), row_counts)
+    pair_rows = expand_spans(row_first, row_first + row_counts)
+    row_y = heightmap.y_min + (pair_rows + 0.5) * heightmap.resolution
+    x0, y0, x1, y1 = x0[pair_moves], y0[pair_moves], x1[pair_moves], y1[pair_moves]
+    left, right = capsule_interval(x0, y0, x1, y1, radius, row_y)
+    is_empty = left > right
+    col_first = np.maximum(heightmap.first_index(np.where(is_empty, 0, left), heightmap.x_min), 0)
+    col_stop = np.minimum(heightmap.last_index(np.where(is_empty, 0, right), heightmap.x_min) + 1, cols)
+    col_stop[is_empty] = 0
+    # cells under the start are left out by splitting the span around them
+    start_left, start_right = disk_interval(x0, y0, radius, row_y)
+    no_hole = ~skip_start[pair_moves] | (start_left > start_right)
+    hole_first = np.maximum(heightmap.first_index(np.where(no_hole, 0, start_left), heightmap.x_min), col_first)
+    hole_stop = np.minimum(heightmap.last_index(np.where(no_hole, 0, start_right), heightmap.x_min) + 1, col_stop)
+    has_hole = ~no_hole & (hole_first < hole_stop)
+    firsts = np.stack((col_first, np.where(has_hole, hole_stop, col_stop)), axis=1).reshape(-1)
+    stops = np.stack((np.where(has_hole, hole_first, col_stop), col_stop), axis=1).reshape(-1)
+    keep = firsts < stops
+    pairs = np.repeat(np.arange(len(pair_rows)), 2)[keep]
+    return pair_moves[pairs], pair_rows[pairs], firsts[keep], stops[keep]
+
+
+def chunk_bounds(heightmap, starts, ends, radius, chunk_size=DEFAULT_CHUNK_SIZE,
+                 chunk_cells=DEFAULT_CHUNK_CELLS, breaks=()):
+    '''(first, stop) move index pairs of chunks of at most chunk_size moves and, unless a
+    single move needs more, about chunk_cells swept cells.  A chunk also starts at every move
+    index in breaks.'''
+    vecs = ends[:, :2] - starts[:, :2]
+    lengths = np.sqrt(np.einsum('ij,ij->i', vecs, vecs))
+    resolution = heightmap.resolution
+    # capsule area, plus the cells rounded into the two spans of every row
+    cells = (2 * radius * lengths + np.pi * radius ** 2) / resolution ** 2
+    cells += 2 * (2 * radius + np.abs(vecs[:, 1])) / resolution
+    indices = np.arange(len(cells))
+    # count from the last break
+    sections = np.searchsorted(np.asarray(breaks, dtype=np.int64), indices, side='right')
+    section_firsts = np.flatnonzero(np.diff(sections, prepend=-1))
+    section_starts = np.repeat(section_firsts, np.diff(np.append(section_firsts, len(cells))))
+    cells_before = np.cumsum(cells) - cells
+    cells_before -= cells_before[section_starts]
+    # a new chunk starts when either count reaches its limit
+    chunk_ids = np.maximum(cells_before // chunk_cells, (indices - section_starts) // chunk_size)
+    is_first = (np.diff(chunk_ids, prepend=-1) != 0) | (indices == section_starts)
+    firsts = np.flatnonzero(is_first)
+    return list(zip(firsts.tolist(), np.append(firsts[1:], len(cells)).tolist()))
+
+
+def sweep_cells(flat_heights, cells, cell_z, lengths):
+    '''lower the cells (flat indices, span after span) to cell_z (an array or one number).
+    Returns a boolean array, True for the spans that had stock above cell_z.'''
+    cell_heights = flat_heights[cells]
+    touches = cell_heights > cell_z + TOLERANCE
+    if np.ndim(cell_z) == 0:
+        # duplicate cells all get the same value
+        flat_heights[cells] = np.minimum(cell_heights, cell_z)
+    else:
+        np.minimum.at(flat_heights, cells, cell_z)
+    return np.logical_or.reduceat(touches, np.cumsum(lengths) - lengths)
+
+
+def sweep_window(heights, z, rows, firsts, stops):
+    '''lower the spans heights[rows, firsts:stops] to z through the window of rows and columns
+    they cover, marking the covered cells with a running sum of +1/-1 at the span ends.
+    Returns a boolean array, True for the spans that had stock above z.'''
+    row_first, col_first = rows.min(), firsts.min()
+    window = heights[row_first:rows.max() + 1, col_first:stops.max()]
+    shape = (window.shape[0], window.shape[1] + 1)
+    rows = rows - row_first
+    firsts = rows * shape[1] + firsts - col_first
+    stops = rows * shape[1] + stops - col_first
+    size = shape[0] * shape[1]
+    ends = np.bincount(firsts, minlength=size) - np.bincount(stops, minlength=size)
+    covered = np.cumsum(ends.reshape(shape), axis=1)[:, :-1] > 0
+    above = np.zeros(shape, dtype=np.int64)
+    np.cumsum(window > z + TOLERANCE, axis=1, out=above[:, 1:])
+    above = above.reshape(-1)
+    np.minimum(window, z, out=window, where=covered)
+    return above[stops] > above[firsts]
+
+
+def reaching_moves(heightmap, starts, ends):
+    '''indices of the moves from a row of starts to the same row of ends that go below the
+    top of the stock, the others (such as safe jogs) cannot touch it'''
+    return np.flatnonzero(np.minimum(starts[:, 2], ends[:, 2]) < heightmap.heights.max() - TOLERANCE)
+
+
+def sweep_chunks(heightmap, starts, ends, radius, skip_start, removed=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 chunk_cells=DEFAULT_CHUNK_CELLS, breaks=()):
+    '''lower heightmap by sweeping the tool from each row of starts to the same row of ends
+    ((N, 3) arrays), in order, a chunk of moves at a time.  skip_start marks moves whose start
+    cells are known to be as low as the move can cut them.
+    Yields (first, stop) before sweeping each chunk of moves starts[first:stop], while the
+    heightmap holds the stock left by the moves before first.  Only moves that reach the stock
+    (see reaching_moves()) are swept and a chunk starts at the first of them at or after every
+    index in breaks.
+    removed (a boolean array, when given) is set True for the moves that removed stock, checked
+    against the stock before their chunk.'''
+    heights = heightmap.heights
+    cols = heightmap.shape[1]
+    flat_heights = heights.reshape(-1)
+    active = reaching_moves(heightmap, starts, ends)
+    starts, ends, skip_start = starts[active], ends[active], skip_start[active]
+    active_breaks = np.unique(np.searchsorted(active, breaks))
+    for first, stop in chunk_bounds(heightmap, starts, ends, radius, chunk_size, chunk_cells, active_breaks):
+        yield active[first], active[stop - 1] + 1
+        chunk_starts = starts[first:stop]
+        chunk_ends = ends[first:stop]
+        z0, z1 = chunk_starts[:, 2], chunk_ends[:, 2]
+        moves, rows, firsts, stops = move_spans(heightmap, chunk_starts, chunk_ends, radius,
+                                                skip_start[first:stop])
+        if len(moves) == 0:
+            continue
+        lengths = stops - firsts
+        # level moves and plunges cut every cell they reach at their lowest z
+        xy_lengths_sq = np.sum((chunk_ends[:, :2] - chunk_starts[:, :2]) ** 2, axis=1)
+        is_ramp = (np.abs(z1 - z0) > TOLERANCE) & (xy_lengths_sq > 0)
+        span_z = np.minimum(z0, z1)[moves]
+        if not np.any(is_ramp) and np.all(span_z == span_z[0]):
+            # usually a whole chunk is cut at one depth
+            window_size = (rows.max() + 1 - rows.min()) * (stops.max() + 1 - firsts.min())
+            if window_size <= lengths.sum():
+                touched_spans = sweep_window(heights, span_z[0], rows, firsts, stops)
+            else:
+                cells = expand_spans(rows * cols + firsts, rows * cols + stops)
+                touched_spans = sweep_cells(flat_heights, cells, span_z[0], lengths)
+        else:
+            cells = expand_spans(rows * cols + firsts, rows * cols + stops)
+            cell_z = np.repeat(span_z, lengths)
+            if np.any(is_ramp):
+                ramp_cells = np.repeat(is_ramp[moves], lengths)
+                ramps = np.repeat(moves, lengths)[ramp_cells]
+                flat_cells = cells[ramp_cells]
+                cell_x = heightmap.x_min + (flat_cells % cols + 0.5) * heightmap.resolution
+                cell_y = heightmap.y_min + (flat_cells // cols + 0.5) * heightmap.resolution
+                cell_z[ramp_cells] = lowest_z(*chunk_starts[ramps].T, *chunk_ends[ramps].T,
+                                              radius, cell_x, cell_y)
+            touched_spans = sweep_cells(flat_heights, cells, cell_z, lengths)
+        if removed is not None:
+            removed[active[first:stop]] = np.bincount(moves[touched_spans], minlength=len(z0)) > 0
+
+
+def sweep(heightmap, starts, ends, radius, skip_start, chunk_size=DEFAULT_CHUNK_SIZE,
+          chunk_cells=DEFAULT_CHUNK_CELLS):
+    '''lower heightmap by sweeping every move, see sweep_chunks().
+    Returns a boolean array, True for moves that removed stock.'''
+    removed = np.zeros(len(starts), dtype=bool)
+    for first, stop in sweep_chunks(heightmap, starts, ends, radius, skip_start, removed, chunk_size,
+                                    chunk_cells):
+        pass
+    return removed
+
+
+def highest_stock(heightmap, starts, ends, radius, skip_start=None):
+    '''highest stock within radius of the x/y path of each move from a row of starts to the
+    same row of ends, leaving out the cells under the start of the moves marked in skip_start.
+    -inf where there is no cell of the heightmap.'''
+    result = np.full(len(starts), -np.inf)
+    if skip_start is None:
+        skip_start = np.zeros(len(starts), dtype=bool)
+    moves, rows, firsts, stops = move_spans(heightmap, starts, ends, radius, skip_start)
+    if len(moves) > 0:
+        cols = heightmap.shape[1]
+        lengths = stops - firsts
+        cells = expand_spans(rows * cols + firsts, rows * cols + stops)
+        span_highs = np.maximum.reduceat(heightmap.heights.reshape(-1)[cells], np.cumsum(lengths) - lengths)
+        np.maximum.at(result, moves, span_highs)
+    return result
+
+
+def motion_rows(actions, start=None):
+    '''the motions of an ArrayActionList that move the tool, as (rows, starts, ends, skip_start):
+    their row indices, the (N, 3) arrays of positions before and after them and which of them
+    continue from the previous motion without going down, see sweep_chunks().
+    An arc row is repeated for each chord it is cut as (see ArrayActionList.linear_rows()).
+    start is the position before the first row, by default where the first row is.'''
+    if start is None:
+        start = actions.xyz[0]
+    sources, xyz = actions.linear_rows(start)
+    starts = np.concatenate((np.asarray(start, dtype=np.float64).reshape(1, 3), xyz[:-1]))
+    moved = np.any(np.abs(xyz - starts) > TOLERANCE, axis=1)
+    moves = np.flatnonzero((actions.opcodes[sources] != action.OP_STATE) & moved)
+    # every move ends with the tool over its end cells, the next move starts there
+    skip_start = np.zeros(len(moves), dtype=bool)
+    skip_start[1:] = xyz[moves, 2][1:] >= starts[moves, 2][1:]
+    return sources[moves], starts[moves], xyz[moves], skip_start
+
+
+def simulate(actions, tool, stock=None, target=None, resolution=DEFAULT_RESOLUTION, limits=None,
+             start=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''sweep tool (its cut_diameter) along the motions of actions (an ActionList or
+    ArrayActionList) through stock, a Heightmap (by default flat at z=0 around the motions).
+    target is the lowest height the job should leave: a number or an array shaped like the
+    heightmap; lower cells are gouges.
+    start is the position before the first action, by default where the first action is.
+    Cut time is estimated like estimate.row_seconds() with limits.
+    Air cuts are found conservatively: a move that cuts only what an earlier move of the same
+    chunk (of chunk_size moves) removed still counts as removing stock, chunk_size=1 is exact.
+    Returns a SimulationReport.'''
+    if not isinstance(actions, action.ArrayActionList):
+        actions = action.ArrayActionList(actions)
+    radius = tool.cut_diameter / 2
+    xyz = actions.xyz
+    if stock is None:
+        stock = Heightmap.around(xyz, radius + resolution, resolution)
+    heightmap = stock.copy()
+    if len(actions) == 0:
+        return SimulationReport(heightmap, 0.0, 0.0, 0.0, [], [])
+    rows, starts, ends, skip_start = motion_rows(actions, start)
+    chord_removed = sweep(heightmap, starts, ends, radius, skip_start, chunk_size)
+    # a row removed stock if any of its chords did
+    rows, chord_rows = np.unique(rows, return_inverse=True)
+    removed = np.zeros(len(rows), dtype=bool)
+    np.logical_or.at(removed, chord_rows, chord_removed)
+    seconds = estimate.row_seconds(actions, limits, start)[rows]
+    is_cut = actions.opcodes[rows] != action.OP_JOG
+    is_air = is_cut & ~removed
+    lowered = np.maximum(stock.heights - heightmap.heights, 0)
+    report = SimulationReport(heightmap,
+                              removed_volume=float(lowered.sum() * heightmap.cell_area),
+                              cut_seconds=float(seconds[is_cut].sum()),
+                              air_cut_seconds=float(seconds[is_air].sum()),
+                              air_cut_rows=rows[is_air].tolist(),
+                              rapid_collision_rows=rows[~is_cut & removed].tolist())
+    if target is not None:
+        below = target - heightmap.heights
+        gouged = below > TOLERANCE
+        report.gouge_area = float(np.count_nonzero(gouged) * heightmap.cell_area)
+        report.max_gouge = float(below[gouged].max()) if np.any(gouged) else 0.0
+    return report
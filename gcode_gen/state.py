@@ -11,11 +11,91 @@ DEFAULT_START = Point(0, 0, 70)
 DEFAULT_SPINDLE_SPEED = 10000
 
 
+MISSING = object()  # marks a key that did not exist before a scope changed it
+
+
 class State(dict):
+    '''dict of machine state with cheap nested let()/excursion() scopes.
+    Each open scope keeps an undo log of the value every key had before the scope first
+    changed it, so opening and closing a scope costs only the keys changed inside it.'''
+    # class level defaults, these are also used while unpickling, before __dict__ is restored
+    _scopes = ()
+    _checkpoint = None
+
     def __init__(self, *args, **kwargs):
         if len(args) > 0:
             raise ValueError('only supports kwargs, not args')
         super().__init__(**kwargs)
+        self._scopes = []
+
+    def __setitem__(self, key, value):
+        if self._scopes:
+            self._record(key)
+        self._checkpoint = None
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        if self._scopes:
+            self._record(key)
+        self._checkpoint = None
+        dict.__delitem__(self, key)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def pop(self, key, *default):
+        if key not in self:
+            return dict.pop(self, key, *default)
+        value = dict.__getitem__(self, key)
+        del self[key]
+        return value
+
+    def popitem(self):
+        if not self:
+            raise KeyError('popitem(): dictionary is empty')
+        key = next(reversed(self))
+        return key, self.pop(key)
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+    def _record(self, key):
+        scope = self._scopes[-1]
+        if key not in scope:
+            scope[key] = dict.get(self, key, MISSING)
+
+    def _push_scope(self):
+        if not self._scopes:
+            # after unpickling the class level default may still be shared
+            self._scopes = []
+        self._scopes.append({})
+
+    def _pop_scope(self, restore):
+        '''close the innermost scope, restoring the old value of every key it changed for
+        which restore(key) is true.  Changes that are kept move to the enclosing scope,
+        so it can still undo them.'''
+        scope = self._scopes.pop()
+        outer = self._scopes[-1] if self._scopes else None
+        for key, old_value in scope.items():
+            if restore(key):
+                self._checkpoint = None
+                if old_value is MISSING:
+                    dict.pop(self, key, None)
+                else:
+                    dict.__setitem__(self, key, old_value)
+            elif outer is not None and key not in outer:
+                outer[key] = old_value
 
     @contextmanager
     def let(self, **kwargs):
@@ -30,10 +110,12 @@ class State(dict):
         >>> print(state['feed_rate'])
         40
         '''
-        stored_state = [(key, self[key]) for key in kwargs.keys()]
-        self.update(kwargs)
-        yield
-        self.update(stored_state)
+        self._push_scope()
+        try:
+            self.update(kwargs)
+            yield
+        finally:
+            self._pop_scope(kwargs.__contains__)
 
     @contextmanager
     def excursion(self, nosave=()):
@@ -50,18 +132,38 @@ class State(dict):
         40
         '''
         assert isinstance(nosave, tuple), isinstance(nosave, list)
-        stored_state = []
-        for key in self.keys():
-            if key not in nosave:
-                stored_state.append((key, self[key]))
-        yield
-        nosave_key_vals = [(key, self[key]) for key in nosave]
-        self.clear()
-        self.update(nosave_key_vals)
-        self.update(stored_state)
+        self._push_scope()
+        try:
+            yield
+        finally:
+            self._pop_scope(lambda key: key not in nosave)
+
+    def checkpoint(self):
+        '''immutable snapshot of the key/values, see restore().
+        Cached until the next change, so taking one at every subtree is free while the
+        state does not change.'''
+        if self._checkpoint is None:
+            self._checkpoint = tuple(dict.items(self))
+        return self._checkpoint
+
+    def restore(self, checkpoint):
+        '''set the state to a checkpoint(), only the keys that differ are changed'''
+        if checkpoint is self._checkpoint:
+            return
+        values = dict(checkpoint)
+        for key in [key for key in self if key not in values]:
+            del self[key]
+        for key, value in checkpoint:
+            if dict.get(self, key, MISSING) is not value:
+                self[key] = value
+        self._checkpoint = checkpoint
 
     def copy(self):
-        return self.__class__(**self)
+        '''new state with the same key/values and no open scopes'''
+        result = self.__class__.__new__(self.__class__)
+        dict.update(result, self)
+        result._scopes = []
+        return result
 
 
 class CncState(State):
@@ -1,6 +1,7 @@
 '''
 Homogenous affine/linear transforms for x/y/z coordinates.
 '''
+import functools
 import numpy as np
 from numpy.linalg import norm
 from . import point
@@ -46,7 +47,127 @@ def rotate_mat(phi, x=0, y=0, z=1):
     return mat
 
 
+AFFINE_ROW = np.array((0., 0., 0., 1.))
+
+
+def is_affine(mat):
+    '''True when mat has a (0, 0, 0, 1) bottom row, as every matrix built here does'''
+    return mat[3, 0] == 0 and mat[3, 1] == 0 and mat[3, 2] == 0 and mat[3, 3] == 1
+
+
+def check_points(arr):
+    if not isinstance(arr, np.ndarray):
+        raise TypeError("expected argument to be numpy ndarray")
+    if len(arr.shape) != 2:
+        raise TypeError("expected argument.shape to be length 2, not {}".format(len(arr.shape)))
+    if arr.shape[1] != 3:
+        raise TypeError("expected argument to be array of 3-d points")
+
+
+def apply_matrix(mat, arr):
+    '''apply 4x4 homogenous transform matrix mat to an (N, 3) array of points'''
+    check_points(arr)
+    if arr.shape[0] == 0:
+        raise IndexError("expected at least one point!")
+    if is_affine(mat):
+        # skip the homogeneous coordinate
+        result = np.dot(arr, mat[:3, :3].T)
+        result += mat[:3, 3]
+        return result
+    one_vec = np.ones((arr.shape[0], 1))
+    point_vectors = np.concatenate((arr, one_vec), axis=1)
+    result = np.dot(mat, point_vectors.T)
+    result = result[:-1].T
+    return result
+
+
+def apply_matrix_point(mat, xyz):
+    '''apply 4x4 transform matrix mat to a single x/y/z point, returns a length 3 array.
+    No argument checks, for the many one point callers.'''
+    if is_affine(mat):
+        return np.dot(mat[:3, :3], xyz) + mat[:3, 3]
+    return np.dot(mat, np.append(xyz, 1.))[:3]
+
+
+def apply_matrix_segments(mats, arr, offsets):
+    '''apply mats[k] to the segment arr[offsets[k]:offsets[k + 1]] of an (N, 3) array of points,
+    for all K segments in one call.
+    mats is a (K, 4, 4) array, offsets has K + 1 increasing entries starting at 0 and ending at N.
+    Returns the (N, 3) transformed points.'''
+    check_points(arr)
+    mats = np.asarray(mats, dtype=np.float64)
+    offsets = np.asarray(offsets)
+    if mats.ndim != 3 or mats.shape[1:] != (4, 4):
+        raise TypeError("expected a (K, 4, 4) array of matrices")
+    if offsets.shape != (mats.shape[0] + 1, ) or offsets[0] != 0 or offsets[-1] != arr.shape[0]:
+        raise ValueError("expected offsets of length K + 1 spanning all {} points".format(arr.shape[0]))
+    counts = np.diff(offsets)
+    is_affine_all = np.all(mats[:, 3] == AFFINE_ROW)
+    if len(counts) > 0 and np.all(counts == counts[0]):
+        # equal segments, such as the same points under every matrix: one stacked matmul
+        stacked = arr.reshape(mats.shape[0], counts[0], 3)
+        if is_affine_all:
+            result = np.matmul(stacked, mats[:, :3, :3].transpose(0, 2, 1))
+            result += mats[:, np.newaxis, :3, 3]
+        else:
+            homogeneous = np.concatenate((stacked, np.ones(stacked.shape[:2] + (1, ))), axis=2)
+            result = np.matmul(homogeneous, mats[:, :3].transpose(0, 2, 1))
+        return result.reshape(-1, 3)
+    point_mats = mats[np.repeat(np.arange(mats.shape[0]), counts)]
+    if is_affine_all:
+        result = np.einsum('nij,nj->ni', point_mats[:, :3, :3], arr)
+        result += point_mats[:, :3, 3]
+        return result
+    # like apply_matrix, the homogeneous coordinate is dropped without dividing
+    homogeneous = np.concatenate((arr, np.ones((arr.shape[0], 1))), axis=1)
+    return np.einsum('nij,nj->ni', point_mats[:, :3], homogeneous)
+
+
+def apply_matrix_each(mats, arrs):
+    '''apply mats[k] to arrs[k] for a sequence of (N_k, 3) point arrays in one call,
+    returns a list of the transformed arrays'''
+    arrs = [np.asarray(arr, dtype=np.float64).reshape(-1, 3) for arr in arrs]
+    if not arrs:
+        return []
+    offsets = np.concatenate(((0, ), np.cumsum([arr.shape[0] for arr in arrs])))
+    result = apply_matrix_segments(mats, np.concatenate(arrs), offsets)
+    return np.split(result, offsets[1:-1])
+
+
+def _invalidating(method):
+    '''wrap a list mutation method so the cached composition is dropped'''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self.changed()
+        return result
+    return wrapper
+
+
 class TransformList(list):
+    '''list of (name, 4x4 matrix) tuples, applied first to last.
+    The composition is cached until the list is modified.
+    on_change, when set, is called after every modification.'''
+    # class level defaults, these are also used while unpickling, before __dict__ is restored
+    _composition = None
+    on_change = None
+
+    append = _invalidating(list.append)
+    extend = _invalidating(list.extend)
+    insert = _invalidating(list.insert)
+    pop = _invalidating(list.pop)
+    remove = _invalidating(list.remove)
+    clear = _invalidating(list.clear)
+    reverse = _invalidating(list.reverse)
+    sort = _invalidating(list.sort)
+    __setitem__ = _invalidating(list.__setitem__)
+    __delitem__ = _invalidating(list.__delitem__)
+    __iadd__ = _invalidating(list.__iadd__)
+
+    def changed(self):
+        self._composition = None
+        if self.on_change is not None:
+            self.on_change()
 
     def translate(self, x=0, y=0, z=0):
         self.append(('T', translate_mat(x, y, z)))
@@ -63,25 +184,17 @@ class TransformList(list):
         self.append((name, mat))
 
     def get_composition(self):
-        result = np.identity(4)
-        for (id, mat) in self:
-            result = np.dot(mat, result)
-        return result
+        '''return the composed 4x4 matrix (read only, cached)'''
+        if self._composition is None:
+            result = np.identity(4)
+            for (id, mat) in self:
+                result = np.dot(mat, result)
+            result.setflags(write=False)
+            self._composition = result
+        return self._composition
 
     def __call__(self, arr):
-        if not isinstance(arr, np.ndarray):
-            raise TypeError("expected argument to be numpy ndarray")
-        if len(arr.shape) != 2:
-            raise TypeError("expected argument.shape to be length 2, not {}".format(len(arr.shape)))
-        if arr.shape[1] != 3:
-            raise TypeError("expected argument to be array of 3-d points")
-        if arr.shape[0] == 0:
-            raise IndexError("expected at least one point!")
-        one_vec = np.ones((arr.shape[0], 1))
-        point_vectors = np.concatenate((arr, one_vec), axis=1)
-        result = np.dot(self.get_composition(), point_vectors.T)
-        result = result[:-1].T
-        return result
+        return apply_matrix(self.get_composition(), arr)
 
     def __str__(self):
         results = []
@@ -95,6 +208,20 @@ class TransformableMixin(object):
         self.transforms = TransformList()
         super().__init__(*args, **kwargs)
 
+    @property
+    def transforms(self):
+        return self._transforms
+
+    @transforms.setter
+    def transforms(self, transform_list):
+        transform_list.on_change = self.transforms_changed
+        self._transforms = transform_list
+        self.transforms_changed()
+
+    def transforms_changed(self):
+        '''called whenever the transform list is modified or replaced, override in subclass'''
+        pass
+
     def translate(self, x=0, y=0, z=0):
         self.transforms.translate(x, y, z)
         return self
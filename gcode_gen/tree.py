@@ -1,6 +1,12 @@
 '''basic tree data structure'''
 from . import base_types
 
+# walk step kinds yielded by Tree.walk() as (kind, node) tuples
+MOVE_DOWN = 0
+PREORDER = 1
+POSTORDER = 2
+MOVE_UP = 3
+
 
 class Tree(base_types.Named):
     def __init__(self, name=None, parent=None):
@@ -24,39 +30,64 @@ class Tree(base_types.Named):
     def __str__(self):
         return self.tree_str()
 
+    def walk(self):
+        '''depth first walk yielding (kind, node) tuples, where kind is one of
+        MOVE_DOWN, PREORDER, POSTORDER, MOVE_UP.
+        Uses an explicit stack, so each step is O(1) regardless of depth.
+        A node's children are read after its PREORDER step is consumed, so they may be
+        updated at that point.'''
+        yield MOVE_DOWN, self
+        yield PREORDER, self
+        stack = [(self, iter(self.children))]
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                yield POSTORDER, node
+                yield MOVE_UP, node
+            else:
+                yield MOVE_DOWN, child
+                yield PREORDER, child
+                stack.append((child, iter(child.children)))
+
     def depth_first_walk(self):
-        yield MoveDown()
-        yield PreOrderVisit(self)
-        for child in self.children:
-            for walk_step in child.depth_first_walk():
-                yield walk_step
-        yield PostOrderVisit(self)
-        yield MoveUp()
+        '''same walk as walk(), yielding WalkStep objects'''
+        for kind, node in self.walk():
+            if kind == PREORDER:
+                yield PreOrderVisit(node)
+            elif kind == POSTORDER:
+                yield PostOrderVisit(node)
+            elif kind == MOVE_DOWN:
+                yield MOVE_DOWN_STEP
+            else:
+                yield MOVE_UP_STEP
 
     def tree_str(self):
         indent = 0
         result_lines = []
-        for step in self.depth_first_walk():
-            if step.is_move:
-                if step.is_down:
-                    indent += 1
-                else:
-                    indent -= 1
-            elif step.is_visit:
-                if step.is_preorder:
-                    result_lines.append('{}{}'.format(' ' * (indent - 1), step.visited.name))
+        for kind, node in self.walk():
+            if kind == MOVE_DOWN:
+                indent += 1
+            elif kind == MOVE_UP:
+                indent -= 1
+            elif kind == PREORDER:
+                result_lines.append('{}{}'.format(' ' * (indent - 1), node.name))
         return '\n'.join(result_lines) + '\n'
 
     def pretty_line(self, prefix):
         return "{}{}".format(self.prefix, self.name, )
 
     def root_walk(self,):
+        ancestry = [self]
+        while ancestry[-1].parent is not None:
+            ancestry.append(ancestry[-1].parent)
         yield PreOrderVisit(self)
-        if self.parent is not None:
-            yield MoveUp()
-            for walk_step in self.parent.root_walk():
-                yield walk_step
-        yield PostOrderVisit(self)
+        for node in ancestry[1:]:
+            yield MOVE_UP_STEP
+            yield PreOrderVisit(node)
+        for node in reversed(ancestry):
+            yield PostOrderVisit(node)
 
 
 class WalkStep(object):
@@ -150,3 +181,6 @@ class PostOrderVisit(WalkStep):
                          node=node)
 
 
+# move steps carry no node, so the walks share these instances
+MOVE_DOWN_STEP = MoveDown()
+MOVE_UP_STEP = MoveUp()
@@ -31,7 +31,7 @@ setup(
         'Programming Language :: Python :: 3',
     ],
     keywords='',
-    packages=find_packages(exclude=['docs', 'tests*']),
+    packages=find_packages(exclude=['docs', 'tests*', 'benchmarks*']),
     include_package_data=True,
     author='tulth',
     install_requires=install_requires,
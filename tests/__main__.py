@@ -9,6 +9,7 @@ from .test_tree import *
 # numerics
 from .test_number import *
 from .test_iter import *
+from .test_array_util import *
 from .test_point import *
 from .test_transform import *
 from .test_poly import *
@@ -16,9 +17,17 @@ from .test_poly_fill import *
 # gcode / machine
 from .test_gcode import *
 from .test_state import *
+from .test_action import *
 #
 from .test_assembly import *
+from .test_arena import *
+from .test_repeat import *
 from .test_cut import *
+from .test_optimize import *
+from .test_estimate import *
+from .test_simulate import *
+from .test_air_cut import *
+from .test_arc_fit import *
 #
 from .test_project import *
 
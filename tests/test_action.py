@@ -0,0 +1,146 @@
+import unittest
+import numpy as np
+from gcode_gen import action
+from gcode_gen import cut
+from gcode_gen import project
+from gcode_gen.tool import Carbide3D_101
+from gcode_gen.state import CncState
+from gcode_gen.point import Point
+
+
+def gen_test_tool_pass():
+    tool = Carbide3D_101()
+    state = CncState(tool=tool, z_safe=40, feed_rate=None, milling_feed_rate=50, drilling_feed_rate=20)
+    root = project.ToolPass(name='file', state=state)
+    root += cut.Mill(((0, 0), (17, 19), (17, 0))).translate(7, 11)
+    root += cut.Drill(depth=2).translate(3, 5)
+    return root
+
+
+class TestArrayActionList(unittest.TestCase):
+    def test_matches_action_list(self):
+        root = gen_test_tool_pass()
+        al = root.get_actions()
+        aal = root.get_actions(action.ArrayActionList)
+        self.assertIsInstance(aal, action.ArrayActionList)
+        # a MotionBlock is one action in an ActionList and one row per move in an ArrayActionList
+        self.assertEqual(len(aal), sum(len(elem) if isinstance(elem, action.MotionBlock) else 1 for elem in al))
+        self.assertEqual(str(aal), str(al))
+        actual = '\n'.join(map(str, aal.get_gcode()))
+        expect = '\n'.join(map(str, al.get_gcode()))
+        self.assertEqual(actual, expect)
+        actual = aal.get_points().arr
+        expect = al.get_points().arr
+        self.assertTrue(np.allclose(actual, expect), 'actual: {}\nexpect:{}'.format(actual, expect))
+
+    def test_columns(self):
+        root = gen_test_tool_pass()
+        aal = root.get_actions(action.ArrayActionList)
+        motion = aal.opcodes != action.OP_STATE
+        self.assertEqual(len(aal.get_points()), np.count_nonzero(motion))
+        # feed rate column follows the SetFeedRate actions
+        cut_feeds = aal.feed_rates[aal.opcodes == action.OP_CUT]
+        self.assertTrue(np.allclose(cut_feeds, [50, 50, 20, 20, 20, 20]), cut_feeds)
+        self.assertTrue(np.allclose(aal.spindle_speeds[motion], 10000))
+
+    def test_index(self):
+        root = gen_test_tool_pass()
+        aal = root.get_actions(action.ArrayActionList)
+        self.assertIsInstance(aal[0], action.Home)
+        last_motion = aal[-2]
+        self.assertIsInstance(last_motion, action.ArrayMotion)
+        self.assertEqual(str(last_motion), 'Jog (0.00000, 0.00000, 40.00000)')
+        self.assertEqual(last_motion.changes, {'x': 0, 'y': 0})
+        self.assertEqual(list(map(str, last_motion.get_gcode())), ['G0 X0.00000 Y0.00000'])
+        with self.assertRaises(IndexError):
+            aal[len(aal)]
+        tail = aal[-3:]
+        self.assertEqual(str(tail), '\n'.join(map(str, list(aal)[-3:])))
+
+    def test_extend(self):
+        root = gen_test_tool_pass()
+        al = root.get_actions()
+        aal = action.ArrayActionList(al)
+        aal2 = action.ArrayActionList()
+        aal2 += aal
+        aal2 += aal[:2]
+        self.assertEqual(len(aal2), len(aal) + 2)
+        self.assertEqual(str(aal2[:len(aal)]), str(al))
+        with self.assertRaises(TypeError):
+            aal2.append('G0')
+
+    def test_get_gcode_lines(self):
+        root = gen_test_tool_pass()
+        root += cut.Polygon(vertices=((0, 0), (3, 1), (2, 3), (1, 2), (-1, 3)),
+                            depth=1, cut_style='inside-cut', is_filled=True)
+        aal = root.get_actions(action.ArrayActionList)
+        actual = aal.get_gcode_lines()
+        expect = list(map(str, root.get_gcode()))
+        self.assertEqual(actual, expect)
+        self.assertEqual(action.ArrayActionList().get_gcode_lines(), [])
+
+
+class TestMotionBlock(unittest.TestCase):
+    def gen_state(self):
+        return CncState(tool=Carbide3D_101(), z_safe=40, feed_rate=None, milling_feed_rate=50)
+
+    def test_matches_motions(self):
+        xyz = np.array(((1, 2, 0), (1, 2, 0), (3, 2, 0), (3, 2, -1), (3, 2, -1), (0, 0, 0)), dtype=np.float64)
+        for motion_class in (action.Cut, action.Jog):
+            block_state = self.gen_state()
+            block = action.MotionBlock(xyz, motion_class, state=block_state)
+            motion_state = self.gen_state()
+            al = action.ActionList()
+            for row in xyz:
+                al.append(motion_class(*row, state=motion_state))
+            self.assertEqual(str(block), str(al))
+            self.assertEqual(list(map(str, block.get_gcode())), list(map(str, al.get_gcode())))
+            self.assertEqual(block.get_gcode_lines(), list(map(str, al.get_gcode())))
+            self.assertEqual(block_state['position'], motion_state['position'])
+            self.assertFalse(block.skip)
+            block_al = action.ActionList()
+            block_al.append(block)
+            self.assertTrue(np.allclose(block_al.get_points().arr, al.get_points().arr))
+            aal = action.ArrayActionList((block, ))
+            self.assertEqual(len(aal), len(al))
+            self.assertEqual(aal.get_gcode_lines(), list(map(str, al.get_gcode())))
+            self.assertEqual(str(aal), str(al))
+
+    def test_skip(self):
+        state = self.gen_state()
+        block = action.MotionBlock(np.tile(state['position'].xyz, (3, 1)), state=state)
+        self.assertTrue(block.skip)
+        al = action.ActionList()
+        al.append(block)
+        self.assertEqual(len(al), 0)
+        self.assertTrue(action.MotionBlock(np.zeros((0, 3)), state=state).skip)
+
+    def test_replay(self):
+        state = self.gen_state()
+        block = action.MotionBlock(((1, 2, 3), (4, 5, 6)), state=state)
+        replayed = block.replay(state, ((4, 5, 6), (7, 8, 9)))
+        self.assertEqual(str(replayed), 'Cut (7.00000, 8.00000, 9.00000)')
+        self.assertEqual(state['position'], Point(7, 8, 9))
+
+
+class TestArcRows(unittest.TestCase):
+    def test_gcode(self):
+        aal = action.ArrayActionList.from_columns(
+            opcodes=(action.OP_JOG, action.OP_ARC, action.OP_ARC),
+            xyz=((1, 0, -1), (0, 1, -1), (-1, 0, -1)),
+            axis_masks=(action.POINT_BIT | 7, action.POINT_BIT | 3, action.POINT_BIT | 3),
+            feed_rates=(np.nan, 50, 50),
+            spindle_speeds=(np.nan, np.nan, np.nan),
+            arc_radii=(np.nan, 1, -1),
+            objects={})
+        self.assertEqual(str(aal[1]), 'Arc (0.00000, 1.00000, -1.00000) G3 1.00000')
+        self.assertEqual(aal[2].signed_radius, -1)
+        self.assertEqual(list(map(str, aal[2].get_gcode())), ['G2 X-1.00000 Y0.00000 R1.00000'])
+        expect = ['G0 X1.00000 Y0.00000 Z-1.00000', 'G3 X0.00000 Y1.00000 R1.00000', 'G2 X-1.00000 Y0.00000 R1.00000']
+        self.assertEqual(aal.get_gcode_lines(), expect)
+        self.assertEqual(list(map(str, aal.get_gcode())), expect)
+        # arc rows copy one by one
+        copied = action.ArrayActionList(list(aal))
+        self.assertEqual(copied.opcodes.tolist(), aal.opcodes.tolist())
+        self.assertEqual(copied.arc_radii[1:].tolist(), [1, -1])
+        self.assertEqual(copied.get_gcode_lines(), expect)
@@ -0,0 +1,85 @@
+import unittest
+import numpy as np
+from gcode_gen import action
+from gcode_gen import air_cut
+from gcode_gen import simulate
+from gcode_gen.point import Point
+from gcode_gen.tool import Carbide3D_101
+from gcode_gen.state import CncState
+
+
+def gen_actions(*moves):
+    '''moves are (kind, x, y, z) with kind 'cut' or 'jog' '''
+    state = CncState(tool=Carbide3D_101(), z_safe=40, milling_feed_rate=600)
+    state['position'] = Point(0, 0, 10)
+    al = action.ActionList()
+    al += action.SetFeedRate(600, state=state)
+    for kind, x, y, z in moves:
+        al += (action.Cut if kind == 'cut' else action.Jog)(x, y, z, state=state)
+    return al
+
+
+def run(al, **kwargs):
+    stock = simulate.Heightmap(-5, -5, 30, 10)
+    new, report = air_cut.eliminate_air_cuts(al, Carbide3D_101(), stock=stock, start=(0, 0, 10), **kwargs)
+    before = simulate.simulate(al, Carbide3D_101(), stock=stock, start=(0, 0, 10))
+    after = simulate.simulate(new, Carbide3D_101(), stock=stock, start=(0, 0, 10), chunk_size=1)
+    return new, report, before, after
+
+
+class TestFindGaps(unittest.TestCase):
+    def test_runs(self):
+        opcodes = np.array([action.OP_STATE, action.OP_CUT, action.OP_CUT, action.OP_JOG, action.OP_CUT,
+                            action.OP_STATE, action.OP_JOG])
+        rows = np.array([1, 2, 3, 4, 6])
+        removed = np.array([True, False, False, True, False])
+        firsts, stops, counts = air_cut.find_gaps(opcodes, rows, removed)
+        # the lone jog is not a gap, it cuts nothing
+        self.assertEqual(firsts.tolist(), [2])
+        self.assertEqual(stops.tolist(), [4])
+        self.assertEqual(counts.tolist(), [1])
+
+
+class TestEliminateAirCuts(unittest.TestCase):
+    def test_retrace(self):
+        al = gen_actions(('jog', 0, 0, 1), ('cut', 0, 0, -1), ('cut', 20, 0, -1), ('cut', 0, 0, -1),
+                         ('cut', 0, 0, -2), ('cut', 20, 0, -2))
+        new, report, before, after = run(al, chunk_size=1)
+        self.assertEqual(report.air_cut_count, 1)
+        self.assertEqual(report.gap_count, 1)
+        self.assertLess(report.seconds_after, report.seconds_before)
+        self.assertIn('1 air cuts in 1 gaps', str(report))
+        self.assertEqual(after.air_cut_rows, [])
+        self.assertEqual(after.rapid_collision_rows, [])
+        self.assertTrue(np.array_equal(before.heightmap.heights, after.heightmap.heights))
+        self.assertEqual(int(np.sum(new.opcodes == action.OP_CUT)), 4)
+
+    def test_keep_paths(self):
+        al = gen_actions(('jog', 0, 0, 1), ('cut', 0, 0, -1), ('cut', 20, 0, -1), ('cut', 0, 0, -1),
+                         ('cut', 0, 0, -2), ('cut', 20, 0, -2))
+        new, report, before, after = run(al, keep_paths=True, chunk_size=1)
+        self.assertEqual(len(new), len(al))
+        self.assertTrue(np.array_equal(new.xyz, action.ArrayActionList(al).xyz))
+        self.assertEqual(new.opcodes[4], action.OP_JOG)
+        self.assertTrue(np.array_equal(before.heightmap.heights, after.heightmap.heights))
+
+    def test_peck(self):
+        # like cut.Drill, each pass cuts back up to the top and down through its own hole
+        al = gen_actions(('jog', 10, 0, 1), ('cut', 10, 0, -1), ('cut', 10, 0, 0), ('cut', 10, 0, -2),
+                         ('cut', 10, 0, 0), ('cut', 10, 0, -3), ('cut', 10, 0, 0), ('jog', 10, 0, 40))
+        new, report, before, after = run(al)
+        self.assertEqual(report.gap_count, 3)
+        self.assertTrue(np.array_equal(before.heightmap.heights, after.heightmap.heights))
+        self.assertEqual(after.rapid_collision_rows, [])
+        # the plunges only cut below the bottom of the hole
+        cut_starts = [new.xyz[row - 1, 2] for row in np.flatnonzero(new.opcodes == action.OP_CUT)]
+        self.assertEqual(len(cut_starts), 3)
+        self.assertAlmostEqual(cut_starts[1], -1 + air_cut.DEFAULT_CLEARANCE)
+        self.assertAlmostEqual(cut_starts[2], -2 + air_cut.DEFAULT_CLEARANCE)
+
+    def test_no_air(self):
+        al = gen_actions(('jog', 0, 0, 1), ('cut', 0, 0, -1), ('cut', 20, 0, -1), ('jog', 20, 0, 40))
+        new, report, before, after = run(al)
+        self.assertEqual(report.gap_count, 0)
+        self.assertEqual(len(new), len(al))
+        self.assertAlmostEqual(report.time_saved, 0)
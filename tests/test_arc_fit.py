@@ -0,0 +1,136 @@
+import unittest
+import numpy as np
+from gcode_gen import action
+from gcode_gen import air_cut
+from gcode_gen import arc_fit
+from gcode_gen import cut
+from gcode_gen import estimate
+from gcode_gen import project
+from gcode_gen import simulate
+from gcode_gen.point import Point
+from gcode_gen.tool import Carbide3D_101
+from gcode_gen.state import CncState
+
+
+def gen_actions(xyz):
+    '''jog above the first row of xyz, plunge and cut through the rest'''
+    state = CncState(tool=Carbide3D_101(), z_safe=40, milling_feed_rate=600)
+    state['position'] = Point(0, 0, 10)
+    al = action.ActionList()
+    al += action.SetFeedRate(600, state=state)
+    al += action.Jog(xyz[0][0], xyz[0][1], 1, state=state)
+    al += action.Cut(*xyz[0], state=state)
+    al += action.MotionBlock(xyz[1:], state=state)
+    return al
+
+
+def circle(radius, segments, z=-1, turns=1.0):
+    angles = np.linspace(0, 2 * np.pi * turns, segments + 1)
+    return np.column_stack((radius * np.cos(angles), radius * np.sin(angles), np.full(segments + 1, z)))
+
+
+class TestCircumcircles(unittest.TestCase):
+    def test_circles(self):
+        centers, radii, turns = arc_fit.circumcircles(np.array(((4.0, 3, 0), (1, 0, 0))),
+                                                      np.array(((3.0, 4, 0), (2, 0, 0))),
+                                                      np.array(((2.0, 3, 0), (3, 0, 0))))
+        self.assertTrue(np.allclose(centers[0], (3, 3)))
+        self.assertAlmostEqual(radii[0], 1)
+        self.assertGreater(turns[0], 0)
+        self.assertEqual(radii[1], np.inf)
+        self.assertEqual(turns[1], 0)
+
+
+class TestFitArcs(unittest.TestCase):
+    def test_circle(self):
+        al = gen_actions(circle(5, 64))
+        new, report = arc_fit.fit_arcs(al)
+        self.assertEqual(report.segment_count, 64)
+        # a quarter circle each
+        self.assertEqual(report.arc_count, 4)
+        self.assertEqual(report.rows_after, report.rows_before - 64 + 4)
+        self.assertIn('64 segments fitted with 4 arcs', str(report))
+        arc_rows = np.flatnonzero(new.opcodes == action.OP_ARC)
+        self.assertEqual(len(arc_rows), 4)
+        # counterclockwise arcs have positive radii
+        self.assertTrue(np.allclose(new.arc_radii[arc_rows], 5))
+        lines = new.get_gcode_lines()
+        self.assertEqual(sum(line.startswith('G3 ') for line in lines), 4)
+        self.assertEqual(lines[-1], 'G3 X5.00000 Y-0.00000 R5.00000')
+        self.assertTrue(np.array_equal(new.xyz[-1], al[-1].xyz[-1]))
+
+    def test_clockwise(self):
+        # three quarters of a circle, as one arc each
+        xyz = circle(5, 48, turns=-0.75)
+        new, report = arc_fit.fit_arcs(gen_actions(xyz))
+        self.assertEqual(report.arc_count, 3)
+        self.assertEqual(new.get_gcode_lines()[-3:], ['G2 X0.00000 Y-5.00000 R5.00000',
+                                                      'G2 X-5.00000 Y-0.00000 R5.00000',
+                                                      'G2 X-0.00000 Y5.00000 R5.00000'])
+
+    def test_tolerance(self):
+        # a 16 segment circle of radius 5 is 0.096 from its chords
+        al = gen_actions(circle(5, 16))
+        self.assertEqual(arc_fit.fit_arcs(al)[1].arc_count, 0)
+        self.assertEqual(arc_fit.fit_arcs(al, tolerance=0.1)[1].arc_count, 4)
+
+    def test_not_arcs(self):
+        square = ((0, 0, -1), (10, 0, -1), (10, 10, -1), (0, 10, -1), (0, 0, -1))
+        line = ((0, 0, -1), (1, 0, -1), (2, 0, -1), (3, 0, -1), (4, 0, -1))
+        helix = circle(5, 64) + np.linspace(0, -1, 65)[:, np.newaxis] * (0, 0, 1)
+        for xyz in (square, line, helix):
+            al = gen_actions(np.array(xyz, dtype=np.float64))
+            new, report = arc_fit.fit_arcs(al)
+            self.assertEqual(report.arc_count, 0)
+            self.assertEqual(new.get_gcode_lines(), action.ArrayActionList(al).get_gcode_lines())
+
+    def test_cylinder(self):
+        state = CncState(tool=Carbide3D_101(), z_safe=40, milling_feed_rate=600)
+        tool_pass = project.ToolPass(name='file', state=state)
+        tool_pass += cut.Cylinder(depth=1, diameter=6).translate(20, 20)
+        al = tool_pass.get_actions(action.ArrayActionList)
+        new, report = arc_fit.fit_arcs(al)
+        self.assertGreater(report.arc_count, 0)
+        self.assertLess(len(new), len(al))
+        self.assertTrue(np.array_equal(new.get_points().arr[-1], al.get_points().arr[-1]))
+        arc_rows = np.flatnonzero(new.opcodes == action.OP_ARC)
+        radii = np.abs(new.arc_radii[arc_rows])
+        self.assertTrue(np.all(np.abs(np.hypot(*(new.xyz[arc_rows, :2] - 20).T) - radii) < 1e-9))
+        # the arcs take about as long and cut the same stock as the segments they replace
+        before, after = estimate.estimate_actions(al), estimate.estimate_actions(new)
+        self.assertLess(abs(after - before), 0.05 * before)
+        seconds = estimate.row_seconds(new)
+        self.assertTrue(np.all(seconds[arc_rows] > 0))
+        tool = Carbide3D_101()
+        stock = simulate.Heightmap.around(al.xyz, 5, 0.05)
+        old_report = simulate.simulate(al, tool, stock=stock.copy(), target=-1)
+        new_report = simulate.simulate(new, tool, stock=stock.copy(), target=-1)
+        self.assertAlmostEqual(new_report.removed_volume, old_report.removed_volume,
+                               delta=0.01 * old_report.removed_volume)
+        self.assertEqual(new_report.gouge_area, 0)
+        self.assertAlmostEqual(new_report.air_cut_seconds, old_report.air_cut_seconds,
+                               delta=0.05 * old_report.air_cut_seconds)
+
+    def test_air_cuts_first(self):
+        new = arc_fit.fit_arcs(gen_actions(circle(5, 64)))[0]
+        with self.assertRaises(ValueError):
+            air_cut.eliminate_air_cuts(new, Carbide3D_101())
+
+
+class TestIterFitArcs(unittest.TestCase):
+    def gcode_lines(self, chunks):
+        return [line for chunk in chunks for line in chunk.get_gcode_lines()]
+
+    def test_chunks(self):
+        al = action.ArrayActionList()
+        al += gen_actions(circle(5, 64))
+        al += gen_actions(circle(3, 32, z=-2))
+        expect = arc_fit.fit_arcs(al)[0].get_gcode_lines()
+        # cuts at the end of a chunk are carried over, circles are fitted whole
+        for chunk_size in (70, 80, len(al), 1000):
+            actual = self.gcode_lines(arc_fit.iter_fit_arcs(iter(al), chunk_size))
+            self.assertEqual(actual, expect)
+        # a run of cuts longer than a chunk is split, but still ends in the same place
+        chunks = list(arc_fit.iter_fit_arcs(iter(al), 10))
+        self.assertGreater(sum(map(len, chunks)), len(arc_fit.fit_arcs(al)[0]))
+        self.assertTrue(np.array_equal(chunks[-1].xyz[-1], al.xyz[-1]))
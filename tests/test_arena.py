@@ -0,0 +1,93 @@
+import unittest
+from functools import partial
+import numpy as np
+from gcode_gen import arena
+from gcode_gen import assembly
+from gcode_gen import cut
+from gcode_gen import tree
+from gcode_gen.transform import translate_mat
+from gcode_gen.tool import Carbide3D_101
+from gcode_gen.state import CncState
+
+
+def gen_state():
+    return CncState(tool=Carbide3D_101(), z_safe=40, feed_rate=150, drilling_feed_rate=20)
+
+
+def gen_plain_tree():
+    root = assembly.Assembly(name='root', state=gen_state())
+    for x in range(3):
+        for y in range(2):
+            root += cut.Drill(depth=2).translate(x * 5, y * 5)
+    group = assembly.Assembly(name='group')
+    root += group
+    group += cut.Drill(depth=1).translate(1, 2)
+    group += cut.Drill(depth=1).translate(3, 4)
+    group.translate(z=-1)
+    return root
+
+
+def gen_arena_tree():
+    root = assembly.Assembly(name='root', state=gen_state())
+    panel = arena.ArenaAssembly(name='panel')
+    root += panel
+    matrices = [translate_mat(x * 5, y * 5) for x in range(3) for y in range(2)]
+    panel.add_many(partial(cut.Drill, depth=2), matrices)
+    group_row = panel.add(partial(assembly.Assembly, name='group'), translate_mat(z=-1))
+    panel.add(partial(cut.Drill, depth=1), translate_mat(1, 2), parent=group_row)
+    panel.add(partial(cut.Drill, depth=1), translate_mat(3, 4), parent=group_row)
+    return root, panel
+
+
+class TestArenaAssembly(unittest.TestCase):
+    def test_get_gcode(self):
+        root, panel = gen_arena_tree()
+        actual = '\n'.join(map(str, root.get_gcode()))
+        expect = '\n'.join(map(str, gen_plain_tree().get_gcode()))
+        self.assertEqual(actual, expect)
+        # a second walk gives the same result
+        actual = '\n'.join(map(str, root.get_gcode()))
+        self.assertEqual(actual, expect)
+
+    def test_children(self):
+        root, panel = gen_arena_tree()
+        self.assertEqual(len(panel.children), 7)
+        self.assertIsInstance(panel.children[0], cut.Drill)
+        self.assertEqual(panel.children[-1].name, 'group')
+        self.assertEqual(len(panel.children[-1].children), 2)
+        self.assertTrue(np.allclose(panel.children[1].root_matrix, translate_mat(0, 5)))
+        self.assertIs(panel.children[1].parent, panel)
+        self.assertIs(panel.children[1].state, root.state)
+        # objects are stored as is
+        drill = cut.Drill(depth=3)
+        panel += drill
+        self.assertIs(panel.last(), drill)
+        self.assertIs(drill.state, root.state)
+        panel.children.insert(0, cut.Drill(depth=4, name='first'))
+        self.assertEqual(panel.children[0].name, 'first')
+        self.assertEqual(len(panel.children), 9)
+        del panel.children[0]
+        del panel.children[-1]
+        self.assertEqual(len(panel.children), 7)
+        self.assertEqual(panel.children[-1].name, 'group')
+        panel.children[0] = drill
+        self.assertIs(panel.children[0], drill)
+
+    def test_object_row_matrix(self):
+        panel = arena.ArenaAssembly(name='panel')
+        with self.assertRaises(ValueError):
+            panel.add(cut.Drill(depth=1), translate_mat(1))
+
+    def test_walk(self):
+        root, panel = gen_arena_tree()
+        actual = [(kind, panel.arena.parent(row)) for kind, row in panel.arena.walk()]
+        expect = [(kind, -1 if node is panel else 0 if node.parent is panel else 7)
+                  for kind, node in panel.walk()]
+        self.assertEqual(actual, expect)
+        self.assertEqual(sum(1 for kind, row in panel.arena.walk() if kind == tree.PREORDER), 10)
+
+    def test_nbytes(self):
+        panel = arena.ArenaAssembly(name='panel')
+        panel.add_many(partial(cut.Drill, depth=2), np.tile(np.identity(4), (1000, 1, 1)))
+        self.assertEqual(len(panel.arena), 1001)
+        self.assertTrue(panel.arena.nbytes < 1001 * (7 * 4 + 16 * 8) * 2)
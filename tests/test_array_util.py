@@ -0,0 +1,46 @@
+import unittest
+import numpy as np
+from gcode_gen import array_util
+
+
+class TestGrowableArray(unittest.TestCase):
+    def test_append(self):
+        ga = array_util.GrowableArray((3, ), capacity=1)
+        self.assertEqual(ga.arr.shape, (0, 3))
+        for idx in range(100):
+            ga.append((idx, idx + 1, idx + 2))
+        self.assertEqual(len(ga), 100)
+        self.assertTrue(ga.capacity >= 100)
+        actual = ga.arr
+        expect = np.arange(100)[:, None] + np.arange(3)
+        self.assertTrue(np.allclose(actual, expect), 'actual: {}\nexpect:{}'.format(actual, expect))
+
+    def test_extend(self):
+        ga = array_util.GrowableArray(dtype=np.uint8)
+        ga.append(1)
+        ga.extend(np.arange(2, 40))
+        ga.extend([])
+        actual = ga.arr
+        expect = np.arange(1, 40)
+        self.assertTrue(np.array_equal(actual, expect), 'actual: {}\nexpect:{}'.format(actual, expect))
+        self.assertEqual(ga.arr.dtype, np.uint8)
+        ga.clear()
+        self.assertEqual(len(ga), 0)
+
+    def test_insert(self):
+        ga = array_util.GrowableArray(capacity=2)
+        for value in (1, 3, 4):
+            ga.append(value)
+        ga.insert(1, 2)
+        ga.insert(0, 0)
+        ga.insert(5, 5)
+        self.assertTrue(np.array_equal(ga.arr, np.arange(6)), 'actual: {}'.format(ga.arr))
+
+    def test_from_array(self):
+        arr = np.arange(6.).reshape(2, 3)
+        ga = array_util.GrowableArray.from_array(arr)
+        self.assertEqual(len(ga), 2)
+        self.assertTrue(np.shares_memory(ga.arr, arr))
+        ga.append((6, 7, 8))
+        self.assertTrue(np.array_equal(ga.arr, np.arange(9.).reshape(3, 3)))
+        self.assertEqual(arr.shape, (2, 3))
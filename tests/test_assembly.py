@@ -1,6 +1,8 @@
 import unittest
 import numpy as np
 from gcode_gen import assembly
+from gcode_gen import cut
+from gcode_gen import tree
 from gcode_gen.tool import Carbide3D_101
 from gcode_gen.state import CncState, DEFAULT_START
 
@@ -63,3 +65,118 @@ G0 Z0.50000
                            ))
         self.assertTrue(np.allclose(actual, expect), 'actual: {}\nexpect:{}'.format(actual, expect))
 
+
+class TestRootMatrix(unittest.TestCase):
+    def test_cache(self):
+        root = assembly.Assembly(name='root')
+        a = assembly.Assembly(name='a')
+        b = assembly.Assembly(name='b')
+        root += a
+        a += b
+        root.translate(1, 2)
+        b.scale(2, 3)
+        mat = b.root_matrix
+        self.assertTrue(np.allclose(mat, b.root_transforms.get_composition()))
+        self.assertIs(b.root_matrix, mat)
+        # ancestor transform invalidates
+        a.rotate(np.pi / 2)
+        self.assertIsNot(b.root_matrix, mat)
+        self.assertTrue(np.allclose(b.root_matrix, b.root_transforms.get_composition()))
+        mat = b.root_matrix
+        # transform of a sibling branch does not
+        c = assembly.Assembly(name='c')
+        root += c
+        c.translate(5)
+        self.assertIs(b.root_matrix, mat)
+        # reparenting invalidates
+        c += b
+        self.assertTrue(np.allclose(b.root_matrix, b.root_transforms.get_composition()))
+        actual = b.apply_root_transforms(np.array(((1, 1, 0), )))
+        expect = np.array(((14, 9, 0), ))
+        self.assertTrue(np.allclose(actual, expect), 'actual: {}\nexpect:{}'.format(actual, expect))
+
+
+class CountingDrill(cut.Drill):
+    generated = 0
+
+    def update_children_preorder(self):
+        CountingDrill.generated += 1
+        super().update_children_preorder()
+
+
+class TestIncremental(unittest.TestCase):
+    def gen_test_tree(self):
+        tool = Carbide3D_101()
+        state = CncState(tool=tool, z_safe=40, feed_rate=150, drilling_feed_rate=20)
+        root = assembly.Assembly(name='root', state=state)
+        drills = []
+        for x in range(3):
+            row = assembly.Assembly(name='row{}'.format(x))
+            root += row
+            for y in range(4):
+                drill = CountingDrill(depth=2).translate(x * 5, y * 5)
+                row += drill
+                drills.append(drill)
+        return root, drills
+
+    def assert_same_as_full(self, root):
+        actual = '\n'.join(map(str, root.get_gcode(incremental=True)))
+        expect = '\n'.join(map(str, root.get_gcode()))
+        self.assertEqual(actual, expect)
+
+    def test_reuse(self):
+        root, drills = self.gen_test_tree()
+        root.get_actions(incremental=True)
+        self.assertFalse(root.is_dirty)
+        CountingDrill.generated = 0
+        first = str(root.get_actions(incremental=True))
+        self.assertEqual(CountingDrill.generated, 0)
+        # moving a drill regenerates it and the drill after it, which starts from a new position
+        drills[5].translate(1, 1)
+        self.assertTrue(drills[5].is_dirty)
+        self.assertTrue(root.children[1].is_dirty)
+        self.assertFalse(root.children[0].is_dirty)
+        self.assertFalse(drills[6].is_dirty)
+        second = str(root.get_actions(incremental=True))
+        self.assertEqual(CountingDrill.generated, 2)
+        self.assertNotEqual(first, second)
+        self.assertEqual(second, str(root.get_actions()))
+
+    def test_edits(self):
+        root, drills = self.gen_test_tree()
+        self.assert_same_as_full(root)
+        drills[2].depth = 4
+        self.assert_same_as_full(root)
+        root.children[1].rotate(0.5)
+        self.assert_same_as_full(root)
+        root.children[2] += cut.Drill(depth=1)
+        self.assert_same_as_full(root)
+        root.state['z_safe'] = 30
+        self.assert_same_as_full(root)
+        del root.children[0].children[1]
+        root.children[0].mark_dirty()
+        self.assert_same_as_full(root)
+
+    def test_full_walk_stays_clean(self):
+        root, drills = self.gen_test_tree()
+        root.get_actions(incremental=True)
+        root.get_actions()
+        self.assertFalse(root.is_dirty)
+        CountingDrill.generated = 0
+        root.get_actions(incremental=True)
+        self.assertEqual(CountingDrill.generated, 0)
+
+    def test_spans_follow_reused_nodes(self):
+        root, drills = self.gen_test_tree()
+        root.get_actions(incremental=True)
+        drills[0].translate(1, 1)
+        stream = root.generate_action_stream()
+        # only the node the walk started from keeps the stream, the drills below reused rows
+        # resolve into the new stream
+        for kind, node in root.walk():
+            if kind == tree.PREORDER and node is not root and node._action_span is not None:
+                self.assertIsNone(node._action_span.stream)
+        self.assertIs(root._action_span.stream, stream)
+        # plain assemblies make no actions of their own, the drills make them all
+        actions = [elem for drill in drills for elem in drill._action_span.actions]
+        self.assertEqual(actions, stream)
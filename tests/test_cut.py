@@ -619,6 +619,26 @@ G1 X0.00000 Y0.00000
 '''
         self.assertEqual(actual, expected)
 
+    def test_get_points_rotated(self):
+        def get_points(rotation):
+            tool = Carbide3D_101()
+            state = CncState(tool=tool, z_safe=40, feed_rate=None,
+                             depth_per_milling_pass=0.25,
+                             milling_feed_rate=40)
+            root = assembly.Assembly(name='root', state=state)
+            root += cut.Polygon(vertices=((0, 0), (3, 1), (2, 3), (1, 2), (-1, 3)),
+                                depth=1,
+                                is_filled=True,
+                                cut_style='inside-cut',
+                                ).rotate(rotation)
+            return root.get_points().arr
+        plain = get_points(0)
+        rotated = get_points(np.pi / 2)
+        # the first point is the start position, which is not transformed
+        actual = rotated[1:]
+        expect = np.stack((-plain[1:, 1], plain[1:, 0], plain[1:, 2]), axis=1)
+        self.assertTrue(np.allclose(actual, expect), 'actual: {}\nexpect:{}'.format(actual, expect))
+
 
 # class TestCutCylinder(unittest.TestCase):
 #     def test_get_gcode(self):
@@ -0,0 +1,130 @@
+import unittest
+import numpy as np
+from gcode_gen import action
+from gcode_gen import assembly
+from gcode_gen import cut
+from gcode_gen import estimate
+from gcode_gen import project
+from gcode_gen.point import Point
+from gcode_gen.tool import Carbide3D_101, Carbide3D_102
+from gcode_gen.state import CncState
+
+
+def gen_state():
+    state = CncState(tool=Carbide3D_101(), z_safe=40, milling_feed_rate=600)
+    state['position'] = Point(0, 0, 0)
+    return state
+
+
+def gen_jogs(*points):
+    state = gen_state()
+    al = action.ActionList()
+    for point in points:
+        al += action.Jog(*point, state=state)
+    return al
+
+
+class TestMinPlus(unittest.TestCase):
+    def test_scans(self):
+        rng = np.random.default_rng(0)
+        limits = rng.uniform(0, 10, 11)
+        costs = rng.uniform(0, 3, 10)
+        expect = limits.copy()
+        for index in range(9, -1, -1):
+            expect[index] = min(limits[index], expect[index + 1] + costs[index])
+        actual = estimate.min_plus_backward(limits, costs)
+        self.assertTrue(np.allclose(actual, expect), 'actual: {}\nexpect:{}'.format(actual, expect))
+        backward = expect
+        expect = backward.copy()
+        for index in range(1, 11):
+            expect[index] = min(backward[index], expect[index - 1] + costs[index - 1])
+        actual = estimate.min_plus_forward(backward, costs)
+        self.assertTrue(np.allclose(actual, expect), 'actual: {}\nexpect:{}'.format(actual, expect))
+
+
+class TestEstimateActions(unittest.TestCase):
+    def test_trapezoid(self):
+        # 5000mm/min rapid, 400mm/s^2: 8.68mm to reach 83.3mm/s at each end, cruise for the rest
+        actual = estimate.estimate_actions(gen_jogs((100, 0, 0)), start=(0, 0, 0))
+        speed = 5000 / 60
+        expect = 2 * speed / 400 + (100 - speed ** 2 / 400) / speed
+        self.assertAlmostEqual(actual, expect)
+
+    def test_triangle(self):
+        actual = estimate.estimate_actions(gen_jogs((4, 0, 0)), start=(0, 0, 0))
+        # 2mm to accelerate, 2mm to stop
+        self.assertAlmostEqual(actual, 2 * np.sqrt(2 * 2 / 400))
+
+    def test_straight_junction(self):
+        actual = estimate.estimate_actions(gen_jogs((50, 0, 0), (100, 0, 0)), start=(0, 0, 0))
+        expect = estimate.estimate_actions(gen_jogs((100, 0, 0)), start=(0, 0, 0))
+        self.assertAlmostEqual(actual, expect)
+
+    def test_corner(self):
+        straight = estimate.estimate_actions(gen_jogs((50, 0, 0), (100, 0, 0)), start=(0, 0, 0))
+        corner = estimate.estimate_actions(gen_jogs((50, 0, 0), (50, 50, 0)), start=(0, 0, 0))
+        reverse = estimate.estimate_actions(gen_jogs((50, 0, 0), (0, 0, 0)), start=(0, 0, 0))
+        stopped = 2 * estimate.estimate_actions(gen_jogs((50, 0, 0)), start=(0, 0, 0))
+        self.assertLess(straight, corner)
+        self.assertLess(corner, reverse)
+        self.assertAlmostEqual(reverse, stopped)
+
+    def test_feed_rate(self):
+        state = gen_state()
+        al = action.ActionList()
+        al += action.SetFeedRate(60, state=state)
+        al += action.Cut(100, 0, 0, state=state)
+        # 1mm/s, acceleration takes 1.25um each way
+        self.assertAlmostEqual(estimate.estimate_actions(al, start=(0, 0, 0)), 100, places=2)
+
+    def test_z_limits(self):
+        actual = estimate.estimate_actions(gen_jogs((0, 0, 100)), start=(0, 0, 0))
+        limits = estimate.MachineLimits(max_rates=(5000, 5000, 5000), accelerations=(400, 400, 400))
+        fast = estimate.estimate_actions(gen_jogs((0, 0, 100)), limits=limits, start=(0, 0, 0))
+        self.assertGreater(actual, fast)
+
+    def test_array_rows(self):
+        al = action.ArrayActionList(gen_jogs((50, 0, 0), (50, 50, 0)))
+        seconds = estimate.row_seconds(al, start=(0, 0, 0))
+        self.assertEqual(len(seconds), 2)
+        self.assertAlmostEqual(float(np.sum(seconds)), estimate.estimate_actions(al, start=(0, 0, 0)))
+
+
+class TestEstimate(unittest.TestCase):
+    def test_nodes(self):
+        root = assembly.Assembly(name='root', state=gen_state())
+        root += cut.Drill(depth=2, name='drill0').translate(10, 10)
+        root += cut.Mill(((0, 0), (40, 0), (40, 40)), name='mill').translate(20, 0)
+        result = estimate.estimate(root)
+        self.assertEqual([child.name for child in result.children], ['drill0', 'mill'])
+        self.assertAlmostEqual(result.seconds, sum(child.seconds for child in result.children))
+        self.assertAlmostEqual(result.seconds, estimate.estimate_actions(root.get_actions(), start=(0, 0, 0)))
+        self.assertTrue(all(child.seconds > 0 for child in result.children))
+        self.assertIn('mill: ', str(result))
+
+    def test_tool_passes(self):
+        prj = project.Project(name='prj')
+        prj.state['z_safe'] = 40
+        prj += Carbide3D_101()
+        prj += Carbide3D_102()
+        prj.children[0] += cut.Drill(depth=2).translate(10, 10)
+        prj.children[1] += cut.Drill(depth=2).translate(10, 10)
+        prj.children[1] += cut.Drill(depth=2).translate(20, 10)
+        result = estimate.estimate(prj)
+        first, second = result.children
+        self.assertEqual(first.name, 'prj_Carbide3D_101')
+        self.assertGreater(second.seconds, first.seconds)
+        self.assertAlmostEqual(result.seconds, first.seconds + second.seconds)
+
+    def test_keeps_state(self):
+        prj = project.Project(name='prj')
+        prj.state['z_safe'] = 40
+        prj.state['milling_feed_rate'] = 50
+        prj += Carbide3D_101()
+        prj += Carbide3D_102()
+        prj.children[0] += cut.Drill(depth=2).translate(10, 10)
+        prj.children[1] += cut.Mill(((0, 0), (40, 0))).translate(20, 10)
+        expect = [tool_pass.gcode_dumps() for tool_pass in prj.children]
+        estimate.estimate(prj)
+        actual = [tool_pass.gcode_dumps() for tool_pass in prj.children]
+        self.assertEqual(actual, expect)
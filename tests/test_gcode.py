@@ -1,4 +1,5 @@
 import unittest
+import numpy as np
 from gcode_gen import gcode
 
 
@@ -64,3 +65,16 @@ class TestGcode(unittest.TestCase):
             str(gcode.G3(1, 0.70))
         self.assertEqual(str(gcode.G3(1, r=0.70)), "G3 X1.00000 R0.70000")
         self.assertEqual(str(gcode.G3(r=2, z=1, y=9)), "G3 Y9.00000 Z1.00000 R2.00000")
+
+    def test_motion_lines(self):
+        xyz = np.array(((1, 2, 3), (-0.0, 2.000004, -1.123456), (4, 5, 6), (7, 8, 9)))
+        emit = np.array(((True, True, True), (True, False, True), (False, False, False), (False, True, False)))
+        cmds = ('G0', 'G1', 'G0', 'G1')
+        actual = gcode.motion_lines(cmds, xyz, emit)
+        expect = []
+        for cmd, point, point_emit in zip(cmds, xyz, emit):
+            args = [val if is_emit else None for val, is_emit in zip(point, point_emit)]
+            expect.append(str(gcode.BaseGcode(cmd, *args)))
+        self.assertEqual(actual, expect)
+        self.assertEqual(actual[1], 'G1 X-0.00000 Z-1.12346')
+        self.assertEqual(actual[2], 'G0')
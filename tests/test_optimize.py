@@ -0,0 +1,189 @@
+import unittest
+import numpy as np
+from gcode_gen import assembly
+from gcode_gen import cut
+from gcode_gen import optimize
+from gcode_gen import project
+from gcode_gen.tool import Carbide3D_101, Carbide3D_102
+from gcode_gen.state import CncState
+
+
+def gen_state():
+    return CncState(tool=Carbide3D_101(), z_safe=40, drilling_feed_rate=20, milling_feed_rate=40)
+
+
+def drill_xy(root):
+    return [tuple(np.round(child.travel_endpoints()[0], 6)) for child in root.children
+            if isinstance(child, cut.Drill)]
+
+
+class TestGridIndex(unittest.TestCase):
+    def test_k_nearest(self):
+        rng = np.random.default_rng(0)
+        xy = rng.uniform(0, 50, (200, 2))
+        index = optimize.GridIndex(xy)
+        for x, y in ((10, 10), (-20, 70), (25.5, 0)):
+            actual = [idx for dist, idx in index.k_nearest(x, y, 5)]
+            expect = list(np.argsort(np.hypot(xy[:, 0] - x, xy[:, 1] - y))[:5])
+            self.assertEqual(actual, expect)
+
+    def test_remove(self):
+        index = optimize.GridIndex(((0, 0), (1, 0), (5, 5)))
+        self.assertEqual(index.nearest(0.1, 0), 0)
+        index.remove(0)
+        self.assertEqual(index.nearest(0.1, 0), 1)
+        index.remove(1)
+        index.remove(2)
+        self.assertIsNone(index.nearest(0.1, 0))
+
+
+class TestPlanOrder(unittest.TestCase):
+    def test_nearest_neighbor(self):
+        xy = ((0, 0), (3, 0), (1, 0), (2, 0))
+        self.assertEqual(optimize.nearest_neighbor_order(xy), [0, 2, 3, 1])
+        self.assertEqual(optimize.nearest_neighbor_order(xy, start=(4, 0)), [1, 3, 2, 0])
+
+    def test_improve(self):
+        rng = np.random.default_rng(1)
+        xy = rng.uniform(0, 100, (300, 2))
+        start = (0, 0)
+        nn_order = optimize.nearest_neighbor_order(xy, start)
+        order = optimize.plan_order(xy, start, time_budget=None)
+        self.assertEqual(sorted(order), list(range(len(xy))))
+        self.assertLess(optimize.path_length(xy, order, start), optimize.path_length(xy, nn_order, start))
+
+    def test_keeps_first(self):
+        rng = np.random.default_rng(2)
+        xy = rng.uniform(0, 100, (50, 2))
+        order = optimize.plan_order(xy, time_budget=None)
+        self.assertEqual(order[0], 0)
+        self.assertEqual(sorted(order), list(range(len(xy))))
+
+    def test_feature_order_mixed(self):
+        # one feature exiting away from its entry does not stop improving the others
+        rng = np.random.default_rng(3)
+        options = [[(tuple(xy), tuple(xy))] for xy in rng.uniform(0, 100, (300, 2))]
+        options.append([((50, 50), (60, 50))])
+        start = (0, 0)
+        nn_order, nn_choices = optimize.nearest_option_order(options, start)
+        order, choices = optimize.plan_feature_order(options, start)
+        self.assertEqual(sorted(order), list(range(len(options))))
+        self.assertLess(optimize.travel_length(options, order, choices, start),
+                        optimize.travel_length(options, nn_order, nn_choices, start))
+
+
+class TestOrderChildren(unittest.TestCase):
+    def gen_root(self):
+        root = assembly.Assembly(name='root', state=gen_state())
+        rng = np.random.default_rng(3)
+        for x, y in rng.uniform(0, 100, (40, 2)):
+            root += cut.Drill(depth=1).translate(x, y)
+        root += cut.UnsafeMill(0, 0, 40)
+        for x, y in rng.uniform(0, 100, (20, 2)):
+            root += cut.Drill(depth=1).translate(x, y)
+        return root
+
+    def test_same_drills(self):
+        root = self.gen_root()
+        before = drill_xy(root)
+        barrier = root.children[40]
+        report = optimize.order_children(root, time_budget=None)
+        after = drill_xy(root)
+        self.assertEqual(sorted(before[:40]), sorted(after[:40]))
+        self.assertEqual(sorted(before[40:]), sorted(after[40:]))
+        self.assertIs(root.children[40], barrier)
+        self.assertEqual(report.node_count, 60)
+        self.assertLess(report.rapid_after, report.rapid_before)
+        self.assertTrue(all(child.parent is root for child in root.children))
+
+    def test_regenerates(self):
+        root = self.gen_root()
+        root.get_actions(incremental=True)
+        optimize.order_children(root, time_budget=None)
+        actual = str(root.get_actions(incremental=True))
+        expect = str(root.get_actions())
+        self.assertEqual(actual, expect)
+
+    def test_no_runs(self):
+        root = assembly.Assembly(name='root', state=gen_state())
+        root += cut.UnsafeMill(0, 0, 40)
+        root += cut.Drill(depth=1)
+        report = optimize.order_children(root)
+        self.assertEqual(report.node_count, 0)
+
+    def test_tool_passes(self):
+        prj = project.Project(name='prj')
+        prj.state['z_safe'] = 40
+        prj += Carbide3D_101()
+        prj += Carbide3D_102()
+        for offset, tool_pass in enumerate(prj.children):
+            for x in (0, 30, 10, 20):
+                tool_pass += cut.Drill(depth=1).translate(x + offset, 0)
+        optimize.order_children(prj, time_budget=None, recursive=True)
+        for offset, tool_pass in enumerate(prj.children):
+            self.assertEqual(drill_xy(tool_pass), [(x + offset, 0) for x in (0, 10, 20, 30)])
+
+
+class TestFeatures(unittest.TestCase):
+    def gen_square(self, x, y, is_filled=False):
+        return cut.Polygon(vertices=((0, 0), (10, 0), (10, 10), (0, 10)), depth=1,
+                           cut_style='follow-cut', is_filled=is_filled).translate(x, y)
+
+    def test_start_vertex(self):
+        root = assembly.Assembly(name='root', state=gen_state())
+        square = self.gen_square(0, 0)
+        root += square
+        square.start_vertex = 2
+        points = root.get_points().arr
+        cuts = points[points[:, 2] < 0]
+        self.assertTrue(np.allclose(cuts[0, :2], (10, 10)))
+        self.assertTrue(np.allclose(cuts[-1, :2], (10, 10)))
+        entry, exit = square.travel_endpoints()
+        self.assertTrue(np.allclose(entry, (10, 10)))
+
+    def test_filled_options(self):
+        root = assembly.Assembly(name='root', state=gen_state())
+        square = self.gen_square(0, 0, is_filled=True)
+        root += square
+        options = square.travel_options()
+        self.assertEqual(len(options), 4)
+        self.assertTrue(all(np.allclose(entry, options[0][0]) for entry, exit in options))
+        root.get_points()
+        actual = root.state['position'].xyz[:2]
+        self.assertTrue(np.allclose(actual, options[0][1]), actual)
+
+    def test_cached_fill(self):
+        root = assembly.Assembly(name='root', state=gen_state())
+        square = self.gen_square(0, 0, is_filled=True)
+        root += square
+        entry = square.travel_options()[0][0]
+        fill = square.get_fill(square.get_cut_poly())
+        self.assertIs(square.get_fill(square.get_cut_poly()), fill)
+        square.translate(5, 0)
+        self.assertTrue(np.allclose(square.travel_options()[0][0], entry + (5, 0)))
+        self.assertIs(square.get_fill(square.get_cut_poly()), fill)
+        # a smaller overlap fills with a wider spacing
+        root.state['milling_overlap'] = root.state['milling_overlap'] / 2
+        self.assertIsNot(square.get_fill(square.get_cut_poly()), fill)
+
+    def test_entry_points(self):
+        root = assembly.Assembly(name='root', state=gen_state())
+        squares = [self.gen_square(x, 0) for x in (0, 100, 20, 40)]
+        for square in squares:
+            root += square
+        root += cut.Mill(((0, 0), (5, 0))).translate(60, 30)
+        features = list(root.children)
+        root.get_actions(incremental=True)
+        report = optimize.order_children(root, time_budget=None)
+        self.assertIs(root.children[0], squares[0])
+        self.assertEqual(set(root.children), set(features))
+        self.assertLess(report.rapid_after, report.rapid_before)
+        self.assertGreater(report.time_saved, 0)
+        # the report matches the entry points chosen for the children
+        endpoints = [child.travel_endpoints() for child in root.children]
+        actual = sum(np.hypot(*(entry - exit)) for (_, exit), (entry, _) in zip(endpoints, endpoints[1:]))
+        self.assertAlmostEqual(actual, report.rapid_after)
+        self.assertNotEqual([square.start_vertex for square in squares], [0] * 4)
+        actual = str(root.get_actions(incremental=True))
+        expect = str(root.get_actions())
+        self.assertEqual(actual, expect)
@@ -61,6 +61,78 @@ class TestPoint(unittest.TestCase):
         expect = {'x': 2.1, 'y': 2.1, 'z': 0}
         self.assertEqual(actual, expect)
 
+    def test_eq(self):
+        p0 = point.Point(1, 2, 3)
+        self.assertTrue(p0 == point.Point(1, 2, 3 + 1e-9))
+        self.assertFalse(p0 == point.Point(1, 2, 3.001))
+        self.assertFalse(p0 == point.Point(1, 2, np.nan))
+        self.assertTrue(point.Point(np.inf) == point.Point(np.inf))
+
+    def test_compact(self):
+        p0 = point.Point(np.float64(1), 2, None)
+        self.assertEqual(p0.coords[:2], (1.0, 2.0))
+        self.assertTrue(np.isnan(p0.z))
+        with self.assertRaises(AttributeError):
+            p0.color = 'red'
+
+    def test_xyz_array(self):
+        # xyz is an array, arithmetic on it is element-wise
+        p0, p1 = point.Point(1, 2, 3), point.Point(4, 5, 6)
+        self.assertIsInstance(p0.xyz, np.ndarray)
+        self.assertEqual(p0.xyz.dtype, np.float64)
+        self.assertEqual((p0.xyz + p1.xyz).tolist(), [5, 7, 9])
+        self.assertEqual((p0.xyz * 2).tolist(), [2, 4, 6])
+        self.assertIs(p0.arr, p0.xyz)
+        with self.assertRaises(ValueError):
+            p0.xyz[0] = 5
+        self.assertEqual(p0.coords, (1.0, 2.0, 3.0))
+
+
+class TestBlockChanges(unittest.TestCase):
+    def test_matches_changes(self):
+        rng = np.random.default_rng(3)
+        xyz = np.round(rng.uniform(-2, 2, (200, 3)), 1)
+        xyz[50:60] = xyz[49]
+        xyz[70, 1] += 1e-6
+        start = point.Point(0, 0, 70)
+        emit, redundant = point.block_changes(start.xyz, xyz)
+        prev = start
+        for index, row in enumerate(xyz):
+            changes = point.changes(prev, point.Point(*row))
+            self.assertEqual([key in changes for key in 'xyz'], emit[index].tolist())
+            self.assertEqual(not changes, redundant[index])
+            prev = point.Point(*row)
+        self.assertTrue(redundant[50:60].all())
+
+    def test_empty(self):
+        emit, redundant = point.block_changes((0, 0, 0), np.zeros((0, 3)))
+        self.assertEqual(emit.shape, (0, 3))
+        self.assertEqual(redundant.shape, (0, ))
+
+
+class TestArcPoints(unittest.TestCase):
+    def test_quarter_circles(self):
+        # counterclockwise and clockwise quarters of the circle of radius 5 about the origin
+        starts = np.array(((5.0, 0, 0), (5.0, 0, 0)))
+        ends = np.array(((0.0, 5, -1), (0.0, -5, 0)))
+        points, counts = point.arc_points(starts, ends, np.array((5.0, -5)), 0.01)
+        self.assertEqual(len(points), counts.sum())
+        self.assertEqual(counts[0], counts[1])
+        first, second = points[:counts[0]], points[counts[0]:]
+        self.assertTrue(np.allclose(np.hypot(points[:, 0], points[:, 1]), 5))
+        self.assertTrue(np.all(first[:, 1] > 0))
+        self.assertTrue(np.all(second[:, 1] < 0))
+        self.assertTrue(np.array_equal(first[-1], ends[0]))
+        self.assertTrue(np.allclose(np.diff(first[:, 2]), -1 / counts[0]))
+        # every chord within tolerance of the arc
+        chords = np.hypot(*np.diff(first[:, :2], axis=0).T)
+        self.assertTrue(np.all(5 - np.sqrt(25 - (chords / 2) ** 2) <= 0.01))
+
+    def test_empty(self):
+        points, counts = point.arc_points(np.zeros((0, 3)), np.zeros((0, 3)), np.zeros(0), 0.01)
+        self.assertEqual(points.shape, (0, 3))
+        self.assertEqual(len(counts), 0)
+
 
 class TestPointList(unittest.TestCase):
 
@@ -187,6 +259,30 @@ class TestPointList(unittest.TestCase):
         expect = np.asarray(((1, 2, 0), (4, 5, 6)))
         self.assertTrue(np.allclose(actual, expect), 'actual: {}\nexpect:{}'.format(actual, expect))
 
+    def test_extend_array(self):
+        pl = point.PointList([[1, 2, 3]])
+        pl.extend(np.arange(12).reshape(4, 3))
+        pl.extend([point.Point(7), (8, 9)])
+        pl.extend([])
+        actual = pl.arr
+        expect = np.concatenate(([[1, 2, 3]], np.arange(12).reshape(4, 3), [[7, 0, 0], [8, 9, 0]]))
+        self.assertTrue(np.allclose(actual, expect), 'actual: {}\nexpect:{}'.format(actual, expect))
+        pl.extend(pl)
+        self.assertEqual(len(pl), 14)
+        self.assertTrue(np.allclose(pl.arr[7:], expect))
+
+    def test_insert(self):
+        pl = point.PointList()
+        for idx in range(1000):
+            pl.append(point.Point(idx))
+        pl.insert(0, point.Point(-1))
+        pl.insert(-1, point.Point(-2))
+        pl.insert(5000, point.Point(-3))
+        self.assertEqual(len(pl), 1003)
+        actual = pl.arr[:, 0]
+        expect = np.concatenate(((-1, ), np.arange(999), (-2, 999, -3)))
+        self.assertTrue(np.allclose(actual, expect), 'actual: {}\nexpect:{}'.format(actual, expect))
+
     # def test_slice_insert_PointList(self):
     #     pl0 = point.PointList()
     #     pl1 = point.PointList()
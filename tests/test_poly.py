@@ -268,6 +268,42 @@ class TestCoplanarPolygon(unittest.TestCase):
         #
         tp = poly.CoplanarPolygon(point.PointList(square_botched))
         self.assertFalse(tp.is_simple())
+        # non-neighboring edges with overlapping bounding boxes, but no intersection
+        tp = poly.CoplanarPolygon(point.PointList(((0, 0), (10, 0), (10, 10), (9, 1), (1, 9), (0, 10))))
+        self.assertTrue(tp.is_simple())
+        # non-neighboring edges touching at a vertex
+        tp = poly.CoplanarPolygon(point.PointList(((0, 0), (10, 0), (5, 5), (10, 10), (0, 10), (5, 5))))
+        self.assertFalse(tp.is_simple())
+        # simple polygon in the x/z plane
+        tp = poly.CoplanarPolygon(point.PointList(np.array(square_notched)[:, (0, 1, 1)] * (1, 0, 1)))
+        self.assertTrue(tp.is_simple())
+
+    def test_is_simple_many_vertices(self):
+        phis = np.linspace(0, 2 * np.pi, 20000, endpoint=False)
+        radii = 50 + 5 * np.sin(phis * 100)
+        verts = np.stack((radii * np.cos(phis), radii * np.sin(phis), np.zeros_like(phis)), axis=1)
+        self.assertTrue(poly.CoplanarPolygon(verts).is_simple())
+        verts[[100, 10100]] = verts[[10100, 100]]
+        self.assertFalse(poly.CoplanarPolygon(verts).is_simple())
+
+    def test_is_simple_comb(self):
+        # a saw with long teeth off a spine at x=0: every tooth edge crosses the scan line at once
+        teeth = 5000
+        saw = np.zeros((2 * teeth, 3))
+        saw[:, 1] = np.arange(2 * teeth)
+        saw[0::2, 0] = 100
+        saw[1::2, 0] = 1
+        verts = np.concatenate((((0, 2 * teeth, 0), (0, -1, 0)), saw))
+        self.assertTrue(poly.CoplanarPolygon(verts).is_simple())
+        verts[2000, 0] = -1
+        self.assertFalse(poly.CoplanarPolygon(verts).is_simple())
+
+    def test_is_edge_intersect(self):
+        self.assertTrue(poly.is_edge_intersect(((0, 0), (2, 2)), ((0, 2), (2, 0))))
+        self.assertFalse(poly.is_edge_intersect(((0, 0), (2, 2)), ((1, 0), (2, 0.5))))
+        self.assertTrue(poly.is_edge_intersect(((0, 0), (2, 2)), ((1, 1), (2, 0))))
+        self.assertTrue(poly.is_edge_intersect(((0, 0), (2, 0)), ((1, 0), (3, 0))))
+        self.assertFalse(poly.is_edge_intersect(((0, 0), (2, 0)), ((3, 0), (4, 0))))
 
 
 class TestSimplePolygon(unittest.TestCase):
@@ -699,3 +735,16 @@ class TestSimplePolygon(unittest.TestCase):
             actual = str(err)
         expect = "SimplePolygon vertices must form a simple polygon's mathematical definition"
         self.assertEqual(actual, expect)
+
+    def test_shrink_circle_many_vertices(self):
+        pgon = poly.SimplePolygon(poly.poly_circle_verts(2000).arr * 10)
+        actual = pgon.shrink(1, validate=False).arr
+        radii = np.hypot(actual[:, 0], actual[:, 1])
+        # each vertex moves inward along its bisector so the edges move in by exactly 1
+        expect = 10 - 1 / np.cos(np.pi / 2000)
+        self.assertTrue(np.allclose(radii, expect))
+
+    def test_skip_validate(self):
+        TST_VERTS = [[0, 0], [4, 0], [4, 4], [2, -1], [0, 4]]
+        tp = poly.SimplePolygon(point.PointList(TST_VERTS), validate=False)
+        self.assertFalse(tp.is_simple())
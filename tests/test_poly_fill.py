@@ -197,3 +197,17 @@ class TestFillCalc(unittest.TestCase):
         actual = result[1]
         expect = [False, True, True, True, True, True, True, True, False, True, False, True, True, True, False, True, False, True, True, True, False, True, False, True, True, True, False, True, False, True]
         self.assertEqual(actual, expect)
+
+    def test_calc_polygon_fill_vertices_many_rows(self):
+        pgon = poly.SimplePolygon(poly.poly_circle_verts(64).arr * 10)
+        result = fill.calc_polygon_fill_vertices(pgon, max_spacing=0.1)
+        points = result[0].arr
+        # two points per row, every row between (but excluding) the bottom and top rows
+        rows = np.unique(points[:, 1])
+        self.assertEqual(len(points), 2 * len(rows))
+        self.assertTrue(len(rows) > 190)
+        # every point lies on the polygon boundary
+        radii = np.hypot(points[:, 0], points[:, 1])
+        self.assertTrue(np.all(radii <= 10 + 1e-9))
+        self.assertTrue(np.all(radii >= 10 * np.cos(np.pi / 64) - 1e-9))
+        self.assertEqual(result[1][:4], [False, True, True, True])
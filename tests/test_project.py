@@ -7,7 +7,7 @@ from gcode_gen import project
 from gcode_gen.tool import Carbide3D_101, Carbide3D_102
 from gcode_gen.state import CncState
 from gcode_gen.assembly import Assembly
-from gcode_gen.cut import Mill
+from gcode_gen.cut import Cylinder, Drill, Mill
 
 
 class TestHeader(unittest.TestCase):
@@ -169,8 +169,106 @@ M5
 '''
         self.assertEqual(actual, expect)
 
+    def test_iter_gcode_lines(self):
+        tool = Carbide3D_101()
+        state = CncState(tool=tool, z_safe=40, feed_rate=None, milling_feed_rate=50)
+        root = project.ToolPass(name='file', state=state)
+        root += Mill(((0, 0), (17, 19))).translate(7, 11)
+        chunks = root.iter_gcode_lines(chunk_size=4)
+        self.assertEqual(next(chunks), ['$H', 'G21', 'G90', 'S 10000'])
+        # state is only restored once the stream is finished
+        self.assertNotEqual(state['feed_rate'], None)
+        rest = [line for lines in chunks for line in lines]
+        self.assertEqual(state['feed_rate'], None)
+        actual = '\n'.join(['$H', 'G21', 'G90', 'S 10000'] + rest)
+        expect = root.gcode_dumps()
+        self.assertEqual(actual, expect)
+        expect = '\n'.join(map(str, root.get_gcode()))
+        self.assertEqual(actual, expect)
+
+    def test_fit_arcs(self):
+        state = CncState(tool=Carbide3D_101(), z_safe=40, milling_feed_rate=50)
+        plain = project.ToolPass(name='file', state=state)
+        plain += Cylinder(depth=1, diameter=6).translate(20, 20)
+        fitted = project.ToolPass(name='file', state=state.copy(), fit_arcs=True)
+        fitted += Cylinder(depth=1, diameter=6).translate(20, 20)
+        plain_lines = plain.gcode_dumps().split('\n')
+        lines = fitted.gcode_dumps().split('\n')
+        self.assertFalse(any(line.startswith(('G2 ', 'G3 ')) for line in plain_lines))
+        self.assertTrue(any(line.startswith(('G2 ', 'G3 ')) for line in lines))
+        self.assertLess(len(lines), len(plain_lines))
+        self.assertEqual(lines[:6], plain_lines[:6])
+        self.assertEqual(lines[-3:], plain_lines[-3:])
+
 
 class TestProject(unittest.TestCase):
+    def test_incremental(self):
+        self.maxDiff = None
+        prj = project.Project(name='test_incremental')
+        prj.state['z_safe'] = 40
+        prj += Carbide3D_101()
+        c101pass = prj.last()
+        c101pass += Drill(depth=1).translate(3, 4)
+        c101pass += Drill(depth=1).translate(5, 6)
+        prj += Carbide3D_102()
+        c102pass = prj.last()
+        c102pass += Drill(depth=1).translate(9, 6)
+        drill = Drill(depth=1).translate(15, 6)
+        c102pass += drill
+        expect = '\n'.join(map(str, prj.get_gcode()))
+        actual = '\n'.join(map(str, prj.get_gcode(incremental=True)))
+        self.assertEqual(actual, expect)
+        drill.depth = 2
+        drill.translate(x=-4)
+        expect = '\n'.join(map(str, prj.get_gcode()))
+        actual = '\n'.join(map(str, prj.get_gcode(incremental=True)))
+        self.assertEqual(actual, expect)
+        self.assertIn('G0 Z40.00000\nG0 X11.00000\n', actual)
+        # the walks leave the tool pass states as they were
+        self.assertEqual(c101pass.state['feed_rate'], None)
+        self.assertEqual(c102pass.state['position'], prj.state['position'])
+
+    def test_write_gcode_files_fit_arcs(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            filepath = pathlib.Path(tmpdirname) / 'test_write_gcode_files_fit_arcs'
+            prj = project.Project(name=str(filepath), fit_arcs=True)
+            prj.state['z_safe'] = 40
+            prj.state['milling_feed_rate'] = 50
+            prj += Carbide3D_101()
+            tool_pass = prj.last()
+            self.assertTrue(tool_pass.fit_arcs)
+            tool_pass += Cylinder(depth=1, diameter=6).translate(20, 20)
+            with contextlib.redirect_stdout(StringIO()):
+                prj.write_gcode_files()
+            with open(tool_pass.filename, 'r') as act_file:
+                actual = act_file.read()
+            self.assertEqual(actual, tool_pass.gcode_dumps() + '\n')
+            self.assertIn('\nG3 ', actual)
+
+    def test_incremental_tool_pass_state(self):
+        prj = project.Project(name='test_incremental_tool_pass_state')
+        prj.state['z_safe'] = 40
+        prj += Carbide3D_101()
+        c101pass = prj.last()
+        c101pass += Drill(depth=1).translate(3, 4)
+        c101pass += Drill(depth=1).translate(5, 6)
+        prj.get_actions(incremental=True)
+        c101pass.state['z_safe'] = 30
+        expect = '\n'.join(map(str, prj.get_gcode()))
+        actual = '\n'.join(map(str, prj.get_gcode(incremental=True)))
+        self.assertEqual(actual, expect)
+        self.assertIn('G0 Z30.00000', actual)
+        self.assertNotIn('G0 Z40.00000', actual)
+
+    def test_fit_arcs(self):
+        prj = project.Project(name='test_fit_arcs')
+        prj += Carbide3D_101()
+        prj.fit_arcs = True
+        prj += Carbide3D_102()
+        self.assertEqual([tool_pass.fit_arcs for tool_pass in prj.children], [True, True])
+        prj.fit_arcs = False
+        self.assertEqual([tool_pass.fit_arcs for tool_pass in prj.children], [False, False])
+
     def test_write_gcode_files(self):
         self.maxDiff = None
         with tempfile.TemporaryDirectory() as tmpdirname:
@@ -231,3 +329,28 @@ M5
                 self.assertEqual(actual, expect)
             self.assertEqual(c101pass.state['tool'], c101_tool)
             self.assertEqual(c102pass.state['tool'], c102_tool)
+
+    def test_write_gcode_files_parallel(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            filepath = pathlib.Path(tmpdirname) / 'test_write_gcode_files_parallel'
+            prj = project.Project(name=str(filepath))
+            prj.state['z_safe'] = 40
+            prj.state['milling_feed_rate'] = 50
+            prj += Carbide3D_101()
+            c101pass = prj.last()
+            c101pass += Mill(((0, 0), (17, 19))).translate(7, 11)
+            prj += Carbide3D_102()
+            c102pass = prj.last()
+            c102pass += Mill(((0, 0), (-13, -15))).translate(7, 11)
+            capturedOutput = StringIO()
+            with contextlib.redirect_stdout(capturedOutput):
+                prj.write_gcode_files(parallel=True, max_workers=2)
+            actual = capturedOutput.getvalue()
+            expect = ('Writing file {0}_Carbide3D_101.gcode ...done!\n'
+                      'Writing file {0}_Carbide3D_102.gcode ...done!\n'.format(filepath))
+            self.assertEqual(actual, expect)
+            for tool_pass in prj.children:
+                with open(tool_pass.filename, 'r') as act_file:
+                    actual = act_file.read()
+                expect = tool_pass.gcode_dumps() + '\n'
+                self.assertEqual(actual, expect)
@@ -0,0 +1,104 @@
+import unittest
+import numpy as np
+from gcode_gen import action
+from gcode_gen import assembly
+from gcode_gen import cut
+from gcode_gen import repeat
+from gcode_gen.transform import rotate_mat, translate_mat
+from gcode_gen.tool import Carbide3D_101
+from gcode_gen.state import CncState
+
+
+def gen_state():
+    return CncState(tool=Carbide3D_101(), z_safe=40, feed_rate=150, milling_feed_rate=40, drilling_feed_rate=20)
+
+
+def gen_board():
+    board = assembly.Assembly(name='board')
+    board += cut.Drill(depth=2).translate(1, 1)
+    board += cut.Drill(depth=2).translate(4, 1)
+    board += cut.Polygon(vertices=((0, 0), (15, 0), (15, 15), (0, 15)),
+                         depth=1, cut_style='inside-cut', is_filled=True).translate(10, 0)
+    board += cut.Mill(((0, 0), (5, 0), (5, 5))).translate(30, 0)
+    return board
+
+
+class TestGridPlacements(unittest.TestCase):
+    def test(self):
+        actual = repeat.grid_placements(3, 2, 10, 20)[:, :3, 3]
+        expect = np.array(((0, 0, 0), (10, 0, 0), (20, 0, 0), (0, 20, 0), (10, 20, 0), (20, 20, 0)))
+        self.assertTrue(np.allclose(actual, expect), 'actual: {}\nexpect:{}'.format(actual, expect))
+
+
+class TestRepeat(unittest.TestCase):
+    def test_same_as_copies(self):
+        placements = repeat.grid_placements(3, 2, 50, 40)
+        root = assembly.Assembly(name='root', state=gen_state())
+        root += repeat.Repeat(gen_board(), placements)
+        copies = assembly.Assembly(name='copies', state=gen_state())
+        for placement in placements:
+            wrapper = assembly.Assembly()
+            copies += wrapper
+            wrapper.matrix_transform(placement)
+            wrapper += gen_board()
+        actual = '\n'.join(map(str, root.get_gcode()))
+        expect = '\n'.join(map(str, copies.get_gcode()))
+        self.assertEqual(actual, expect)
+
+    def test_rotated_placement(self):
+        placement = rotate_mat(np.pi / 2)
+        root = assembly.Assembly(name='root', state=gen_state())
+        root += repeat.Repeat(gen_board(), (translate_mat(), placement))
+        points = root.get_points().arr
+        plain = assembly.Assembly(name='plain', state=gen_state())
+        plain += gen_board()
+        plain_points = plain.get_points().arr
+        count = len(plain_points)
+        # both copies start with a safe jog from the previous position, skip it
+        actual = points[count + 2:]
+        expect = np.stack((-plain_points[2:, 1], plain_points[2:, 0], plain_points[2:, 2]), axis=1)
+        self.assertTrue(np.allclose(actual, expect), 'actual: {}\nexpect:{}'.format(actual, expect))
+
+    def test_state_replay(self):
+        # the second copy starts with the milling feed rate, so it needs the drilling feed rate again
+        root = assembly.Assembly(name='root', state=gen_state())
+        root += repeat.Repeat(gen_board(), repeat.grid_placements(2, 1, 50, 0))
+        gcode = list(map(str, root.get_gcode()))
+        self.assertEqual(gcode.count('F 20.00000'), 2)
+        self.assertEqual(gcode.count('F 40.00000'), 2)
+
+    def test_no_placements(self):
+        root = assembly.Assembly(name='root', state=gen_state())
+        root += repeat.Repeat(gen_board(), ())
+        self.assertEqual(len(root.get_actions()), 0)
+
+    def test_instance_must_jog(self):
+        root = assembly.Assembly(name='root', state=gen_state())
+        root += repeat.Repeat(cut.UnsafeMill(1, 2, -1), repeat.grid_placements(2, 1, 50, 0))
+        with self.assertRaises(ValueError):
+            root.get_actions()
+
+    def test_incremental(self):
+        root = assembly.Assembly(name='root', state=gen_state())
+        board = gen_board()
+        rep = repeat.Repeat(board, repeat.grid_placements(2, 2, 50, 40))
+        root += rep
+        root.get_actions(incremental=True)
+        self.assertFalse(rep.is_dirty)
+        board.children[0].translate(1, 1)
+        self.assertTrue(rep.is_dirty)
+        actual = str(root.get_actions(incremental=True))
+        expect = str(root.get_actions())
+        self.assertEqual(actual, expect)
+
+    def test_z_placement(self):
+        # the copies are cut 2 lower, their jogs between features still retract to z_safe
+        placements = translate_mat(0, 0, -2)[np.newaxis] @ repeat.grid_placements(2, 1, 50, 0)
+        root = assembly.Assembly(name='root', state=gen_state())
+        root += repeat.Repeat(gen_board(), placements)
+        actions = root.get_actions()
+        jog_z = {elem.point.z for elem in actions if isinstance(elem, action.Jog)}
+        cut_z = {elem.point.z for elem in actions if isinstance(elem, action.Cut)}
+        self.assertIn(40, jog_z)
+        self.assertNotIn(38, jog_z)
+        self.assertEqual(min(cut_z), -4)
@@ -0,0 +1,101 @@
+import unittest
+import numpy as np
+from gcode_gen import action
+from gcode_gen import simulate
+from gcode_gen.point import Point
+from gcode_gen.tool import Carbide3D_101
+from gcode_gen.state import CncState
+
+
+def gen_state():
+    state = CncState(tool=Carbide3D_101(), z_safe=40, milling_feed_rate=600)
+    state['position'] = Point(0, 0, 10)
+    return state
+
+
+def gen_actions(*moves):
+    '''moves are (kind, x, y, z) with kind 'cut' or 'jog' '''
+    state = gen_state()
+    al = action.ActionList()
+    al += action.SetFeedRate(600, state=state)
+    for kind, x, y, z in moves:
+        al += (action.Cut if kind == 'cut' else action.Jog)(x, y, z, state=state)
+    return al
+
+
+def brute_force(heightmap, starts, ends, radius, samples=1000):
+    '''heights after sweeping the tool along densely sampled positions'''
+    heights = heightmap.heights.copy()
+    rows, cols = heights.shape
+    cell_x = heightmap.x_min + (np.arange(cols) + 0.5) * heightmap.resolution
+    cell_y = heightmap.y_min + (np.arange(rows) + 0.5) * heightmap.resolution
+    for start, end in zip(starts, ends):
+        for t in np.linspace(0, 1, samples):
+            x, y, z = start + (end - start) * t
+            inside = np.hypot(cell_x[np.newaxis, :] - x, cell_y[:, np.newaxis] - y) <= radius
+            heights[inside] = np.minimum(heights[inside], z)
+    return heights
+
+
+class TestSweep(unittest.TestCase):
+    def test_capsule_interval(self):
+        left, right = simulate.capsule_interval(np.array([0.0]), np.array([0.0]), np.array([10.0]),
+                                                np.array([0.0]), 1, np.array([0.5]))
+        half = np.sqrt(1 - 0.25)
+        self.assertAlmostEqual(left[0], -half)
+        self.assertAlmostEqual(right[0], 10 + half)
+
+    def test_brute_force(self):
+        rng = np.random.default_rng(0)
+        points = np.concatenate((rng.uniform(0, 10, (12, 2)), rng.uniform(-2, 0, (12, 1))), axis=1)
+        points[4:8, 2] = -1  # a level run
+        points[8, :2] = points[7, :2]  # a plunge
+        starts, ends = points[:-1], points[1:]
+        heightmap = simulate.Heightmap(-2, -2, 12, 12, resolution=0.2)
+        expect = brute_force(heightmap, starts, ends, 1.5)
+        skip_start = np.zeros(len(starts), dtype=bool)
+        skip_start[1:] = ends[1:, 2] >= starts[1:, 2]
+        simulate.sweep(heightmap, starts, ends, 1.5, skip_start, chunk_size=3)
+        # sampling misses part of the lowest z on ramps
+        self.assertLess(np.max(np.abs(heightmap.heights - expect)), 0.02)
+
+
+class TestSimulate(unittest.TestCase):
+    def test_level_cut(self):
+        al = gen_actions(('jog', 0, 0, -1), ('cut', 20, 0, -1))
+        tool = Carbide3D_101()
+        report = simulate.simulate(al, tool, resolution=0.02)
+        radius = tool.cut_diameter / 2
+        expect = np.pi * radius ** 2 + 20 * 2 * radius
+        self.assertAlmostEqual(report.removed_volume / expect, 1, places=2)
+        self.assertEqual(report.air_cut_rows, [])
+        self.assertEqual(report.rapid_collision_rows, [1])
+        self.assertGreater(report.cut_seconds, 0)
+
+    def test_air_cut(self):
+        al = gen_actions(('cut', 0, 0, -1), ('cut', 20, 0, -1), ('cut', 0, 0, -1))
+        report = simulate.simulate(al, Carbide3D_101(), chunk_size=1)
+        self.assertEqual(report.air_cut_rows, [3])
+        self.assertEqual(report.rapid_collision_rows, [])
+        self.assertGreater(report.air_cut_seconds, 0)
+        self.assertLess(report.air_cut_seconds, report.cut_seconds)
+        # within one chunk the retrace is checked against the stock before the chunk
+        report = simulate.simulate(al, Carbide3D_101())
+        self.assertEqual(report.air_cut_rows, [])
+
+    def test_gouge(self):
+        al = gen_actions(('cut', 0, 0, -2), ('cut', 10, 0, -2))
+        stock = simulate.Heightmap(-5, -5, 15, 5)
+        report = simulate.simulate(al, Carbide3D_101(), stock=stock, target=-1.5)
+        self.assertAlmostEqual(report.max_gouge, 0.5)
+        self.assertGreater(report.gouge_area, 10 * Carbide3D_101().cut_diameter)
+        report = simulate.simulate(al, Carbide3D_101(), stock=stock, target=-2)
+        self.assertEqual(report.gouge_area, 0)
+
+    def test_safe_moves(self):
+        al = gen_actions(('jog', 0, 0, 1), ('jog', 20, 0, 1), ('cut', 20, 0, -1), ('jog', 20, 0, 40))
+        report = simulate.simulate(al, Carbide3D_101())
+        self.assertEqual(report.rapid_collision_rows, [])
+        self.assertEqual(report.air_cut_rows, [])
+        self.assertGreater(report.removed_volume, 0)
+        self.assertIn('rapids into stock: 0', str(report))
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # Sample Test passing with nose and pytest
 import unittest
+import pickle
 import numpy as np
 from gcode_gen.tool import Carbide3D_101
 from gcode_gen.state import State, CncState, DEFAULT_START
@@ -49,6 +50,50 @@ class TestState(unittest.TestCase):
         self.assertEqual(state['feed_rate'], 40)
         self.assertEqual(state['z_safe'], -12)
 
+    def test_nested_scopes(self):
+        state = State(z_safe=45, feed_rate=40)
+        with state.excursion():
+            state['position'] = 1
+            with state.let(feed_rate=15):
+                state['z_safe'] = 10
+                state['spindle_speed'] = 100
+                with state.excursion(nosave=('position', )):
+                    state['position'] = 2
+                    state['feed_rate'] = 1
+                self.assertEqual(state['position'], 2)
+                self.assertEqual(state['feed_rate'], 15)
+            # let only restores its own keys
+            self.assertEqual(state['feed_rate'], 40)
+            self.assertEqual(state['z_safe'], 10)
+            self.assertEqual(state['spindle_speed'], 100)
+        self.assertEqual(state, {'z_safe': 45, 'feed_rate': 40})
+
+    def test_exception(self):
+        state = State(feed_rate=40)
+        with self.assertRaises(KeyError):
+            with state.excursion():
+                state['feed_rate'] = 1
+                state.pop('missing')
+        self.assertEqual(state, {'feed_rate': 40})
+        with state.excursion():
+            state.update(z_safe=5)
+            state.clear()
+            self.assertEqual(len(state), 0)
+        self.assertEqual(state, {'feed_rate': 40})
+
+    def test_checkpoint(self):
+        state = State(z_safe=45, feed_rate=40)
+        checkpoint = state.checkpoint()
+        self.assertIs(state.checkpoint(), checkpoint)
+        state['feed_rate'] = 10
+        state['position'] = 1
+        self.assertIsNot(state.checkpoint(), checkpoint)
+        with state.excursion():
+            state.restore(checkpoint)
+            self.assertEqual(state, {'z_safe': 45, 'feed_rate': 40})
+            self.assertIs(state.checkpoint(), checkpoint)
+        self.assertEqual(state, {'z_safe': 45, 'feed_rate': 10, 'position': 1})
+
 
 class TestCncState(unittest.TestCase):
 
@@ -77,3 +122,18 @@ class TestCncState(unittest.TestCase):
         state = CncState(milling_feed_rate=40)
         self.assertEqual(state['milling_feed_rate'], 40)
         self.assertEqual(state.copy()['milling_feed_rate'], 40)
+        with state.excursion():
+            state_copy = state.copy()
+            self.assertIsInstance(state_copy, CncState)
+            state['milling_feed_rate'] = 10
+            state_copy['milling_feed_rate'] = 20
+        self.assertEqual(state['milling_feed_rate'], 40)
+        self.assertEqual(state_copy['milling_feed_rate'], 20)
+
+    def test_pickle(self):
+        state = CncState(tool=Carbide3D_101(), z_safe=40)
+        state = pickle.loads(pickle.dumps(state))
+        self.assertEqual(state['z_safe'], 40)
+        with state.excursion():
+            state['z_safe'] = 10
+        self.assertEqual(state['z_safe'], 40)
@@ -77,6 +77,24 @@ class TestTransformable(unittest.TestCase):
         expect = np.asarray([[0, 0, 0], [1, 0, 0], [1, 0, 1], [0, 0, 1], ])
         self.assertTrue(np.allclose(actual, expect), 'actual: {}\nexpect:{}'.format(actual, expect))
 
+    def test_composition_cache(self):
+        tl = transform.TransformList()
+        tl.translate(-1, -2)
+        comp = tl.get_composition()
+        self.assertIs(tl.get_composition(), comp)
+        changes = []
+        tl.on_change = lambda: changes.append(True)
+        tl.scale(5, 5)
+        self.assertEqual(len(changes), 1)
+        self.assertIsNot(tl.get_composition(), comp)
+        expect = np.dot(transform.scale_mat(5, 5), transform.translate_mat(-1, -2))
+        self.assertTrue(np.allclose(tl.get_composition(), expect))
+        tl[0:0] = [('T', transform.translate_mat(z=3))]
+        self.assertTrue(np.allclose(tl.get_composition(), np.dot(expect, transform.translate_mat(z=3))))
+        del tl[:]
+        self.assertTrue(np.allclose(tl.get_composition(), np.identity(4)))
+        self.assertEqual(len(changes), 3)
+
     def test_str(self):
         tl = transform.TransformList()
         tl.translate(-1, -2)
@@ -92,3 +110,62 @@ class TestTransformable(unittest.TestCase):
        [ 0.,  0.,  0.,  1.]]))
 '''
         self.assertEqual(actual, expect)
+
+
+def homogeneous_reference(mat, arr):
+    arr = np.concatenate((arr, np.ones((arr.shape[0], 1))), axis=1)
+    return np.dot(mat, arr.T)[:-1].T
+
+
+class TestApplyMatrix(unittest.TestCase):
+    def setUp(self):
+        self.arr = np.asarray(test_square, dtype=np.float64)
+        self.affine = np.dot(transform.translate_mat(1, 2, 3), transform.rotate_mat(0.3, 1, 1, 1))
+        self.projective = self.affine.copy()
+        self.projective[3] = (0.1, 0.2, 0, 1)
+
+    def test_affine(self):
+        for mat in (self.affine, self.projective):
+            actual = transform.apply_matrix(mat, self.arr)
+            expect = homogeneous_reference(mat, self.arr)
+            self.assertTrue(np.allclose(actual, expect), 'actual: {}\nexpect:{}'.format(actual, expect))
+        self.assertTrue(transform.is_affine(self.affine))
+        self.assertFalse(transform.is_affine(self.projective))
+
+    def test_errors(self):
+        with self.assertRaises(TypeError):
+            transform.apply_matrix(self.affine, test_square)
+        with self.assertRaises(TypeError):
+            transform.apply_matrix(self.affine, self.arr[:, :2])
+        with self.assertRaises(IndexError):
+            transform.apply_matrix(self.affine, np.zeros((0, 3)))
+
+    def test_point(self):
+        for mat in (self.affine, self.projective):
+            actual = transform.apply_matrix_point(mat, self.arr[1])
+            expect = homogeneous_reference(mat, self.arr[1:2])[0]
+            self.assertTrue(np.allclose(actual, expect), 'actual: {}\nexpect:{}'.format(actual, expect))
+
+    def test_segments(self):
+        for mat in (self.affine, self.projective):
+            mats = (transform.translate_mat(5), mat, transform.scale_mat(2, 2, 2))
+            offsets = (0, 1, 1, 4)
+            actual = transform.apply_matrix_segments(mats, self.arr, offsets)
+            expect = np.concatenate((homogeneous_reference(mats[0], self.arr[:1]),
+                                     homogeneous_reference(mats[2], self.arr[1:])))
+            self.assertTrue(np.allclose(actual, expect), 'actual: {}\nexpect:{}'.format(actual, expect))
+            mats = (mat, mats[2])
+            actual = transform.apply_matrix_segments(mats, self.arr, (0, 2, 4))
+            expect = np.concatenate((homogeneous_reference(mat, self.arr[:2]),
+                                     homogeneous_reference(mats[1], self.arr[2:])))
+            self.assertTrue(np.allclose(actual, expect), 'actual: {}\nexpect:{}'.format(actual, expect))
+        with self.assertRaises(ValueError):
+            transform.apply_matrix_segments((self.affine, ), self.arr, (0, 3))
+
+    def test_each(self):
+        mats = (self.affine, transform.translate_mat(z=-1))
+        actual = transform.apply_matrix_each(mats, (self.arr, self.arr[0]))
+        self.assertEqual(len(actual), 2)
+        self.assertTrue(np.allclose(actual[0], homogeneous_reference(self.affine, self.arr)))
+        self.assertTrue(np.allclose(actual[1], ((1, 2, -1), )))
+        self.assertEqual(transform.apply_matrix_each((), ()), [])
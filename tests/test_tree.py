@@ -81,6 +81,43 @@ class TestTree(unittest.TestCase):
                   ]
         self.assertEqual(actual, expect)
 
+    def test_walk(self):
+        root = self.gen_test_tree()
+        names = {tree.MOVE_DOWN: 'move:down', tree.MOVE_UP: 'move:up',
+                 tree.PREORDER: 'visit:preorder:', tree.POSTORDER: 'visit:postorder:'}
+        actual = []
+        for kind, node in root.walk():
+            if kind in (tree.PREORDER, tree.POSTORDER):
+                actual.append(names[kind] + node.name)
+            else:
+                actual.append(names[kind])
+        expect = list(map(str, root.depth_first_walk()))
+        self.assertEqual(actual, expect)
+
+    def test_walk_children_added_at_preorder(self):
+        root = tree.Tree(name='r')
+        actual = []
+        for kind, node in root.walk():
+            if kind == tree.PREORDER:
+                actual.append(node.name)
+                if len(node.name) < 3:
+                    node += tree.Tree(name=node.name + 'x')
+                    node += tree.Tree(name=node.name + 'y')
+        expect = ['r', 'rx', 'rxx', 'rxy', 'ry', 'ryx', 'ryy']
+        self.assertEqual(actual, expect)
+
+    def test_walk_deep(self):
+        root = tree.Tree(name='root')
+        node = root
+        for _ in range(5000):
+            child = tree.Tree(name='n')
+            node += child
+            node = child
+        steps = list(root.walk())
+        self.assertEqual(len(steps), 4 * 5001)
+        self.assertEqual(steps[-2], (tree.POSTORDER, root))
+        self.assertEqual(len(str(root).splitlines()), 5001)
+
     def test_root_walk(self):
         root = self.gen_test_tree()
         actual = list(map(str, root.root_walk()))